@@ -46,13 +46,15 @@ def _init_pending_transfer_db():
         os.chmod(config_db['pending_transfer_db_path'], 0o777)
 
 
+_denomination = None
+
+
 def get_validity_days(amount):
-    denomination = DenominationStore()
-    validity_days = denomination.get_validity_days(amount)
-    if validity_days is None:
-        return None
-    else:
-        return validity_days[0]
+    global _denomination
+    if _denomination is None:
+        # kept for the process, as its bracket lookups are served from memory
+        _denomination = DenominationStore()
+    return _denomination.get_validity_days(amount)
 
 
 def process_transfer(from_imsi, to_imsi, amount):
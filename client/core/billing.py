@@ -14,6 +14,7 @@ of patent rights can be found in the PATENTS file in the same directory.
 
 
 
+from collections import namedtuple
 import math
 import os
 
@@ -26,6 +27,113 @@ config_db = config_database.ConfigDB()
 PG_USER = os.environ.get('PG_USER', 'endaga')
 PG_PASSWORD = os.environ.get('PG_PASSWORD', 'endaga')
 
+# The prices for one service type (and prefix, for off_network_send). Any
+# value may be None if it isn't set in the ConfigDB.
+Tariff = namedtuple('Tariff', ['prefix', 'per_min', 'per_sms',
+                               'billable_unit'])
+_NO_TARIFF = Tariff(None, None, None, None)
+
+
+class TariffTable(object):
+    """Compiled view of the 'prices.' keys in the ConfigDB.
+
+    Off-network send tariffs are stored in a trie keyed by the digits of
+    their prefix, so the longest prefix matching a number is found in
+    O(len(number)) without touching the db.
+    """
+
+    # The longest prefix available is four digits, so we only look at the
+    # first five digits of a number.
+    MAX_PREFIX_LEN = 5
+
+    _fields = {
+        'cost_to_subscriber_per_min': 'per_min',
+        'cost_to_subscriber_per_sms': 'per_sms',
+        'billable_unit': 'billable_unit',
+    }
+
+    def __init__(self, items):
+        """
+        Args:
+          items: (key, value) pairs from the ConfigDB, with values already
+                 converted by ConfigDB._ducktype
+        """
+        groups = {}
+        for key, value in items:
+            parts = key.split('.')
+            if parts[0] != 'prices' or parts[-1] not in self._fields:
+                continue
+            if len(parts) == 3:
+                group = (parts[1], None)
+            elif len(parts) == 4:
+                group = (parts[1], parts[2])
+            else:
+                continue
+            groups.setdefault(group, {})[self._fields[parts[-1]]] = value
+        self._flat = {}
+        self._trie = {}
+        for (service_type, prefix), values in groups.items():
+            tariff = Tariff(prefix, values.get('per_min'),
+                            values.get('per_sms'), values.get('billable_unit'))
+            if prefix is None:
+                self._flat[service_type] = tariff
+            elif (service_type == 'off_network_send' and
+                  tariff.per_min is not None):
+                # a prefix is only matched if it has a per-minute price
+                node = self._trie
+                for digit in prefix:
+                    node = node.setdefault(digit, {})
+                node[None] = tariff
+
+    @classmethod
+    def from_config(cls, config):
+        items = config.snapshot()
+        items = list(items.items()) if items is not None else config.items()
+        return cls((k, config._ducktype(v)) for k, v in items)
+
+    def match(self, number):
+        """Return the off_network_send Tariff with the longest prefix
+        matching number, or None.
+        """
+        node, tariff = self._trie, None
+        for digit in number[0:self.MAX_PREFIX_LEN]:
+            node = node.get(digit)
+            if node is None:
+                break
+            tariff = node.get(None, tariff)
+        return tariff
+
+    def lookup(self, service_type, destination_number=''):
+        """Return the Tariff for a service type and destination.
+
+        Prefix matching is only done for off_network_send with a
+        destination number. All fields are None if nothing matches.
+        """
+        if destination_number and service_type == 'off_network_send':
+            return self.match(destination_number) or _NO_TARIFF
+        return self._flat.get(service_type, _NO_TARIFF)
+
+
+_tariff_table = None
+# the ConfigDB snapshot _tariff_table was built from
+_tariff_source = None
+
+
+def get_tariff_table():
+    """Return the TariffTable for the current prices.
+
+    The table is rebuilt when the (cached) ConfigDB has changed, or when
+    process_prices updates the prices.
+    """
+    global _tariff_table, _tariff_source
+    snapshot = config_db.snapshot()
+    if _tariff_table is None or snapshot is not _tariff_source:
+        # assignment is atomic, so readers see either the old or new table
+        _tariff_table = TariffTable.from_config(config_db)
+        _tariff_source = snapshot
+    return _tariff_table
+
+
 def round_to_billable_unit(billsec, rate_per_min, free_seconds=0, billable_unit=1):
     """
     Round the call up to the billable units
@@ -80,7 +188,7 @@ def get_prefix_from_number(number):
     operator-billing side of things, see
     endagaweb.models.Network.calculate_operator_cost.
 
-    We will probe the ConfigDB to determine what prefixes are available.
+    The available prefixes are looked up in the compiled TariffTable.
 
     Args:
       number: a destination number
@@ -88,21 +196,8 @@ def get_prefix_from_number(number):
     Returns:
       the matching prefix
     """
-    # Get all price keys in memory for querying.
-    price_keys = [d[0] for d in config_db._connector.exec_and_fetch(
-        "SELECT key FROM endaga_config WHERE key LIKE"
-        " 'prices.off_network_send.%.cost_to_subscriber_per_min';")]
-
-    # The longest prefix available is four digits, so truncate the number.
-    possible_prefix = number[0:5]
-    while possible_prefix:
-        key = ('prices.off_network_send.%s.cost_to_subscriber_per_min' %
-               possible_prefix)
-        if key in price_keys:
-            return possible_prefix
-        else:
-            # Pop off the last number and query again for a shorter prefix.
-            possible_prefix = possible_prefix[0:-1]
+    tariff = get_tariff_table().match(number)
+    return tariff.prefix if tariff else None
 
 # Other legacy service types need to be re-mapped to the new billing tier
 # structure.
@@ -141,23 +236,20 @@ def get_service_tariff(service_type, activity_type, destination_number=''):
 
     service_type = convert_legacy_service_type(service_type)
 
-    # Set the cost key suffix.
+    # Lookup the tariff, matching the prefix if a destination number is set.
+    tariff = get_tariff_table().lookup(service_type, destination_number)
     if activity_type == 'call':
-        cost_key = 'cost_to_subscriber_per_min'
+        cost_key, cost = 'cost_to_subscriber_per_min', tariff.per_min
     elif activity_type == 'sms':
-        cost_key = 'cost_to_subscriber_per_sms'
-    # Lookup the prefix if a destination number is set.
-    if destination_number and service_type == 'off_network_send':
-        prefix = get_prefix_from_number(destination_number)
-        key = 'prices.%s.%s.%s' % (service_type, prefix, cost_key)
-    else:
-        key = 'prices.%s.%s' % (service_type, cost_key)
-    # Finally lookup the actual cost.
-    try:
-        return int(config_db[key])
-    except KeyError:
+        cost_key, cost = 'cost_to_subscriber_per_sms', tariff.per_sms
+    if cost is None:
+        if destination_number and service_type == 'off_network_send':
+            key = 'prices.%s.%s.%s' % (service_type, tariff.prefix, cost_key)
+        else:
+            key = 'prices.%s.%s' % (service_type, cost_key)
         logger.error("get_service_tariff lookup failed for key: %s" % key)
         return 0
+    return int(cost)
 
 def get_service_billable_unit(service_type, destination_number):
     """ Gets the billable unit for a service type and destination. Default is 1
@@ -169,17 +261,15 @@ def get_service_billable_unit(service_type, destination_number):
 
     service_type = convert_legacy_service_type(service_type)
 
-    prefix = get_prefix_from_number(destination_number)
-    if service_type == "off_network_send":
-        key = 'prices.%s.%s.billable_unit' % (service_type, prefix)
-    else:
-        key = 'prices.%s.billable_unit' % (service_type)
-
-    try:
-        return int(config_db[key])
-    except KeyError:
+    tariff = get_tariff_table().lookup(service_type, destination_number)
+    if tariff.billable_unit is None:
+        if service_type == "off_network_send":
+            key = 'prices.%s.%s.billable_unit' % (service_type, tariff.prefix)
+        else:
+            key = 'prices.%s.billable_unit' % (service_type)
         logger.error("get_service_billable_unit lookup failed for key: %s" % key)
         return 1
+    return int(tariff.billable_unit)
 
 def get_call_cost(billsec, service_type, destination_number=''):
     """Get the cost of a call.
@@ -261,6 +351,8 @@ def process_prices(pricing_data, config_db):
     'billable_unit': 1,
     }
     """
+    global _tariff_table, _tariff_source
+    updates = []
     for price_group in pricing_data:
         # Set the config db keys.
         prefixless_keys = ('off_network_receive', 'on_network_receive',
@@ -295,9 +387,14 @@ def process_prices(pricing_data, config_db):
             if old_value is None:
                 logger.notice("adding key: %s -> %s" %
                               (key, new_value))
-                config_db[key] = new_value
+                updates.append((key, new_value))
             else:
                 if config_db._ducktype(new_value) != old_value:
                     logger.notice("changing key: %s -> %s (was %s)" %
                                   (key, new_value, old_value))
-                    config_db[key] = new_value
+                    updates.append((key, new_value))
+    # Write all changes in a single transaction.
+    config_db.set_multiple(updates)
+    # Swap in a table compiled from the new prices.
+    _tariff_table = TariffTable.from_config(config_db)
+    _tariff_source = config_db.snapshot()
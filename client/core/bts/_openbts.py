@@ -32,7 +32,8 @@ class OpenBTSBTS(BaseBTS):
         self.conf = ConfigDB()
         self.openbts = openbts.components.OpenBTS(
             socket_timeout=self.conf['bss_timeout'],
-            cli_timeout=self.conf['bss_timeout'])
+            cli_timeout=self.conf['bss_timeout'],
+            persistent_cli=True)
 
     def restart(self):
         """An openbts specific command to restart the bts."""
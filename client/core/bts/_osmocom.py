@@ -6,6 +6,8 @@
 # of patent rights can be found in the PATENTS file in the same directory.
 
 import sys
+import threading
+import time
 
 from osmocom.vty.bts import BTS
 from osmocom.vty.network import Network
@@ -22,6 +24,7 @@ class OsmocomBTS(BaseBTS):
     REGISTERED_AUTH_VALUES = [1, ] # 0 = camped, open reg. 1 = camped, auth'd
     DEFAULT_BTS_ID = 0
     DEFAULT_TRX_ID = 0
+    STATUS_TTL = 5 # seconds a status snapshot is reused for
     """Osmocom services, order does matter. The dependency chart
        looks like this:
 
@@ -45,16 +48,52 @@ class OsmocomBTS(BaseBTS):
         self.subscribers = Subscribers(host=self.conf['bts.osmocom.ip'],
             port=self.conf['bts.osmocom.bsc_vty_port'],
             hlr_loc=self.conf['bts.osmocom.hlr_loc'],
-            timeout=self.conf['bss_timeout'])
+            timeout=self.conf['bss_timeout'], pooled=True)
         self.network = Network(host=self.conf['bts.osmocom.ip'],
             port=self.conf['bts.osmocom.bsc_vty_port'],
-            timeout=self.conf['bss_timeout'])
+            timeout=self.conf['bss_timeout'], pooled=True)
         self.bts = BTS(host=self.conf['bts.osmocom.ip'],
             port=self.conf['bts.osmocom.bsc_vty_port'],
-            timeout=self.conf['bss_timeout'])
+            timeout=self.conf['bss_timeout'], pooled=True)
         self.trx = TRX(host=self.conf['bts.osmocom.ip'],
             port=self.conf['bts.osmocom.bsc_vty_port'],
-            timeout=self.conf['bss_timeout'])
+            timeout=self.conf['bss_timeout'], pooled=True)
+        self._status_lock = threading.Lock()
+        self._status = None
+        self._status_time = 0
+
+    def _get_status(self):
+        """Returns the parsed output of show bts, show trx and show network
+        for the default BTS and TRX.
+
+        All three are read in one batched exchange, and the result is reused
+        for STATUS_TTL seconds so that the getters a checkin calls together
+        cost a single round trip. Setters drop it.
+        """
+        with self._status_lock:
+            if (self._status is None or
+                    time.time() - self._status_time >= self.STATUS_TTL):
+                with self.bts as b:
+                    resps = b.pipeline(['enable',
+                        'show bts %s' % self.DEFAULT_BTS_ID,
+                        'show trx %s %s' % (self.DEFAULT_BTS_ID,
+                                            self.DEFAULT_TRX_ID),
+                        'show network',
+                        'disable'])
+                bts, trx, network = resps[1:4]
+                if "can't find" in bts or "can't find" in trx:
+                    raise ValueError('invalid bts or trx')
+                self._status = {
+                    'bts': self.bts._parse_show(bts),
+                    'trx': self.trx._parse_show(trx),
+                    'network': self.network._parse_show(network),
+                }
+                self._status_time = time.time()
+            return self._status
+
+    def _drop_status(self):
+        with self._status_lock:
+            self._status = None
 
     def set_factory_config(self):
         pass
@@ -69,13 +108,12 @@ class OsmocomBTS(BaseBTS):
 
     def get_load(self):
         try:
-            with self.bts as b:
-                load = b.get_load(self.DEFAULT_BTS_ID)
-                # If we weren't able to read any channel load
-                # the transceiver is not running
-                if sum(load.values()) == 0:
-                    raise BSSError("TRX not running")
-                return load
+            load = self.bts.load_from_show(self._get_status()['bts'])
+            # If we weren't able to read any channel load
+            # the transceiver is not running
+            if sum(load.values()) == 0:
+                raise BSSError("TRX not running")
+            return load
         except Exception:
             exc_type, exc_value, exc_trace = sys.exc_info()
             raise BSSError("%s: %s" % (exc_type, exc_value)).with_traceback(exc_trace)
@@ -85,6 +123,7 @@ class OsmocomBTS(BaseBTS):
 
     def set_mcc(self, mcc):
         """Set MCC"""
+        self._drop_status()
         try:
             with self.network as n:
                 return n.set_mcc(mcc)
@@ -94,6 +133,7 @@ class OsmocomBTS(BaseBTS):
 
     def set_mnc(self, mnc):
         """Set MNC"""
+        self._drop_status()
         try:
             with self.network as n:
                 return n.set_mnc(mnc)
@@ -103,6 +143,7 @@ class OsmocomBTS(BaseBTS):
 
     def set_short_name(self, short_name):
         """Set beacon short name"""
+        self._drop_status()
         try:
             with self.network as n:
                 return n.set_short_name(short_name)
@@ -118,6 +159,7 @@ class OsmocomBTS(BaseBTS):
     def set_timer(self, timer, value):
         """Set a particular BTS timer.
         The only timer in use currently is T3212"""
+        self._drop_status()
         try:
             if str(timer) == '3212':
                 with self.bts as b:
@@ -131,6 +173,7 @@ class OsmocomBTS(BaseBTS):
 
     def set_band(self, band):
         """Set the GSM band of default BTS"""
+        self._drop_status()
         try:
             with self.bts as b:
                 return b.set_band(self.DEFAULT_BTS_ID, band)
@@ -140,6 +183,7 @@ class OsmocomBTS(BaseBTS):
 
     def set_arfcn_c0(self, arfcn):
         """Set the ARFCN of the first carrier."""
+        self._drop_status()
         try:
             with self.trx as t:
                 return t.set_arfcn(self.DEFAULT_BTS_ID, self.DEFAULT_TRX_ID, arfcn)
@@ -149,24 +193,21 @@ class OsmocomBTS(BaseBTS):
 
     def get_mcc(self):
         try:
-            with self.network as n:
-                return n.show()['mcc']
+            return self._get_status()['network']['mcc']
         except Exception:
             exc_type, exc_value, exc_trace = sys.exc_info()
             raise BSSError("%s: %s" % (exc_type, exc_value)).with_traceback(exc_trace)
 
     def get_mnc(self):
         try:
-            with self.network as n:
-                return n.show()['mnc']
+            return self._get_status()['network']['mnc']
         except Exception:
             exc_type, exc_value, exc_trace = sys.exc_info()
             raise BSSError("%s: %s" % (exc_type, exc_value)).with_traceback(exc_trace)
 
     def get_short_name(self):
         try:
-            with self.network as n:
-                return n.show()['short_name']
+            return self._get_status()['network']['short_name']
         except Exception:
             exc_type, exc_value, exc_trace = sys.exc_info()
             raise BSSError("%s: %s" % (exc_type, exc_value)).with_traceback(exc_trace)
@@ -205,16 +246,14 @@ class OsmocomBTS(BaseBTS):
 
     def get_band(self):
         try:
-            with self.bts as b:
-                return b.show(self.DEFAULT_BTS_ID)['band']
+            return self._get_status()['bts']['band']
         except Exception:
             exc_type, exc_value, exc_trace = sys.exc_info()
             raise BSSError("%s: %s" % (exc_type, exc_value)).with_traceback(exc_trace)
 
     def get_arfcn_c0(self):
         try:
-            with self.trx as t:
-                return t.show(self.DEFAULT_BTS_ID, self.DEFAULT_TRX_ID)['arfcn']
+            return self._get_status()['trx']['arfcn']
         except Exception:
             exc_type, exc_value, exc_trace = sys.exc_info()
             raise BSSError("%s: %s" % (exc_type, exc_value)).with_traceback(exc_trace)
@@ -21,9 +21,21 @@ class ConfigDB(KVStore):
     """A simple database-backed configuration dictionary.
 
     Stores strings, ints, floats and bools, and strings.
+
+    Long-running daemons call ConfigDB.enable_cache() to cache reads for up
+    to cache_ttl seconds (see KVStore); updates made by other processes
+    invalidate the cache immediately when running on Postgres. Other
+    processes read from the db, and notify the daemons of their writes.
     """
-    def __init__(self, connector=None):
-        super(ConfigDB, self).__init__('endaga_config', connector)
+    notify_writes = True
+
+    def __init__(self, connector=None, cache_ttl=None):
+        super(ConfigDB, self).__init__('endaga_config', connector,
+                                       cache_ttl=cache_ttl)
+
+    @classmethod
+    def enable_cache(cls, ttl=60):
+        super(ConfigDB, cls).enable_cache(ttl)
 
     @staticmethod
     def _ducktype(value):
@@ -63,8 +75,9 @@ class ConfigDB(KVStore):
         """Process an endaga settings section in a checkin response.
 
         This should be a dictionary of key-value pairs. For each pair, we add
-        it to the ConfigDB.
+        it to the ConfigDB. All changes are written in one transaction.
         """
+        updates = []
         for (key, v) in list(data_dict.items()):
             if key not in self:
                 logger.notice("Adding endaga setting: %s -> %s" % (key, v))
@@ -75,7 +88,8 @@ class ConfigDB(KVStore):
                                   "%s -> %s (was %s)" % (key, v, old_v))
                 else:
                     continue
-            self[key] = v
+            updates.append((key, v))
+        self.set_multiple(updates)
 
 
 def set_defaults(force_replace=False):
@@ -125,6 +139,26 @@ def set_defaults(force_replace=False):
         'gprsd_event_generation_period': 60,
         'gprsd_cleanup_period': 60 * 60,
         'gprsd_max_data_age': 7 * 24 * 60 * 60,
+        # EventStore group commit: events are written once batch_size are
+        # pending or batch_delay_ms after the first one, whichever is first.
+        # With synchronous_commit disabled a crash can lose the last few
+        # committed events.
+        'event_store.batch_size': 1,
+        'event_store.batch_delay_ms': 100,
+        'event_store.synchronous_commit': True,
+        # Seconds endaga-lookupd caches number/IMSI/username mappings.
+        'lookupd.cache_ttl': 10,
+        # Load, noise and utilization are sampled every sampler.period
+        # seconds (0 disables sampling) and checkins send a summary of the
+        # last sampler.window samples.
+        'sampler.period': 5,
+        'sampler.window': 12,
+        # Each federer process handles up to federer.max_workers requests at
+        # once; others wait up to federer.queue_timeout seconds for a worker,
+        # then get a 503 asking them to retry after federer.retry_after secs.
+        'federer.max_workers': 8,
+        'federer.queue_timeout': 1,
+        'federer.retry_after': 5,
         # Checkin registration interval
         'registration_interval': 60,
         # Autoupgrade preferences (TZs assumed to be UTC)
@@ -162,6 +196,5 @@ def set_defaults(force_replace=False):
 
     }
     config = ConfigDB()
-    for key in defaults:
-        if (key not in config) or force_replace:
-            config[key] = defaults[key]
+    config.set_multiple([(key, defaults[key]) for key in defaults
+                         if (key not in config) or force_replace])
@@ -34,14 +34,27 @@ class ConnectorFactory(object):
     to backend db is needed.
     """
     _default_connector = None
+    _psycopg_connector = None
 
     @classmethod
     def get_default_connector(cls):
         """ Return a reference to the shared instance of the db connector. """
         if not cls._default_connector:
-            cls._default_connector = PsycopgConnector()
+            cls._default_connector = cls.get_psycopg_connector()
         return cls._default_connector
 
+    @classmethod
+    def get_psycopg_connector(cls):
+        """
+        Return the process-wide pooled Postgres connector. Stores that rely
+        on Postgres-specific SQL use this even if the default connector has
+        been replaced (e.g., by sqlite3 for testing); otherwise it is the
+        same instance as the default connector.
+        """
+        if not cls._psycopg_connector:
+            cls._psycopg_connector = PsycopgConnector()
+        return cls._psycopg_connector
+
     @classmethod
     def set_default_connector(cls, connector):
         cls._default_connector = connector
@@ -15,6 +15,9 @@ of patent rights can be found in the PATENTS file in the same directory.
 """
 
 import abc
+import os
+import threading
+import time
 from sys import exc_info
 from traceback import format_exc
 
@@ -56,6 +59,10 @@ class BaseConnector(object, metaclass=abc.ABCMeta):
     recreated without user impact if, say, the database is restarted.
     """
 
+    # appended to a SELECT to lock the selected rows until the end of the
+    # transaction, if the db supports that (sqlite3 locks the whole db)
+    lock_rows_clause = ""
+
     def __init__(self, retry_limit=5):
 
         self._connection = None
@@ -91,25 +98,67 @@ class BaseConnector(object, metaclass=abc.ABCMeta):
         """
         attempts = 0
         while self._retry_limit >= 0 and attempts <= self._retry_limit:
+            conn = None
             try:
-                if not self._connection:
-                    self.connect()
-                with self._connection as conn:
-                    return txn(conn, *args)
+                conn = self._checkout()
+                with conn:
+                    ret = txn(conn, *args)
             except ConnectorAbort:
                 # transaction was terminated explicitly - no error
+                self._checkin(conn)
                 return None
             except self.db_restart_errors as ex:
                 # those are the exception types we take as indicating that
                 # we need to reconnect to the server
-                self._connection = None
+                self._checkin(conn, broken=True)
                 attempts += 1
+                continue
             except self.db_errors as ex:
                 # these exceptions should be wrapped
+                self._checkin(conn)
                 raise DatabaseError(ex)
+            except BaseException:
+                self._checkin(conn)
+                raise
+            self._checkin(conn)
+            return ret
         raise ConnectorError("Unable to complete transaction (%d attempts)" %
                              attempts)
 
+    def _checkout(self):
+        """
+        Return the connection to run the next transaction on, connecting
+        if necessary.
+        """
+        if not self._connection:
+            self.connect()
+        return self._connection
+
+    def _checkin(self, conn, broken=False):
+        """
+        Called once a transaction on conn has terminated. If 'broken' is
+        True the connection is discarded so that the next transaction will
+        reconnect. 'conn' may be None if _checkout() itself failed.
+        """
+        if broken:
+            self._connection = None
+
+    def notify(self, cur, channel, payload=''):
+        """
+        Notify listeners on 'channel' (see listen()) once the transaction
+        that 'cur' belongs to commits. Does nothing if the db doesn't
+        support notifications.
+        """
+        pass
+
+    def listen(self, channel):
+        """
+        Return an object whose poll() method returns True if a notification
+        has been sent on 'channel' since the previous call, or None if the
+        db doesn't support notifications.
+        """
+        return None
+
     def exec_and_fetch(self, stmt, *args):
         """
         Execute a single SQL statement, fetch all rows created as a result
@@ -159,3 +208,169 @@ class BaseConnector(object, metaclass=abc.ABCMeta):
             with conn.cursor() as cur:
                 return txn(cur, *args)
         return self.execute(worker)
+
+
+class PooledConnector(BaseConnector):
+    """
+    A connector backed by a bounded pool of connections that is safe to
+    share between all threads of a process.
+
+    Each transaction checks out a connection for its duration and returns
+    it to the pool afterwards; a transaction started from inside another
+    one on the same thread joins the outer transaction, in which case a
+    ConnectorAbort only ends the inner function and nothing is rolled back
+    (as with nested transactions on a single connection). Idle connections
+    are health-checked before reuse, and the pool is reset in a forked
+    child so that connections are never shared between processes.
+
+    Concrete subclasses must implement new_connection().
+    """
+
+    def __init__(self, pool_size=4, checkout_timeout=10,
+                 health_check_interval=30, retry_limit=5):
+        """
+        Args:
+          pool_size: the maximum number of open connections
+          checkout_timeout: seconds to wait for a free connection before
+                            raising ConnectorError
+          health_check_interval: connections idle for longer than this many
+                                 seconds are pinged before being reused
+          retry_limit: see BaseConnector
+        """
+        self._pool_size = max(1, pool_size)
+        self._checkout_timeout = checkout_timeout
+        self._health_check_interval = health_check_interval
+        self._reset_pool()
+        super(PooledConnector, self).__init__(retry_limit)
+
+    def _reset_pool(self):
+        self._pid = os.getpid()
+        self._cond = threading.Condition()
+        self._local = threading.local()
+        # (connection, time of last use) pairs, most recently used last
+        self._idle = []
+        # number of connections that are idle or checked out
+        self._opened = 0
+
+    @abc.abstractmethod
+    def new_connection(self):
+        """
+        Create and return a new connection to the underlying db.
+        """
+        pass
+
+    def ping(self, conn):
+        """
+        Raise an exception if conn is no longer usable.
+        """
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1;")
+        conn.rollback()
+
+    def connect(self):
+        """
+        Open a connection and add it to the idle pool (called at start-up
+        so that configuration errors are detected early).
+        """
+        self._check_pid()
+        conn = self.new_connection()
+        with self._cond:
+            if self._opened < self._pool_size:
+                self._opened += 1
+                self._idle.append((conn, time.time()))
+                self._cond.notify()
+                return
+        conn.close()
+
+    def close_all(self):
+        """
+        Close all idle connections. Checked out connections are closed when
+        they are returned.
+        """
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._opened -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._close(conn)
+
+    def execute(self, txn, *args):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            # nested call: join the transaction already open on this thread
+            try:
+                return txn(conn, *args)
+            except ConnectorAbort:
+                return None
+        return super(PooledConnector, self).execute(txn, *args)
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            # Inherited connections share their sockets with the parent, so
+            # they must not be used (or closed) here. Keep references to
+            # them so that they aren't closed by the garbage collector.
+            self._inherited = [c for c, _ in self._idle]
+            self._reset_pool()
+
+    def _checkout(self):
+        self._check_pid()
+        deadline = time.time() + self._checkout_timeout
+        with self._cond:
+            while not self._idle and self._opened >= self._pool_size:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise ConnectorError(
+                        "No db connection available (pool size %d)" %
+                        self._pool_size)
+                self._cond.wait(remaining)
+            if self._idle:
+                conn, last_used = self._idle.pop()
+            else:
+                conn, last_used = None, None
+                self._opened += 1
+        try:
+            if conn is not None and not self._is_healthy(conn, last_used):
+                self._close(conn)
+                conn = None
+            if conn is None:
+                conn = self.new_connection()
+        except BaseException:
+            with self._cond:
+                self._opened -= 1
+                self._cond.notify()
+            raise
+        self._local.conn = conn
+        return conn
+
+    def _checkin(self, conn, broken=False):
+        self._local.conn = None
+        if conn is None:
+            return
+        if self._pid != os.getpid():
+            return
+        with self._cond:
+            if broken:
+                self._opened -= 1
+            else:
+                self._idle.append((conn, time.time()))
+            self._cond.notify()
+        if broken:
+            self._close(conn)
+
+    def _is_healthy(self, conn, last_used):
+        if getattr(conn, 'closed', False):
+            return False
+        if time.time() - last_used < self._health_check_interval:
+            return True
+        try:
+            self.ping(conn)
+        except Exception:
+            return False
+        return True
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
@@ -13,10 +13,55 @@ of patent rights can be found in the PATENTS file in the same directory.
 
 
 
+import os
+import threading
+import time
+
 from core.db import ConnectorFactory
 from core.db.connector import DatabaseError
 
 
+class _TableCache(object):
+    """
+    Process-wide snapshot of a KVStore table, shared by every cached KVStore
+    instance for that table. See KVStore.__init__.
+    """
+    _caches = {}
+    _caches_lock = threading.Lock()
+    _pid = None
+
+    def __init__(self, connector, channel, ttl):
+        self.ttl = ttl
+        self.items = None
+        self.loaded = 0
+        # held while loading or writing through, so that a snapshot is never
+        # replaced by an older one
+        self.lock = threading.RLock()
+        self.listener = connector.listen(channel)
+
+    @classmethod
+    def get(cls, connector, channel, ttl):
+        with cls._caches_lock:
+            if cls._pid != os.getpid():
+                # don't share listener connections with the parent process
+                cls._caches = {}
+                cls._pid = os.getpid()
+            key = (id(connector), channel)
+            if key not in cls._caches:
+                cls._caches[key] = cls(connector, channel, ttl)
+            return cls._caches[key]
+
+    def is_stale(self):
+        # always drain the listener, even if we're about to reload
+        notified = self.listener.poll() if self.listener else False
+        return (notified or self.items is None or
+                time.time() - self.loaded >= self.ttl)
+
+    def replace(self, items):
+        self.items = items
+        self.loaded = time.time()
+
+
 class KVStore(dict):
     """A simple database-backed dictionary, using a reliable connection
     to that database. Implements standard dict methods as a base class
@@ -24,9 +69,28 @@ class KVStore(dict):
     leverage to build more complex operations without having to write
     raw SQL statements.
     """
+    # cache_ttl of the instances that aren't given one; see enable_cache()
+    default_cache_ttl = None
+    # whether instances that don't cache the table still notify the
+    # processes that do of their writes
+    notify_writes = False
+
     def __init__(self, table_name,
                  connector=None,
-                 key_name='key', val_name='value', val_type='text'):
+                 key_name='key', val_name='value', val_type='text',
+                 cache_ttl=None):
+        """
+        If cache_ttl (or the class's default_cache_ttl) is not None, reads
+        are served from an in-process snapshot of the whole table, shared
+        by all cached instances for the table. The snapshot is reloaded
+        after cache_ttl seconds, or as soon as another process writes to
+        the table if the db supports notifications (Postgres LISTEN/NOTIFY)
+        and the writer notifies (see notify_writes). Writes made via
+        __setitem__, __delitem__ and set_multiple update the snapshot
+        directly. This is only suitable for small tables, and subclasses
+        that write using the cursor primitives below must do so via
+        _write().
+        """
         # Passing in a connector argument is intended to be used for testing
         # purposes only (but works more generally).
         self._connector = (connector if connector else
@@ -37,10 +101,42 @@ class KVStore(dict):
             "val": val_name,
             "val_type": val_type,
         }
+        self._cache_ttl = cache_ttl
+        # (ttl, pid) the _TableCache in _table_cache was got for
+        self._table_cache_key = None
+        self._table_cache = None
+        self._channel = None
         # table_name == None only used for testing backend connector
         if table_name:
             self._create_templates()
             self.init_table()
+            self._channel = 'kvstore_%s' % table_name
+
+    @classmethod
+    def enable_cache(cls, ttl):
+        """
+        Cache the reads of every instance of this class in this process,
+        including existing ones, that wasn't given a cache_ttl. Meant for
+        long-running daemons: a cache loads the whole table and keeps a
+        connection open to listen for changes, which short-lived processes
+        reading a few keys are better off without.
+        """
+        cls.default_cache_ttl = ttl
+
+    @property
+    def _cache(self):
+        """The process-wide _TableCache for the table, or None if reads
+        aren't cached."""
+        ttl = (self._cache_ttl if self._cache_ttl is not None
+               else self.default_cache_ttl)
+        if ttl is None or self._channel is None:
+            return None
+        key = (ttl, os.getpid())
+        if self._table_cache_key != key:
+            self._table_cache = _TableCache.get(self._connector,
+                                                self._channel, ttl)
+            self._table_cache_key = key
+        return self._table_cache
 
     def init_table(self):
         """
@@ -72,8 +168,63 @@ class KVStore(dict):
                              self._query_args)
         self._delete_item = ("DELETE FROM %(table)s WHERE %(key)s = %%s" %
                              self._query_args)
+        # the VALUES list is filled in by _upsert_many
+        self._upsert_prefix = ("INSERT INTO %(table)s (%(key)s, %(val)s) "
+                               "VALUES " % self._query_args)
+        self._upsert_suffix = (" ON CONFLICT (%(key)s) DO UPDATE SET "
+                               "%(val)s = EXCLUDED.%(val)s;" %
+                               self._query_args)
+
+    def _cached_items(self):
+        """Return the cached snapshot of the table, reloading it if stale."""
+        cache = self._cache
+        with cache.lock:
+            if cache.is_stale():
+                cache.replace(dict(
+                    self._connector.exec_and_fetch(self._select_item)))
+            return cache.items
+
+    def snapshot(self):
+        """
+        Return the cached snapshot of the table as a dict, or None if this
+        instance isn't cached. The dict must not be modified; a new one is
+        created whenever the table changes, so callers can keep data derived
+        from it until the identity of the snapshot changes.
+        """
+        if self._cache is None:
+            return None
+        return self._cached_items()
+
+    def _write(self, writer, *args):
+        """
+        Run writer(cur, *args) in a transaction, keeping the cache (if any)
+        up to date and notifying other processes of the change.
+        """
+        cache = self._cache
+        if cache is None and not self.notify_writes:
+            return self._connector.with_cursor(writer, *args)
+        if cache is None:
+            def notify_worker(cur):
+                result = writer(cur, *args)
+                self._connector.notify(cur, self._channel, str(os.getpid()))
+                return result
+            return self._connector.with_cursor(notify_worker)
+
+        def worker(cur):
+            writer(cur, *args)
+            self._connector.notify(cur, self._channel, str(os.getpid()))
+            # read the table back in the same transaction, so the snapshot
+            # holds values exactly as the db returns them
+            cur.execute(self._select_item)
+            return dict(cur.fetchall())
+        with cache.lock:
+            items = self._connector.with_cursor(worker)
+            if items is not None:
+                cache.replace(items)
 
     def __getitem__(self, key):
+        if self._cache is not None:
+            return self._cached_items()[key]
         try:
             val = self._connector.exec_and_fetch_one(self._select_value,
                                                      (key, ))
@@ -82,25 +233,31 @@ class KVStore(dict):
             raise KeyError(key)
 
     def __setitem__(self, key, value):
-        self._connector.with_cursor(self._set, key, value)
+        self._write(self._set, key, value)
 
     def __delitem__(self, key):
 
-        self._connector.exec_stmt(self._delete_item, (key, ))
+        self._write(lambda cur: cur.execute(self._delete_item, (key, )))
 
     def __contains__(self, key):
 
+        if self._cache is not None:
+            return key in self._cached_items()
         # SELECT returns empty list if key not found
         return [] != self._connector.exec_and_get_option(self._select_value,
                                                          (key, ))
 
     def get(self, key, default=None):
         """The dictionary.get paradigm which supports a default value."""
+        if self._cache is not None:
+            return self._cached_items().get(key, default)
         val = self._connector.with_cursor(self._get_option, key)
         # _get_option returns [] if the key is missing
         return val if val != [] else default
 
     def items(self):
+        if self._cache is not None:
+            return list(self._cached_items().items())
         return self._connector.exec_and_fetch(self._select_item)
 
     # some backends (sqlite3) don't support the ANY query function
@@ -114,6 +271,9 @@ class KVStore(dict):
         if len(keys) == 1:
             v = self.get(keys[0], [])
             return [(keys[0], v)] if v != [] else []
+        if self._cache is not None:
+            cache = self._cached_items()
+            return [(k, cache[k]) for k in keys if k in cache]
 
         if self._any_supported:
             try:
@@ -124,7 +284,7 @@ class KVStore(dict):
             except DatabaseError:
                 self.__class__._any_supported = False
         cache = dict(list(self.items()))
-        return [(k, cache[k]) for k in keys]
+        return [(k, cache[k]) for k in keys if k in cache]
 
     def substring_search(self, query):
         """Returns a dictionary of keys containing the substring <query>."""
@@ -141,16 +301,22 @@ class KVStore(dict):
             pass
         return ret
 
+    def delete_multiple(self, keys):
+        """In one transaction, delete multiple keys (if present)."""
+        keys = list(keys)
+        if not keys:
+            return
+        self._write(self._delete_many, keys)
+
     def set_multiple(self, data):
         """In one transaction, set multiple values.
 
         Args:
           data: a list of (key, value) pairs
         """
-        def set_multi(cur):
-            for key, value in data:
-                self._set(cur, key, value)
-        self._connector.with_cursor(set_multi)
+        if not data:
+            return
+        self._write(self._upsert_many, data)
 
     # following methods are cursor-based primitives that can be used by db
     # subclasses as parts of a transaction (exec methods each constitute a
@@ -170,15 +336,56 @@ class KVStore(dict):
         # result is a length 1 list with value that is a length 1 list too
         return ret[0][0] if ret != [] else ret
 
+    def _get_many(self, cur, keys, lock=False):
+        """
+        Get the values of the given keys that exist in the database, as a
+        dict. If lock is True the rows are locked until the end of the
+        transaction, where the db supports that.
+        """
+        keys = list(keys)
+        suffix = self._connector.lock_rows_clause if lock else ""
+        res = {}
+        for i in range(0, len(keys), self._upsert_batch):
+            chunk = keys[i:i + self._upsert_batch]
+            cur.execute(self._select_item[:-1] +
+                        (" WHERE %(key)s IN (" % self._query_args) +
+                        ", ".join(["%s"] * len(chunk)) + ")" + suffix + ";",
+                        chunk)
+            res.update(cur.fetchall())
+        return res
+
+    def _delete_many(self, cur, keys):
+        keys = list(keys)
+        for i in range(0, len(keys), self._upsert_batch):
+            chunk = keys[i:i + self._upsert_batch]
+            cur.execute(("DELETE FROM %(table)s WHERE %(key)s IN (" %
+                         self._query_args) +
+                        ", ".join(["%s"] * len(chunk)) + ");", chunk)
+
     def _insert(self, cur, key, value):
-        self._connector.exec_stmt(self._insert_item, (key, value))
+        cur.execute(self._insert_item, (key, value))
 
     def _update(self, cur, key, value):
-        self._connector.exec_stmt(self._update_item, (value, key))
+        cur.execute(self._update_item, (value, key))
 
     def _set(self, cur, key, value):
-        # _get_option returns [] if a key doesn't exist since None
-        if self._get_option(cur, key) != []:
-            self._update(cur, key, value)
-        else:
-            self._insert(cur, key, value)
+        self._upsert_many(cur, [(key, value)])
+
+    # max rows per upsert statement, keeps the number of parameters below
+    # sqlite3's default limit of 999
+    _upsert_batch = 400
+
+    def _upsert_many(self, cur, data):
+        """
+        Insert or update a list of (key, value) pairs using multi-row
+        INSERT ... ON CONFLICT DO UPDATE statements. If a key is repeated
+        the last value wins.
+        """
+        # a single statement can't update the same row twice
+        items = list(dict(data).items())
+        for i in range(0, len(items), self._upsert_batch):
+            chunk = items[i:i + self._upsert_batch]
+            cur.execute(self._upsert_prefix +
+                        ", ".join(["(%s, %s)"] * len(chunk)) +
+                        self._upsert_suffix,
+                        [x for item in chunk for x in item])
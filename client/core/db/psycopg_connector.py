@@ -15,31 +15,83 @@ of patent rights can be found in the PATENTS file in the same directory.
 import os
 
 import psycopg2
+import psycopg2.extensions
 
-from .connector import BaseConnector
+from .connector import PooledConnector
 
 
-class PsycopgConnector(BaseConnector):
+class PsycopgConnector(PooledConnector):
+    """
+    Pooled connector for the local Postgres db. A single instance is meant
+    to be shared by all stores in a process, see ConnectorFactory.
+    """
 
     db_errors = (psycopg2.Error, psycopg2.Warning)
     db_restart_errors = (psycopg2.InterfaceError, psycopg2.OperationalError)
+    lock_rows_clause = " FOR UPDATE"
 
     # In our CI system, Postgres credentials are stored in env vars.
     def __init__(self,
                  user=os.environ.get('PG_USER', 'endaga'),
                  password=os.environ.get('PG_PASSWORD', 'endaga'),
                  database='endaga',
-                 host='localhost'):
+                 host='localhost',
+                 pool_size=int(os.environ.get('PG_POOL_SIZE', 4))):
 
         self._database = database
         self._host = host
         self._password = password
         self._user = user
-        super(PsycopgConnector, self).__init__()
+        super(PsycopgConnector, self).__init__(pool_size)
 
-    def connect(self):
+    def new_connection(self):
 
-        self._connection = psycopg2.connect(host=self._host,
-                                            database=self._database,
-                                            user=self._user,
-                                            password=self._password)
+        return psycopg2.connect(host=self._host,
+                                database=self._database,
+                                user=self._user,
+                                password=self._password)
+
+    def notify(self, cur, channel, payload=''):
+        cur.execute('NOTIFY "%s", %%s;' % channel, (payload, ))
+
+    def listen(self, channel):
+        return PsycopgListener(self, channel)
+
+
+class PsycopgListener(object):
+    """
+    Receives notifications sent by PsycopgConnector.notify() on a dedicated
+    connection. Notifications sent by this process are ignored.
+    """
+
+    def __init__(self, connector, channel):
+        self._connector = connector
+        self._channel = channel
+        self._connection = None
+
+    def _connect(self):
+        conn = self._connector.new_connection()
+        conn.set_isolation_level(
+            psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with conn.cursor() as cur:
+            cur.execute('LISTEN "%s";' % self._channel)
+        self._connection = conn
+
+    def poll(self):
+        """
+        Return True if another process has sent a notification since the
+        last call. Also returns True if notifications may have been missed,
+        i.e., on the first call and after losing the connection.
+        """
+        try:
+            if self._connection is None:
+                self._connect()
+                return True
+            self._connection.poll()
+        except psycopg2.Error:
+            self._connection = None
+            return True
+        pid = str(os.getpid())
+        notified = any(n.payload != pid for n in self._connection.notifies)
+        del self._connection.notifies[:]
+        return notified
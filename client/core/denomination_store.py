@@ -12,70 +12,63 @@ of patent rights can be found in the PATENTS file in the same directory.
 
 
 
+import bisect
 
-
-import os
-
-import psycopg2
-
-
-# In our CI system, Postgres credentials are stored in env vars.
-PG_USER = os.environ.get('PG_USER', 'endaga')
-PG_PASSWORD = os.environ.get('PG_PASSWORD', 'endaga')
+from core.db import ConnectorFactory
+from core.db.kvstore import _TableCache
 
 
 class DenominationStore(object):
     """Keeps track of all system events that need to be sent to the server."""
 
-    def __init__(self):
-        self.connection = psycopg2.connect(host='localhost', database='endaga',
-                                     user=PG_USER, password=PG_PASSWORD)
+    def __init__(self, connector=None, cache_ttl=None):
+        """
+        If cache_ttl is not None, validity lookups are served from an
+        in-process table of the brackets, shared by all cached instances,
+        which is rebuilt after cache_ttl seconds or as soon as sync()
+        changes the brackets in any process. Otherwise each lookup is a
+        query.
+        """
+        self._connector = (connector or
+                           ConnectorFactory.get_psycopg_connector())
         self.table_name = 'denomination_store'
         # Create the table if it doesn't yet exist.
-        with self.connection.cursor() as cursor:
-            command = ("CREATE TABLE IF NOT EXISTS %s("
-                       " id integer NOT NULL,"
-                       " start_amount bigint NOT NULL,"
-                       " end_amount bigint NOT NULL,"
-                       " validity_days integer NOT NULL"
-                       ");")
-            cursor.execute(command % self.table_name)
-            self.connection.commit()
+        command = ("CREATE TABLE IF NOT EXISTS %s("
+                   " id integer NOT NULL,"
+                   " start_amount bigint NOT NULL,"
+                   " end_amount bigint NOT NULL,"
+                   " validity_days integer NOT NULL"
+                   ");")
+        self._connector.exec_stmt(command % self.table_name)
+        self._channel = self.table_name
+        self._cache = None
+        if cache_ttl is not None:
+            self._cache = _TableCache.get(self._connector, self._channel,
+                                          cache_ttl)
 
     def empty(self):
         """Drops all records from the table."""
-        with self.connection.cursor() as cursor:
-            command = 'truncate %s' % self.table_name
-            cursor.execute(command)
-            self.connection.commit()
+        command = 'truncate %s' % self.table_name
+        self._connector.exec_stmt(command)
 
     def get_records(self):
         res = []
         template = ('select * from %s ')
         command = template % (self.table_name)
-        with self.connection.cursor() as cursor:
-
-            cursor.execute(command)
-            self.connection.commit()
-            r = cursor.fetchall()
-            for item in r:
-                data = {'start_amount': item[1],
-                        'end_amount': item[2], 'validity': item[3]}
-
-            return res
+        r = self._connector.exec_and_fetch(command)
+        for item in r:
+            data = {'start_amount': item[1],
+                    'end_amount': item[2], 'validity': item[3]}
+        return res
 
     def get_all_id(self):
         res =[]
-
         template = 'select * from %s '
         command = template % (self.table_name)
-        with self.connection.cursor() as cursor:
-            cursor.execute(command)
-            self.connection.commit()
-            r = cursor.fetchall()
-            for item in r:
-               res.append(item[0])
-            return res
+        r = self._connector.exec_and_fetch(command)
+        for item in r:
+           res.append(item[0])
+        return res
 
     def get_record(self, id):
         """Gets the most recent record for an Id.
@@ -83,33 +76,86 @@ class DenominationStore(object):
         Returns None if no record was found.
         """
         command = "select * from %s where id='%s'"
-        with self.connection.cursor() as cursor:
-            cursor.execute(command % (self.table_name, id))
-            self.connection.commit()
-            if not cursor.rowcount:
-                return None
-            else:
-                return cursor.fetchall()[0]
+        r = self._connector.exec_and_fetch(command % (self.table_name, id))
+        if not r:
+            return None
+        else:
+            return r[0]
 
     def delete_record(self, id):
         template = 'delete from %s where id = %s'
         command = template % (self.table_name, id)
-        with self.connection.cursor() as cursor:
-            cursor.execute(command)
-            self.connection.commit()
-
-    def get_validity_days(self,top_up):
-
-        template = "select validity_days from %s where  start_amount <=%s and end_amount >=%s order by -end_amount"
-        command = template %(self.table_name, top_up, top_up)
-        with self.connection.cursor() as cursor:
-            cursor.execute(command)
-            self.connection.commit()
-            r = cursor.fetchall()
-            if len(r):
-                return r[0]
-            else:
-                return None
+        self._connector.exec_stmt(command)
+
+    def get_validity_days(self, top_up):
+        """Returns the validity days of the bracket that top_up falls in,
+        or None if there isn't one. If several brackets hold top_up, the
+        one that ends highest wins.
+        """
+        if self._cache is None:
+            r = self._connector.exec_and_fetch(
+                "select validity_days from %s"
+                " where start_amount <= %%s and end_amount >= %%s"
+                " order by end_amount desc limit 1" % self.table_name,
+                (top_up, top_up))
+            return r[0][0] if r else None
+        with self._cache.lock:
+            if self._cache.is_stale():
+                rows = self._connector.exec_and_fetch(
+                    "select start_amount, end_amount, validity_days from %s"
+                    % self.table_name)
+                self._cache.replace(_bracket_table(rows))
+            breaks, at_break, after_break = self._cache.items
+        i = bisect.bisect_left(breaks, top_up)
+        if i < len(breaks) and breaks[i] == top_up:
+            return at_break[i]
+        if 0 < i < len(breaks):
+            return after_break[i - 1]
+        return None
+
+    def sync(self, brackets):
+        """Makes the table hold exactly the given brackets, in a single
+        transaction, and returns whether anything changed.
+
+        Args:
+          brackets: a list of dicts with the id, start_amount, end_amount
+                    and validity of each bracket
+        """
+        wanted = dict((b['id'], (int(b['start_amount']), int(b['end_amount']),
+                                 int(b['validity'])))
+                      for b in brackets)
+
+        def worker(cur):
+            cur.execute("select id, start_amount, end_amount, validity_days"
+                        " from %s%s" % (self.table_name,
+                                        self._connector.lock_rows_clause))
+            current = {}
+            for row in cur.fetchall():
+                current.setdefault(row[0], []).append(tuple(row[1:]))
+            # ids that are gone or changed (or duplicated) are replaced
+            stale = [i for i, rows in current.items()
+                     if [wanted.get(i)] != rows]
+            new = [(i, ) + v for i, v in wanted.items()
+                   if current.get(i) != [v]]
+            if stale:
+                cur.execute("delete from %s where id in (%s)" % (
+                    self.table_name, ", ".join(["%s"] * len(stale))), stale)
+            if new:
+                cur.executemany(
+                    "insert into %s (id, start_amount, end_amount,"
+                    " validity_days) values (%%s, %%s, %%s, %%s)"
+                    % self.table_name, new)
+            if stale or new:
+                self._connector.notify(cur, self._channel)
+            return bool(stale or new)
+        if self._cache is None:
+            return self._connector.with_cursor(worker)
+        with self._cache.lock:
+            changed = self._connector.with_cursor(worker)
+            if changed:
+                # rebuilt on the next lookup
+                self._cache.items = None
+        return changed
 
     def add_record(self,id, start_amount, end_amount, validity):
         schema = ('id, start_amount, end_amount, validity_days')
@@ -117,7 +163,26 @@ class DenominationStore(object):
             id, start_amount, end_amount, validity)
         command = 'insert into %s (%s) values(%s)' % (
             self.table_name, schema, values)
-        with self.connection.cursor() as cursor:
-            cursor.execute(command)
-            self.connection.commit()
-
+        self._connector.exec_stmt(command)
+
+
+def _bracket_table(rows):
+    """Builds the table get_validity_days bisects from (start_amount,
+    end_amount, validity_days) rows.
+
+    The table is the sorted list of all start and end amounts, the validity
+    at each of them, and the validity strictly between each one and the
+    next, so that a lookup is a single bisect.
+    """
+    # the highest ending bracket wins, as in a query ordered by -end_amount
+    rows = sorted(rows, key=lambda r: -r[1])
+    breaks = sorted(set([r[0] for r in rows] + [r[1] for r in rows]))
+
+    def best(low, high):
+        for start, end, validity in rows:
+            if start <= low and high <= end:
+                return validity
+        return None
+    at_break = [best(b, b) for b in breaks]
+    after_break = [best(low, high) for low, high in zip(breaks, breaks[1:])]
+    return breaks, at_break, after_break
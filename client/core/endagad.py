@@ -32,6 +32,7 @@ class EndagaD(object):
     service. Manages registration, checkin and associated responses.
     """
     def __init__(self):
+        ConfigDB.enable_cache()
         self._conf = ConfigDB()
         # initialise logging level from DB (if set - otherwise 'warning')
         # NB - this is the ONLY time changes to the log level are actually
@@ -68,6 +69,10 @@ class EndagaD(object):
         5) Runs checkin periodically.
         """
         eapi = interconnect.endaga_ic(self._conf)
+        sample_period = self._conf.get('sampler.period', 5)
+        if sample_period:
+            eapi.start_sampler(sample_period,
+                               self._conf.get('sampler.window', 12))
         if 'registration_interval' not in self._conf:
             self._conf['registration_interval'] = 60
 
@@ -118,6 +123,12 @@ class EndagaD(object):
                     logger.notice("System unhealthy: %d" % unhealthy_count)
                 else:
                     unhealthy_count = 0
+                # Drain a backlog of events (e.g. after an outage) with
+                # back-to-back checkins, for up to one interval.
+                drain_end = time.time() + self._conf['registration_interval']
+                while eapi.draining and time.time() < drain_end:
+                    logger.notice("Performing drain checkin.")
+                    eapi.checkin(timeout=30)
             except (ConnectionError, Timeout):
                 logger.error(
                     "checkin failed due to connection error or timeout.")
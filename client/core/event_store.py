@@ -15,38 +15,67 @@ of patent rights can be found in the PATENTS file in the same directory.
 
 
 import json
-import os
-
-import psycopg2
+import threading
 
 from ccm.common import logger
-
-
-# In our CI system, Postgres credentials are stored in env vars.
-PG_USER = os.environ.get('PG_USER', 'endaga')
-PG_PASSWORD = os.environ.get('PG_PASSWORD', 'endaga')
+from core.db import ConnectorFactory
 
 
 class EventStore(object):
     """Keeps track of all system events that need to be sent to the server."""
 
-    def __init__(self):
-        self.conn = psycopg2.connect(host='localhost', database='endaga',
-                                     user=PG_USER, password=PG_PASSWORD)
-        self._createdb()
+    # Set once the tables have been created by this process.
+    _schema_ready = False
+    _schema_lock = threading.Lock()
 
-    def _createdb(self):
-        """Creates the main table if it doesn't already exist."""
-        cur = self.conn.cursor()
+    def __init__(self, synchronous_commit=True, connector=None):
+        """
+        Args:
+          synchronous_commit: if False, commits made by add() and add_many()
+                              don't wait for Postgres to flush the WAL to
+                              disk. A crash may then lose the most recently
+                              added events, but never corrupts the table.
+          connector: db connector to use, defaults to the shared Postgres
+                     connection pool
+        """
+        self.synchronous_commit = synchronous_commit
+        self._connector = (connector or
+                           ConnectorFactory.get_psycopg_connector())
+        if not EventStore._schema_ready:
+            # concurrent CREATE TABLE IF NOT EXISTS can fail
+            with EventStore._schema_lock:
+                if not EventStore._schema_ready:
+                    self._connector.with_cursor(self._createdb)
+                    EventStore._schema_ready = True
+
+    @staticmethod
+    def _createdb(cur):
+        """Creates the main table if it doesn't already exist.
+
+        Also creates endaga_dirty_imsis, an index of the IMSIs that have
+        unacked events along with the seqno of their latest event. If the
+        index is new it is populated from any events already in the table.
+        """
         cur.execute("CREATE TABLE IF NOT EXISTS"
                     " endaga_events(seqno bigserial PRIMARY KEY, data json);")
-        self.conn.commit()
+        cur.execute("SELECT to_regclass('endaga_dirty_imsis');")
+        if cur.fetchone()[0] is None:
+            # Serialize with other processes creating the index.
+            cur.execute("LOCK TABLE endaga_events IN EXCLUSIVE MODE;")
+            cur.execute("CREATE TABLE IF NOT EXISTS endaga_dirty_imsis("
+                        "imsi text PRIMARY KEY, last_seqno bigint NOT NULL);")
+            cur.execute("INSERT INTO endaga_dirty_imsis (imsi, last_seqno)"
+                        " SELECT data->>'imsi', max(seqno) FROM endaga_events"
+                        " WHERE data->>'imsi' IS NOT NULL GROUP BY 1"
+                        " ON CONFLICT (imsi) DO NOTHING;")
 
     def drop_table(self):
-        """Drops the main table."""
-        cur = self.conn.cursor()
-        cur.execute("DROP TABLE IF EXISTS endaga_events;")
-        self.conn.commit()
+        """Drops the main table and the dirty IMSI index."""
+        def worker(cur):
+            cur.execute("DROP TABLE IF EXISTS endaga_events;")
+            cur.execute("DROP TABLE IF EXISTS endaga_dirty_imsis;")
+        self._connector.with_cursor(worker)
+        EventStore._schema_ready = False
 
     def set_seqno(self, seqno):
         """Sets the current event seqno to the given value.
@@ -59,15 +88,14 @@ class EventStore(object):
         this -- the only reason the seqno needs to be updated is if we're
         restoring a DB or cloning a BTS.
         """
-        cur = self.conn.cursor()
-        try:
+        def worker(cur):
             cur.execute("LOCK TABLE endaga_events IN EXCLUSIVE MODE;")
             cur.execute("SELECT setval('endaga_events_seqno_seq', %s);",
                         (seqno,))
-            self.conn.commit()
+        try:
+            self._connector.with_cursor(worker)
         except BaseException:
             logger.error("EventStore: set seqno %s failed" % seqno)
-            self.conn.rollback()
 
     def ack(self, seqno):
         """Process an ack to the db.
@@ -75,12 +103,15 @@ class EventStore(object):
         An ack up to a seqno means that all events up to and including that
         seqno have been handled and can be safely removed.
         """
-        try:
-            cur = self.conn.cursor()
+        def worker(cur):
             cur.execute("DELETE FROM endaga_events WHERE seqno<=%s;", (seqno,))
+            # IMSIs whose latest event has been acked are clean now.
+            cur.execute("DELETE FROM endaga_dirty_imsis WHERE last_seqno<=%s;",
+                        (seqno,))
             # If this fails, we don't commit.
             logger.info("EventStore: ack'd seqno %d" % int(seqno))
-            self.conn.commit()
+        try:
+            self._connector.with_cursor(worker)
         except BaseException as e:
             logger.error("EventStore: ack seqno %s exception %s" % (seqno, e))
             raise
@@ -90,17 +121,40 @@ class EventStore(object):
 
         This method will encode it.
         """
-        cur = self.conn.cursor()
-        cur.execute("INSERT INTO endaga_events (data) VALUES (%s);",
-                    (json.dumps(event_dict),))
-        self.conn.commit()
+        self.add_many([event_dict])
+
+    def add_many(self, event_dicts):
+        """Add a list of event-describing dictionaries to the database.
+
+        All events are written with a single multi-row INSERT and a single
+        commit, so the cost of the commit is shared by the whole batch.
+        Seqnos are assigned in list order. The dirty IMSI index is updated
+        in the same statement.
+        """
+        if not event_dicts:
+            return
+
+        def worker(cur):
+            if not self.synchronous_commit:
+                cur.execute("SET LOCAL synchronous_commit TO OFF;")
+            rows = b",".join(cur.mogrify("(%s)", (json.dumps(e),))
+                             for e in event_dicts)
+            cur.execute(
+                b"WITH ins AS (INSERT INTO endaga_events (data) VALUES " +
+                rows + b" RETURNING seqno, data->>'imsi' AS imsi)"
+                b" INSERT INTO endaga_dirty_imsis (imsi, last_seqno)"
+                b" SELECT imsi, max(seqno) FROM ins"
+                b" WHERE imsi IS NOT NULL GROUP BY imsi"
+                b" ON CONFLICT (imsi) DO UPDATE SET last_seqno ="
+                b" GREATEST(endaga_dirty_imsis.last_seqno,"
+                b" EXCLUDED.last_seqno);")
+        self._connector.with_cursor(worker)
 
     def get_events(self, num=100):
         """Get the selected number of events from the event store."""
-        cur = self.conn.cursor()
-        cur.execute("SELECT seqno, data FROM endaga_events"
-                    " ORDER BY seqno LIMIT %s;", (num,))
-        r = cur.fetchall()
+        r = self._connector.exec_and_fetch(
+            "SELECT seqno, data FROM endaga_events"
+            " ORDER BY seqno LIMIT %s;", (num,))
         res = []
         for item in r:
             seqno = item[0]
@@ -109,14 +163,109 @@ class EventStore(object):
             res.append(d)
         return res
 
+    def backlog(self):
+        """Returns the number of events waiting to be acked."""
+        return self._connector.exec_and_fetch(
+            "SELECT count(*) FROM endaga_events;")[0][0]
+
     def modified_subs(self):
         """
         Returns a set of IMSIs that currently have records in the EventStore.
 
-        Note: this relies on Postgres JSON support.
+        This reads the dirty IMSI index maintained by add_many() and ack(),
+        so the cost is proportional to the number of modified subscribers
+        rather than the number of pending events.
+        """
+        r = self._connector.exec_and_fetch(
+            "SELECT imsi FROM endaga_dirty_imsis;")
+        return list(sum(r, ()))
+
+
+class BufferedEventWriter(object):
+    """Group-commit front end for the EventStore.
+
+    Events are buffered in memory and written with one EventStore.add_many()
+    call once max_events are pending, or max_delay seconds after the first
+    event of a batch was buffered, whichever comes first. With max_events=1
+    (the default) each event is committed before add() returns, i.e., the
+    same durability as calling EventStore.add() directly.
+
+    If a write fails the batch stays buffered, ahead of any events added
+    later, and is retried on the next flush using a new connection.
+    """
+
+    def __init__(self, max_events=1, max_delay=0.1, synchronous_commit=True,
+                 store_factory=None):
+        """
+        Args:
+          max_events: flush as soon as this many events are buffered
+          max_delay: flush at most this many seconds after buffering an event
+          synchronous_commit: passed through to the EventStore
+          store_factory: callable returning an EventStore-like object (only
+                         intended for testing)
+        """
+        self.max_events = max(1, int(max_events))
+        self.max_delay = max_delay
+        self._store_factory = (
+            store_factory if store_factory else
+            lambda: EventStore(synchronous_commit=synchronous_commit))
+        self._store = None
+        self._pending = []
+        self._timer = None
+        # flush() runs with the lock held so that batches are written in the
+        # order their events were added.
+        self._lock = threading.RLock()
+
+    def add(self, event_dict):
+        """Buffer an event, flushing if the batch is full."""
+        self.add_many([event_dict])
+
+    def add_many(self, event_dicts):
+        """Buffer several events, flushing if the batch is full."""
+        with self._lock:
+            self._pending.extend(event_dicts)
+            if len(self._pending) >= self.max_events:
+                self.flush()
+            elif self._pending and self._timer is None:
+                self._timer = threading.Timer(self.max_delay,
+                                              self._flush_on_timer)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def pending(self):
+        """Number of buffered events that haven't been written yet."""
+        return len(self._pending)
+
+    def flush(self):
+        """Write all buffered events to the EventStore in one transaction.
+
+        Raises whatever the EventStore raised if the write fails; the events
+        remain buffered in that case.
         """
-        with self.conn:
-            with self.conn.cursor() as cur:
-                cur.execute("SELECT DISTINCT data->>'imsi' AS imsi "
-                            "FROM endaga_events;")
-                return list(sum(cur.fetchall(), ()))
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, []
+            try:
+                if self._store is None:
+                    self._store = self._store_factory()
+                self._store.add_many(batch)
+            except BaseException:
+                # the connection may be broken, reconnect on the next flush
+                self._store = None
+                self._pending[:0] = batch
+                raise
+
+    def close(self):
+        """Flush any buffered events, e.g., at process exit."""
+        self.flush()
+
+    def _flush_on_timer(self):
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error("EventStore: failed to write %d buffered events: %s"
+                         % (self.pending(), e))
@@ -11,15 +11,45 @@ LICENSE file in the root directory of this source tree. An additional grant
 of patent rights can be found in the PATENTS file in the same directory.
 """
 
+import atexit
+import threading
 import time
 
 from ccm.common import logger
-from core.event_store import EventStore
+from core.config_database import ConfigDB
+from core.event_store import BufferedEventWriter, EventStore
 from core.subscriber import subscriber
 
 
+# Process-wide group-commit writer, created on first use.
+_event_writer = None
+_event_writer_lock = threading.Lock()
+
+
+def _get_event_writer():
+    """Returns the process-wide BufferedEventWriter.
+
+    Batching is controlled by the ConfigDB keys event_store.batch_size,
+    event_store.batch_delay_ms and event_store.synchronous_commit. The
+    defaults write and commit every event before returning.
+    """
+    global _event_writer
+    with _event_writer_lock:
+        if _event_writer is None:
+            conf = ConfigDB()
+            _event_writer = BufferedEventWriter(
+                max_events=conf.get('event_store.batch_size', 1),
+                max_delay=conf.get('event_store.batch_delay_ms', 100) / 1000.0,
+                synchronous_commit=conf.get(
+                    'event_store.synchronous_commit', True))
+            atexit.register(_event_writer.close)
+        return _event_writer
+
+
 def usage(num=100):
     """Returns 'events': List of credits log entries."""
+    if _event_writer is not None:
+        _event_writer.flush()
     es = EventStore()
     events = es.get_events(num)
     return {'events': events}
@@ -179,6 +209,5 @@ def _create_event(imsi, old_credit, new_credit, reason, kind=None,
 
     # TODO(shasan): find a way to remove this and mock out in testing instead
     if write:
-        event_store = EventStore()
-        event_store.add(data)
+        _get_event_writer().add(data)
     return data
@@ -6,6 +6,10 @@ provisioning and parsing CDRs.
 Receives CDRs from Freeswitch mod_xml_cdr and updates subscriber registry
 accordingly.
 
+Requests are handled by a bounded pool of workers per process (see
+WorkerPool); when all workers are busy, requests are rejected with a 503 so
+that slow requests can't pile up without limit.
+
 Copyright (c) 2016-present, Facebook, Inc.
 All rights reserved.
 
@@ -14,10 +18,15 @@ LICENSE file in the root directory of this source tree. An additional grant
 of patent rights can be found in the PATENTS file in the same directory.
 """
 
-import web
+import threading
+import time
 import traceback
 
+import web
+
 from ccm.common import logger
+from core.config_database import ConfigDB
+from core.request_stats import RequestStats
 
 
 urls = (
@@ -57,5 +66,65 @@ web.application.handle_with_processors = handle_with_logging
 app = web.application(urls, locals())
 
 
+def route_name(path):
+    """Gets the name of the route for a request path, e.g. 'config'."""
+    return path.strip('/').split('/', 1)[0] or 'index'
+
+
+class WorkerPool(object):
+    """WSGI middleware that bounds the number of requests handled at once.
+
+    A request waits up to queue_timeout seconds for one of the max_workers
+    workers to be free. If none is, it's rejected with a 503 and a
+    Retry-After header. The latency of each request, or rejection, is
+    counted by route in stats, if given.
+    """
+
+    def __init__(self, wsgi_app, max_workers=8, queue_timeout=1,
+                 retry_after=5, stats=None):
+        self.wsgi_app = wsgi_app
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.stats = stats
+        self._workers = threading.BoundedSemaphore(max_workers)
+
+    def __call__(self, environ, start_response):
+        route = route_name(environ.get('PATH_INFO', ''))
+        start = time.time()
+        if not self._workers.acquire(timeout=self.queue_timeout):
+            logger.warning("federer: busy, rejecting request for /%s" %
+                           route)
+            self._record(route, start, rejected=True)
+            start_response('503 Service Unavailable', [
+                ('Content-Type', 'text/plain'),
+                ('Retry-After', str(self.retry_after)),
+            ])
+            return [b'Busy, try again later\n']
+        try:
+            result = self.wsgi_app(environ, start_response)
+            try:
+                # Produce the whole response while we hold the worker.
+                return list(result)
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+        finally:
+            self._workers.release()
+            self._record(route, start)
+
+    def _record(self, route, start, rejected=False):
+        if self.stats:
+            self.stats.record(route, time.time() - start, rejected)
+
+
+def main():
+    ConfigDB.enable_cache()
+    conf = ConfigDB()
+    stats = RequestStats()
+    app.run(lambda wsgi_app: WorkerPool(
+        wsgi_app, conf['federer.max_workers'], conf['federer.queue_timeout'],
+        conf['federer.retry_after'], stats))
+
+
 if __name__ == "__main__":
-    app.run()
+    main()
@@ -9,23 +9,20 @@ of patent rights can be found in the PATENTS file in the same directory.
 """
 
 import web
-import xml.dom.minidom as xml
 
 from ccm.common import logger
+from ccm.common.utils.xml_cdr import get_tag_text, parse_tags
 from core import events
 from core import billing
 from core.subscriber import subscriber
 
 IMSI_PREFIX = "IMSI"
 
-def get_tag_text(nodelist):
-    """ Get the text value of an XML tag (from the minidom doc)
-    """
-    rc = []
-    for node in nodelist:
-        if node.nodeType == node.TEXT_NODE:
-            rc.append(node.data)
-    return ''.join(rc)
+# The CDR tags used for billing, extracted in one pass over the CDR.
+CDR_TAGS = [
+    'origination', 'duration', 'billsec', 'service_type', 'username',
+    'caller_id_name', 'callee_id_number', 'destination_number',
+]
 
 
 class cdr(object):
@@ -45,37 +42,20 @@ class cdr(object):
 
     def process_cdr(self, cdr_xml):
         """Processes the XML CDR for the caller."""
-        cdr_dom = xml.parseString(cdr_xml)
+        tags = parse_tags(cdr_xml, CDR_TAGS)
         # Handle only b-legs for billing.
-        origin = cdr_dom.getElementsByTagName("origination")
-        if origin:
+        if 'origination' in tags:
             return
-        # Handle only b-legs for billing.
         # For our purposes, billsec is how long the call lasted. call_duration
         # captures the amount of time spent ringing, which we don't charge for,
         # so don't include here. Caller and callee are just used for logging
         # and reason statements.
         # TODO(matt): what happens if the tag does not exist?
-        call_duration = int(get_tag_text(
-            cdr_dom.getElementsByTagName("duration")[0].childNodes))
-        billsec = int(get_tag_text(
-            cdr_dom.getElementsByTagName("billsec")[0].childNodes))
-        # In b-leg cdrs, there are multiple destinations -- the sip one (IMSI)
-        # and the dialed one (MSISDN).  We want the latter.
-        callees = cdr_dom.getElementsByTagName("destination_number")
-        callee = ''
-        for c in callees:
-            c = get_tag_text(c.childNodes)
-            # NOT THE IMSI
-            if c[0:4] != IMSI_PREFIX:
-                callee = c
-                break
-        if callee[0] == "+":
-            callee = callee[1:]
+        call_duration = int(get_tag_text(tags, 'duration'))
+        billsec = int(get_tag_text(tags, 'billsec'))
         # This is where we get the info we need to do billing.
-        if len(cdr_dom.getElementsByTagName("service_type")) > 0:
-            service_type = get_tag_text(
-                cdr_dom.getElementsByTagName("service_type")[0].childNodes)
+        service_type = get_tag_text(tags, 'service_type')
+        if service_type is not None:
             # Get caller / callee info.  See the 'CDR notes' doc in drive for
             # more info.
             from_imsi, from_number, to_imsi, to_number = 4 * [None]
@@ -83,46 +63,30 @@ class cdr(object):
             # <caller_profile> parent element. If it's a BTS-originated call,
             # this will be an IMSI; otherwise, it'll be an MSISDN.
             if service_type not in ['incoming_call']:
-                elements = cdr_dom.getElementsByTagName('username')
-                for element in elements:
-                    if element.parentNode.nodeName == 'caller_profile':
-                        username = get_tag_text(element.childNodes)
-                        from_imsi = subscriber.get_imsi_from_username(username)
-                        break
+                username = get_tag_text(tags, 'username', 'caller_profile')
+                if username is not None:
+                    from_imsi = subscriber.get_imsi_from_username(username)
             # Get 'from_number' (only available for outside and local calls).
             if service_type in ['outside_call', 'local_call', 'incoming_call']:
-                elements = cdr_dom.getElementsByTagName('caller_id_name')
-                for element in elements:
-                    if element.parentNode.nodeName == 'caller_profile':
-                        from_number = get_tag_text(element.childNodes)
-                        break
+                from_number = get_tag_text(tags, 'caller_id_name',
+                                           'caller_profile')
             # Get 'to_imsi' (only available for local/incoming calls).
             if service_type in ['local_call', 'incoming_call']:
-                elements = cdr_dom.getElementsByTagName('callee_id_number')
-                for element in elements:
-                    if element.parentNode.nodeName == 'caller_profile':
-                        callee_id = get_tag_text(element.childNodes)
-                        if callee_id[0:4] == IMSI_PREFIX:
-                            to_imsi = callee_id
-                        else:
-                            # callee_id_number in the CDR is MSISDN.
-                            to_imsi = subscriber.get_imsi_from_number(callee_id)
-                        break
+                callee_id = get_tag_text(tags, 'callee_id_number',
+                                         'caller_profile')
+                if callee_id and callee_id[0:4] == IMSI_PREFIX:
+                    to_imsi = callee_id
+                elif callee_id:
+                    # callee_id_number in the CDR is MSISDN.
+                    to_imsi = subscriber.get_imsi_from_number(callee_id)
 
             # Get 'to_number' (slightly different for local/incoming calls).
             if service_type in ['outside_call', 'free_call', 'error_call']:
-                elements = cdr_dom.getElementsByTagName('destination_number')
-                for element in elements:
-                    if element.parentNode.nodeName == 'caller_profile':
-                        to_number = get_tag_text(element.childNodes)
-                        break
+                to_number = get_tag_text(tags, 'destination_number',
+                                         'caller_profile')
             elif service_type in ['local_call', 'incoming_call']:
-                elements = cdr_dom.getElementsByTagName('destination_number')
-                for element in elements:
-                    if (element.parentNode.nodeName ==
-                            'originator_caller_profile'):
-                        to_number = get_tag_text(element.childNodes)
-                        break
+                to_number = get_tag_text(tags, 'destination_number',
+                                         'originator_caller_profile')
             # Generate billing information for the caller, if the caller is
             # local to the BTS.
             if service_type != 'incoming_call':
@@ -161,8 +125,7 @@ class cdr(object):
                     billsec)
 
         else:
-            username = get_tag_text(
-                cdr_dom.getElementsByTagName("username")[0].childNodes)
+            username = get_tag_text(tags, 'username')
             from_imsi = subscriber.get_imsi_from_username(username)
             message = "No rate info for this call. (from: %s, billsec: %s)" % (
                 from_imsi, billsec)
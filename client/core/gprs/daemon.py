@@ -4,8 +4,9 @@ This main routine is meant to be run as a daemon.  It will do three things
 primarily:
  1) gather GPRS usage data via the openbts-python API and drop it into a
     postgres table, 'gprs_records'
- 2) generate GPRS usage events for the EventStore
- 3) periodically remove old data from 'gprs_records'
+ 2) generate GPRS usage events for the EventStore from the usage summed up
+    per IMSI as it's scraped
+ 3) periodically drop old partitions of 'gprs_records'
 
 Copyright (c) 2016-present, Facebook, Inc.
 All rights reserved.
@@ -33,14 +34,16 @@ def main():
     last_scrape_time = now
     last_event_generation_time = now
     last_removal_of_old_data = now
+    ConfigDB.enable_cache()
     config_db = ConfigDB()
+    scraper = utilities.GPRSScraper()
     while True:
         now = time.time()
         # Get GPRS usage data and store it in the DB.
         if (now - last_scrape_time >
                 config_db['gprsd_cli_scrape_period']):
             last_scrape_time = now
-            utilities.gather_gprs_data()
+            scraper.scrape()
         # Generate events for the EventStore with data from the GPRS table.
         if (now - last_event_generation_time >
                 config_db['gprsd_event_generation_period']):
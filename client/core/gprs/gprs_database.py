@@ -8,81 +8,212 @@ LICENSE file in the root directory of this source tree. An additional grant
 of patent rights can be found in the PATENTS file in the same directory.
 """
 
-import os
 import time
 
 import psycopg2
+import psycopg2.extras
 
-
-# In our CI system, Postgres credentials are stored in env vars.
-PG_USER = os.environ.get('PG_USER', 'endaga')
-PG_PASSWORD = os.environ.get('PG_PASSWORD', 'endaga')
+from core.db import ConnectorFactory
 
 
 class GPRSDB(object):
     """Manages connections to the GPRS DB.
 
-    Convention is to close all cursors after opening and immediately commit
-    transactions, even if the query is just a 'select.'
+    Convention is to run each statement in its own transaction on the
+    shared connection pool, even if the query is just a 'select.'
+
+    Records are written to child tables of gprs_records that each hold
+    PARTITION_PERIOD seconds of records, so old records can be removed by
+    dropping whole partitions. Queries on gprs_records see all partitions.
+
+    As records are added, their byte deltas are also summed per IMSI in
+    gprs_rollups, from which usage events are generated.
     """
-    def __init__(self):
-        self.connection = psycopg2.connect(host='localhost', database='endaga',
-                                           user=PG_USER, password=PG_PASSWORD)
+
+    # Seconds of records in each partition.
+    PARTITION_PERIOD = 24 * 60 * 60
+
+    def __init__(self, connector=None):
+        self._connector = (connector or
+                           ConnectorFactory.get_psycopg_connector())
         self.table_name = 'gprs_records'
-        # Create the table if it doesn't yet exist.
-        with self.connection.cursor() as cursor:
-            command = ("CREATE TABLE IF NOT EXISTS %s("
-                       " id serial PRIMARY KEY,"
-                       " record_timestamp timestamp default current_timestamp,"
-                       " imsi text,"
-                       " ipaddr text,"
-                       " uploaded_bytes integer,"
-                       " downloaded_bytes integer,"
-                       " uploaded_bytes_delta integer,"
-                       " downloaded_bytes_delta integer"
-                       ");")
-            cursor.execute(command % self.table_name)
-            self.connection.commit()
+        self.rollup_table_name = 'gprs_rollups'
+        self._connector.with_cursor(self._createdb)
+
+    def _createdb(self, cur):
+        """Creates the tables if they don't yet exist."""
+        cur.execute("CREATE TABLE IF NOT EXISTS %s("
+                    " id serial PRIMARY KEY,"
+                    " record_timestamp timestamp default current_timestamp,"
+                    " imsi text,"
+                    " ipaddr text,"
+                    " uploaded_bytes bigint,"
+                    " downloaded_bytes bigint,"
+                    " uploaded_bytes_delta bigint,"
+                    " downloaded_bytes_delta bigint"
+                    ");" % self.table_name)
+        # The scraper looks up the latest record of each IMSI.
+        cur.execute("CREATE INDEX IF NOT EXISTS %s_imsi_id_idx"
+                    " ON %s (imsi, id);" % (self.table_name, self.table_name))
+        # Older versions used 32-bit byte counts, which long-lived sessions
+        # overflow. Altering the parent also alters its partitions.
+        cur.execute("SELECT data_type FROM information_schema.columns"
+                    " WHERE table_name = %s AND column_name = %s;",
+                    (self.table_name, 'uploaded_bytes'))
+        if cur.fetchone()[0] != 'bigint':
+            cur.execute("ALTER TABLE %s"
+                        " ALTER COLUMN uploaded_bytes TYPE bigint,"
+                        " ALTER COLUMN downloaded_bytes TYPE bigint,"
+                        " ALTER COLUMN uploaded_bytes_delta TYPE bigint,"
+                        " ALTER COLUMN downloaded_bytes_delta TYPE bigint;"
+                        % self.table_name)
+        cur.execute("CREATE TABLE IF NOT EXISTS %s("
+                    " imsi text PRIMARY KEY,"
+                    " uploaded_bytes bigint,"
+                    " downloaded_bytes bigint"
+                    ");" % self.rollup_table_name)
+
+    def _partition_name(self, index):
+        return '%s_p%d' % (self.table_name, index)
+
+    def _get_partition(self, cur, timestamp):
+        """Gets the partition for records added at timestamp.
+
+        The partition is created if it doesn't exist yet. That's checked on
+        every call rather than cached, as partitions can be dropped by other
+        processes (and the BTS clock may jump back into a dropped one).
+        """
+        name = self._partition_name(int(timestamp // self.PARTITION_PERIOD))
+        cur.execute("CREATE TABLE IF NOT EXISTS %s () INHERITS (%s);" %
+                    (name, self.table_name))
+        cur.execute("CREATE INDEX IF NOT EXISTS %s_imsi_id_idx"
+                    " ON %s (imsi, id);" % (name, name))
+        return name
+
+    def _get_partitions(self, cur):
+        """Gets the partition indexes of all existing partitions."""
+        cur.execute("SELECT c.relname FROM pg_inherits i"
+                    " JOIN pg_class c ON c.oid = i.inhrelid"
+                    " WHERE i.inhparent = %s::regclass;", (self.table_name,))
+        prefix = self._partition_name(0)[:-1]
+        indexes = []
+        for (name, ) in cur.fetchall():
+            if (name.startswith(prefix) and
+                    name[len(prefix):].isdigit()):
+                indexes.append(int(name[len(prefix):]))
+        return indexes
+
+    def _fetch_dicts(self, command, args=None):
+        """Runs a query and returns the result rows as dicts."""
+        def worker(conn):
+            with conn.cursor(
+                cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
+                cursor.execute(command, args)
+                return cursor.fetchall()
+        return self._connector.execute(worker)
 
     def empty(self):
-        """Drops all records from the table."""
-        with self.connection.cursor() as cursor:
-            command = 'truncate %s' % self.table_name
-            cursor.execute(command)
-            self.connection.commit()
+        """Drops all records and rollups."""
+        command = 'truncate %s, %s' % (self.table_name,
+                                       self.rollup_table_name)
+        self._connector.exec_stmt(command)
 
     def add_record(self, imsi, ipaddr, up_bytes, down_bytes, up_bytes_delta,
                    down_bytes_delta):
         """Adds a record into the GPRS DB.
 
-        See the schema definition in __init__ for type information.  Record is
-        automatically added with record_timestamp set to the current time.
+        See the schema definition in _createdb for type information.  Record
+        is automatically added with record_timestamp set to the current time.
         """
+        self.add_records([(imsi, ipaddr, up_bytes, down_bytes, up_bytes_delta,
+                           down_bytes_delta)])
+
+    def add_records(self, records):
+        """Adds several records into the GPRS DB with a single insert.
+
+        The byte deltas are added to the IMSIs' rollups in the same
+        transaction.
+
+        Args:
+          records: a list of (imsi, ipaddr, up_bytes, down_bytes,
+                   up_bytes_delta, down_bytes_delta) tuples
+        """
+        if not records:
+            return
         schema = ('imsi, ipaddr, uploaded_bytes, downloaded_bytes,'
                   ' uploaded_bytes_delta, downloaded_bytes_delta')
-        values = "'%s', '%s', %s, %s, %s, %s" % (
-            imsi, ipaddr, up_bytes, down_bytes, up_bytes_delta,
-            down_bytes_delta)
-        command = 'insert into %s (%s) values(%s)' % (
-            self.table_name, schema, values)
-        with self.connection.cursor() as cursor:
-            cursor.execute(command)
-            self.connection.commit()
+        # Sum the deltas per IMSI, there could be more than one record each.
+        rollups = {}
+        for imsi, _, _, _, up_bytes_delta, down_bytes_delta in records:
+            if up_bytes_delta or down_bytes_delta:
+                up, down = rollups.get(imsi, (0, 0))
+                rollups[imsi] = (up + up_bytes_delta,
+                                 down + down_bytes_delta)
+
+        def worker(cur):
+            partition = self._get_partition(cur, time.time())
+            values = b",".join(cur.mogrify("(%s, %s, %s, %s, %s, %s)", r)
+                               for r in records)
+            command = 'insert into %s (%s) values ' % (partition, schema)
+            cur.execute(command.encode('utf-8') + values)
+            if rollups:
+                self._add_rollups(cur, rollups)
+        self._connector.with_cursor(worker)
+
+    def _add_rollups(self, cur, rollups):
+        # Sorted, so concurrent upserts lock rows in the same order.
+        values = b",".join(cur.mogrify("(%s, %s, %s)", (imsi, ) + r)
+                           for imsi, r in sorted(rollups.items()))
+        command = (
+            b'insert into ' + self.rollup_table_name.encode('utf-8') +
+            b' as r (imsi, uploaded_bytes, downloaded_bytes) values ' +
+            values + b' on conflict (imsi) do update set'
+            b' uploaded_bytes = r.uploaded_bytes + excluded.uploaded_bytes,'
+            b' downloaded_bytes ='
+            b' r.downloaded_bytes + excluded.downloaded_bytes')
+        cur.execute(command)
+
+    def pop_rollups(self, handler=None):
+        """Removes and returns the byte counts summed up since the last pop.
+
+        Args:
+          handler: optional function called as handler(imsi, up_bytes,
+                   down_bytes) for each rollup, in the same transaction as
+                   the removal: if it raises, nothing is removed.
+
+        Returns a dict of (up_bytes, down_bytes) tuples keyed by IMSI.
+        """
+        def worker(cur):
+            cur.execute('delete from %s returning imsi, uploaded_bytes,'
+                        ' downloaded_bytes' % self.rollup_table_name)
+            rollups = {}
+            for imsi, up_bytes, down_bytes in cur.fetchall():
+                rollups[imsi] = (up_bytes, down_bytes)
+                if handler:
+                    handler(imsi, up_bytes, down_bytes)
+            return rollups
+        return self._connector.with_cursor(worker)
 
     def get_latest_record(self, imsi):
         """Gets the most recent record for an IMSI.
 
         Returns None if no record was found.
         """
-        command = "select * from %s where imsi='%s' order by id desc limit 1"
-        with self.connection.cursor(
-            cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
-            cursor.execute(command % (self.table_name, imsi))
-            self.connection.commit()
-            if not cursor.rowcount:
-                return None
-            else:
-                return cursor.fetchall()[0]
+        command = "select * from %s where imsi=%%s order by id desc limit 1"
+        records = self._fetch_dicts(command % self.table_name, (imsi,))
+        if not records:
+            return None
+        else:
+            return records[0]
+
+    def get_latest_records(self):
+        """Gets the most recent record for every IMSI in the table.
+
+        Returns a dict of records keyed by IMSI.
+        """
+        command = ("select distinct on (imsi) * from %s"
+                   " order by imsi, id desc" % self.table_name)
+        return {r['imsi']: r for r in self._fetch_dicts(command)}
 
     def get_records(self, start_timestamp=0, end_timestamp=None):
         """Gets records from the table between the specified timestamps.
@@ -108,17 +239,22 @@ class GPRSDB(object):
         template = ('select * from %s where record_timestamp >= %s'
                     ' and record_timestamp <= %s')
         command = template % (self.table_name, start, end)
-        with self.connection.cursor(
-            cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
-            cursor.execute(command)
-            self.connection.commit()
-            return cursor.fetchall()
+        return self._fetch_dicts(command)
 
     def delete_records(self, timestamp):
-        """Deletes records older than the given epoch timestamp."""
-        timestamp = psycopg2.TimestampFromTicks(timestamp)
-        template = 'delete from %s where record_timestamp < %s'
-        command = template % (self.table_name, timestamp)
-        with self.connection.cursor() as cursor:
-            cursor.execute(command)
-            self.connection.commit()
+        """Deletes records older than the given epoch timestamp.
+
+        Partitions are dropped once all of their records are older than the
+        timestamp, so records may be kept for up to PARTITION_PERIOD longer.
+        Records in gprs_records itself, from before partitioning or added
+        directly, are deleted individually.
+        """
+        def worker(cur):
+            for index in self._get_partitions(cur):
+                if (index + 1) * self.PARTITION_PERIOD <= timestamp:
+                    cur.execute('drop table if exists %s' %
+                                self._partition_name(index))
+            cur.execute('delete from only %s where record_timestamp < %%s' %
+                        self.table_name,
+                        (psycopg2.TimestampFromTicks(timestamp), ))
+        self._connector.with_cursor(worker)
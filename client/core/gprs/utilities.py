@@ -10,91 +10,121 @@ of patent rights can be found in the PATENTS file in the same directory.
 
 import humanize
 
+from ccm.common import logger
 from core import events
 from core.gprs import gprs_database
 from core.subscriber import subscriber
 from core.exceptions import SubscriberNotFound
 
 
+class GPRSScraper(object):
+    """Scrapes GPRS usage from the BTS into the GPRS DB.
+
+    The last counters seen for each IMSI are kept in memory between scrapes,
+    so a scrape is one query for the registered subscribers, one for the
+    usage and a single insert for all the records. The counters are loaded
+    from the latest record of each IMSI on the first scrape; after that the
+    records we insert are all the persistence they need.
+    """
+
+    def __init__(self, gprs_db=None):
+        self.gprs_db = gprs_db or gprs_database.GPRSDB()
+        # IMSI -> (ipaddr, uploaded_bytes, downloaded_bytes)
+        self._counters = None
+
+    def _load_counters(self):
+        self._counters = {
+            imsi: (r['ipaddr'], r['uploaded_bytes'], r['downloaded_bytes'])
+            for imsi, r in self.gprs_db.get_latest_records().items()}
+
+    def scrape(self):
+        """Gets GPRS data from the BTS and dumps it in the GPRS DB.
+
+        Returns the number of records added.
+        """
+        try:
+            data = subscriber.get_gprs_usage()
+        except SubscriberNotFound:
+            return 0
+        if not data:
+            return 0
+        if self._counters is None:
+            self._load_counters()
+        # If an IMSI is not a registered sub, ignore its data.
+        registered = subscriber.get_subscriber_imsis()
+        records = []
+        counters = {}
+        for imsi, usage in data.items():
+            if imsi not in registered:
+                continue
+            ipaddr = usage['ipaddr']
+            up_bytes = usage['uploaded_bytes']
+            down_bytes = usage['downloaded_bytes']
+            last = self._counters.get(imsi)
+            if (not last or last[0] != ipaddr or
+                    last[1] > up_bytes or last[2] > down_bytes):
+                # Either there's no previous record for this IMSI, or the
+                # byte count was reset: the ipaddr changed, or was
+                # re-assigned to this IMSI and happens to match the IP we
+                # had previously.  Count from zero.
+                old_up_bytes = old_down_bytes = 0
+            else:
+                old_up_bytes, old_down_bytes = last[1], last[2]
+            records.append((imsi, ipaddr, up_bytes, down_bytes,
+                            up_bytes - old_up_bytes,
+                            down_bytes - old_down_bytes))
+            counters[imsi] = (ipaddr, up_bytes, down_bytes)
+        self.gprs_db.add_records(records)
+        # Only remember counters once they're in the DB.
+        self._counters.update(counters)
+        return len(records)
+
+
 def gather_gprs_data():
-    """Gets GPRS data from openbts-python and dumps it in the GPRS DB."""
-    gprs_db = gprs_database.GPRSDB()
-    try:
-        data = subscriber.get_gprs_usage()
-    except SubscriberNotFound:
-        return
-    for imsi in list(data.keys()):
-        # If the IMSI is not a registered sub, ignore its data.
-        if not subscriber.get_subscribers(imsi=imsi):
-            continue
-        # Otherwise, get the IMSI's latest record and compute the byte count
-        # deltas.
-        record = gprs_db.get_latest_record(imsi)
-        if not record:
-            # No previous records exist for this IMSI so set the old byte
-            # counts to zero.
-            old_up_bytes = 0
-            old_down_bytes = 0
-        elif record['ipaddr'] != data[imsi]['ipaddr']:
-            # The ipaddr has been reset and with it, the byte count.
-            old_up_bytes = 0
-            old_down_bytes = 0
-        elif (record['uploaded_bytes'] > data[imsi]['uploaded_bytes'] or
-              record['downloaded_bytes'] > data[imsi]['downloaded_bytes']):
-            # The ipaddr was recently re-assigned to this IMSI and it happens
-            # to match the IP we had previously.  The byte count was reset
-            # during this transition.
-            old_up_bytes = 0
-            old_down_bytes = 0
-        else:
-            old_up_bytes = record['uploaded_bytes']
-            old_down_bytes = record['downloaded_bytes']
-        up_bytes_delta = data[imsi]['uploaded_bytes'] - old_up_bytes
-        down_bytes_delta = data[imsi]['downloaded_bytes'] - old_down_bytes
-        # Insert the GPRS data into the DB.
-        gprs_db.add_record(
-            imsi, data[imsi]['ipaddr'], data[imsi]['uploaded_bytes'],
-            data[imsi]['downloaded_bytes'], up_bytes_delta, down_bytes_delta)
+    """Gets GPRS data from openbts-python and dumps it in the GPRS DB.
+
+    Long-running callers should keep a GPRSScraper instead, so the last
+    counters don't have to be re-read from the DB for each scrape.
+    """
+    GPRSScraper().scrape()
 
 
 def generate_gprs_events(start_timestamp, end_timestamp):
-    """Create GPRS events from data in the GPRS DB.
+    """Create GPRS events from the usage rolled up in the GPRS DB.
 
-    Records that were generated between the specified timestamp will become
-    events.  One event is created per IMSI (not one event per record).
+    The byte deltas of each IMSI are summed as records are added, so this
+    doesn't re-read any records: it creates one event per IMSI for the usage
+    added since the last call, then resets the sums.
 
     Args:
       start_timestamp: seconds since epoch
       end_timestamp: seconds since epoch
     """
     gprs_db = gprs_database.GPRSDB()
-    # First organize the records by IMSI.
-    sorted_records = {}
-    for record in gprs_db.get_records(start_timestamp, end_timestamp):
-        if record['imsi'] not in sorted_records:
-            sorted_records[record['imsi']] = []
-        sorted_records[record['imsi']].append(record)
-    # Now analyze all records that we have for each IMSI.
-    for imsi in sorted_records:
-        up_bytes = sum(
-            [r['uploaded_bytes_delta'] for r in sorted_records[imsi]])
-        down_bytes = sum(
-            [r['downloaded_bytes_delta'] for r in sorted_records[imsi]])
+    timespan = int(end_timestamp - start_timestamp)
+
+    def create_event(imsi, up_bytes, down_bytes):
         # Do not make an event if the byte deltas are unchanged.
         if up_bytes == 0 and down_bytes == 0:
-            continue
+            return
         # For now, GPRS is free for subscribers.
         cost = 0
         reason = 'gprs_usage: %s uploaded, %s downloaded' % (
             humanize.naturalsize(up_bytes), humanize.naturalsize(down_bytes))
-        timespan = int(end_timestamp - start_timestamp)
-        events.create_gprs_event(
-            imsi, cost, reason, up_bytes, down_bytes, timespan)
+        try:
+            events.create_gprs_event(
+                imsi, cost, reason, up_bytes, down_bytes, timespan)
+        except SubscriberNotFound:
+            # The sub was deleted since the usage was recorded.
+            logger.warning("gprs: dropping usage of unknown sub %s" % imsi)
+    # If creating an event fails otherwise, the sums are kept for next time.
+    gprs_db.pop_rollups(create_event)
 
 
 def clean_old_gprs_records(timestamp):
     """Remove records from the GPRS DB that are older than timestamp.
 
+    Records are removed a partition at a time (see GPRSDB.delete_records).
     We just do this to prevent the table from growing without bound.  And we
     don't delete GPRS records immediately after their conversion to events in
     case we want them for analysis later.
@@ -5,7 +5,9 @@
 # LICENSE file in the root directory of this source tree. An additional grant
 # of patent rights can be found in the PATENTS file in the same directory.
 import json
+import threading
 import time
+from concurrent import futures
 
 import requests
 import snowflake
@@ -13,6 +15,8 @@ import snowflake
 from ccm.common import delta, logger
 from core import events
 from core import number_utilities
+from core import request_stats
+from core import sampler
 from core import system_utilities
 from core.subscriber import subscriber
 from core.bts import bts
@@ -22,16 +26,82 @@ from gzip import GzipFile
 from io import BytesIO
 
 
+class EventDrain(object):
+    """Sizes the batch of events sent with each checkin.
+
+    A checkin normally carries up to MIN_BATCH events. After an outage the
+    backlog can be much larger than that, so the batch grows with the
+    backlog, aiming to drain it in TARGET_CHECKINS checkins, within limits
+    learned from earlier checkins: the request size, the time the server
+    takes per event, and the largest batch since the last failed checkin.
+    """
+
+    MIN_BATCH = 100
+    MAX_BATCH = 5000
+    TARGET_CHECKINS = 10
+    MAX_REQUEST_SZ = 4 * 1024 * 1024  # uncompressed
+
+    def __init__(self):
+        self.limit = self.MAX_BATCH
+        # estimated from the last large batch; they include the other
+        # checkin sections, so err on the small side
+        self._bytes_per_event = None
+        self._secs_per_event = None
+
+    def batch_size(self, backlog, timeout):
+        """Gets the number of events to send with a checkin.
+
+        Args:
+          backlog: number of events waiting to be sent
+          timeout: the checkin POST timeout in seconds
+        """
+        size = min(-(-backlog // self.TARGET_CHECKINS), self.limit)
+        if self._bytes_per_event:
+            size = min(size, int(self.MAX_REQUEST_SZ / self._bytes_per_event))
+        if self._secs_per_event:
+            # leave the server at least half the timeout to spare
+            size = min(size, int(timeout / 2.0 / self._secs_per_event))
+        return max(self.MIN_BATCH, size)
+
+    def record(self, num_events, raw_req_sz, post_lat, ok):
+        """Updates the limits with the outcome of a checkin."""
+        if not ok:
+            if num_events > self.MIN_BATCH:
+                self.limit = max(self.MIN_BATCH, num_events // 2)
+            return
+        if num_events >= self.MIN_BATCH:
+            self._bytes_per_event = raw_req_sz / float(num_events)
+            self._secs_per_event = post_lat / float(num_events)
+        if num_events >= self.limit:
+            self.limit = min(self.MAX_BATCH, self.limit * 2)
+
+
 class endaga_ic(object):
     """Endaga interconnect."""
 
     MIN_COMPRESSIBLE_REQUEST_SZ = 512  # not much to gain compressing short str
+    # Seconds checkin waits for the status collectors
+    COLLECT_TIMEOUT = 5
+    # keys of the federer request summaries that are reported; the cloud
+    # stores a row per key, so the histogram buckets are left out
+    FEDERER_KEYS = ('count', 'rejected', 'p50', 'p95')
 
     def __init__(self, conf):
         self.conf = conf
         self.token = conf['endaga_token']
         self.utilization_tracker = system_utilities.SystemUtilizationTracker()
         self._checkin_load_stats = {}
+        self._collector_pool = None  # created on first checkin
+        self._running_collectors = set()
+        self._sampler = None
+        self._request_stats = None  # created on first checkin
+        self._drain = EventDrain()
+        # backlog of events when this checkin's usage was collected
+        self._usage_backlog = 0
+        # set by checkin while the server is acking a backlog of events
+        self.draining = False
+        # serialises BSS queries from checkin and the sampler
+        self._bss_lock = threading.Lock()
         self._session = None  # use persistent connection when possible
         self._session_cookies = None
 
@@ -112,71 +182,197 @@ class endaga_ic(object):
 
         return r.status_code == 202
 
-    def checkin(self, timeout=11):
-        """Gather system status."""
+    def start_sampler(self, period, window):
+        """Samples load, noise and utilization in the background.
 
-        # Compile checkin data
-        checkin_start = time.time()
-        status = {
-            'usage': events.usage(),
-            'uptime': system_utilities.uptime(),
-            'system_utilization': self.utilization_tracker.get_data(),
+        Checkins then send a summary of the last `window` samples, taken
+        every `period` seconds, rather than a point sample.
+        """
+        if self._sampler is not None:
+            return
+        self._sampler = sampler.Sampler({
+            'openbts_load': lambda: self._bss_call(bts.get_load),
+            'openbts_noise': lambda: self._bss_call(bts.get_noise),
+            'system_utilization': self.utilization_tracker.sample,
+        }, period, window)
+        # the first non-blocking cpu_percent is meaningless
+        self.utilization_tracker.sample()
+        self._sampler.start()
+
+    def stop_sampler(self):
+        if self._sampler is not None:
+            self._sampler.stop()
+            self._sampler = None
+
+    def _bss_call(self, func):
+        with self._bss_lock:
+            return func()
+
+    def _collect_usage(self, timeout):
+        backlog = events.EventStore().backlog()
+        usage = events.usage(self._drain.batch_size(backlog, timeout))
+        self._usage_backlog = backlog
+        return {'usage': usage, 'uptime': system_utilities.uptime()}
+
+    def _status_collectors(self, timeout):
+        """Returns the collectors of checkin status, in groups.
+
+        Each collector returns a dict of status sections. The groups run
+        concurrently, but the collectors in a group run in order since they
+        share a connection: the BSS clients aren't thread-safe.
+        """
+        return [
+            [('usage', lambda: self._collect_usage(timeout))],
+            [('system_utilization', self._collect_utilization)],
+            [('versions', lambda: {
+                'versions': self._bss_call(bts.get_versions)}),
+             ('camped_subscribers', lambda: {
+                 'camped_subscribers':
+                     self._bss_call(bts.active_subscribers)}),
+             ('load', lambda: self._collect_sampled('openbts_load',
+                                                    bts.get_load)),
+             ('noise', lambda: self._collect_sampled('openbts_noise',
+                                                     bts.get_noise)),
+             ('radio', self._collect_radio)],
+            [('subscribers', self._collect_subscribers)],
+            [('federer', self._collect_federer)],
+        ]
+
+    def _collect_sampled(self, section, collector):
+        """Gets the sampler's summary of a section, or a point sample."""
+        summary = self._sampler.summary(section) if self._sampler else None
+        if summary:
+            return {section: summary}
+        return {section: self._bss_call(collector)}
+
+    def _collect_utilization(self):
+        summary = (self._sampler.summary('system_utilization')
+                   if self._sampler else None)
+        if not summary:
+            return {'system_utilization': self.utilization_tracker.get_data()}
+        # byte deltas are between checkins, so they aren't sampled
+        summary.update(self.utilization_tracker.get_network_deltas())
+        return {'system_utilization': summary}
+
+    def _collect_federer(self):
+        if self._request_stats is None:
+            self._request_stats = request_stats.RequestStats()
+        return {'federer_load': self._request_stats.pop()}
+
+    def _collect_radio(self):
+        # eventually need to also grab all used channels, not just c0
+        # TODO: (kheimerl) T13270338 Add multiband support
+        # also add power here eventually
+        # TODO: (kheimerl) T13270365 Add power level support
+        with self._bss_lock:
+            return {'radio': {'band': bts.get_band(),
+                              'c0': bts.get_arfcn_c0()}}
+
+    def _collect_subscribers(self):
+        # Add balance sync data
+        modified_subs = events.EventStore().modified_subs()
+        return {
+            'subscribers': subscriber.get_subscriber_states(
+                imsis=modified_subs, deltas=True),
+            # Add subscriber status and validity sync data
+            'subscriber_status': subscriber.status().get_subscriber_status(
+                imsis=modified_subs),
+            'notifications': subscriber.notif_status().get_notification(),
         }
 
-        # Append status if we can
-        try:
-            #get the software versions
-            status['versions'] = bts.get_versions()
-        except BSSError as e:
-            logger.error("bts get_versions error: %s" % e)
+    def _run_collectors(self, group, results):
+        for name, collector in group:
+            start = time.time()
+            try:
+                results[name] = collector()
+            except Exception as e:
+                results[name] = e
+            finally:
+                self._checkin_load_stats['collect.%s_lat' % name] = (
+                    time.time() - start)
+                self._running_collectors.discard(name)
+
+    def _collect_status(self, deadline, timeout):
+        """Runs the status collectors, waiting for them until deadline.
+
+        The sections of collectors that miss the deadline are left out of
+        this checkin. Those collectors are skipped on later checkins until
+        they finish.
+
+        Raises:
+          the first exception raised by a collector, other than BSSError
+        """
+        groups = self._status_collectors(timeout)
+        if self._collector_pool is None:
+            self._collector_pool = futures.ThreadPoolExecutor(len(groups))
+        results = {}
+        pending = []
+        for group in groups:
+            names = [name for name, _ in group]
+            if self._running_collectors.intersection(names):
+                logger.warning("checkin: skipping %s, still running" %
+                               ", ".join(names))
+                continue
+            self._running_collectors.update(names)
+            pending.append(
+                self._collector_pool.submit(self._run_collectors, group,
+                                            results))
+        futures.wait(pending, timeout=max(0, deadline - time.time()))
+        # Late collectors keep writing to results; take a snapshot.
+        results = dict(results)
+
+        status = {}
+        missed = 0
+        for group in groups:
+            for name, _ in group:
+                if name not in results:
+                    missed += 1
+                    continue
+                result = results[name]
+                if isinstance(result, BSSError):
+                    logger.error("bts %s error: %s" % (name, result))
+                elif isinstance(result, Exception):
+                    raise result
+                else:
+                    status.update(result)
+        if missed:
+            logger.error("checkin: %d status collectors missed the deadline" %
+                         missed)
+        self._checkin_load_stats['collect_missed'] = missed
+        return status
 
-        try:
-            # Gather camped subscriber list
-            status['camped_subscribers'] = bts.active_subscribers()
-        except BSSError as e:
-            logger.error("bts get active_subscribers error: %s" % e)
-
-        # Gather tower load and noise data.
-        # NOTE(matt): these values can vary quite a bit over a minute. It
-        #       might be worth capturing data more frequently and sending
-        #       something like average or median values.
-        status['openbts_load'] = {}
-        try:
-            status['openbts_load'] = bts.get_load()
-        except BSSError as e:
-            logger.error("bts get_load error: %s" % e)
+    def checkin(self, timeout=11):
+        """Gather system status."""
 
-        for key, val in list(self._checkin_load_stats.items()):
-            status['openbts_load']['checkin.' + key] = val
+        # Compile checkin data
+        checkin_start = time.time()
+        # Stats of the previous checkin, and collectors that finished since
+        load_stats = dict(self._checkin_load_stats)
         self._checkin_load_stats.clear()
-
-        try:
-            status['openbts_noise'] = bts.get_noise()
-        except BSSError as e:
-            logger.error("bts get_noise error: %s" % e)
-
-        status['radio'] = {}
-        try:
-            status['radio']['band'] = bts.get_band()
-            # eventually need to also grab all used channels, not just c0
-            # TODO: (kheimerl) T13270338 Add multiband support
-            status['radio']['c0'] = bts.get_arfcn_c0()
-            #also add power here eventually
-            # TODO: (kheimerl) T13270365 Add power level support
-        except BSSError as e:
-            #delete the key if this failed
-            del status['radio']
-            logger.error("bts radio error: %s" % e)
-
-        # Add balance sync data
-        status['subscribers'] = subscriber.get_subscriber_states(
-            imsis=events.EventStore().modified_subs())
-        # Add subscriber status and validity sync data
-        status['subscriber_status'] = subscriber.status().get_subscriber_status(
-            imsis=events.EventStore().modified_subs())
-        # Add bts locale and notifications
+        self._usage_backlog = 0
+        status = self._collect_status(checkin_start + self.COLLECT_TIMEOUT,
+                                      timeout)
+        backlog = self._usage_backlog
+        num_events = len(status.get('usage', {}).get('events', []))
+        self.draining = False
+        self._checkin_load_stats['collect_lat'] = time.time() - checkin_start
+
+        status.setdefault('openbts_load', {})
+        for key, val in list(load_stats.items()):
+            status['openbts_load']['checkin.' + key] = val
+        # Latencies of the requests federer handled since the last checkin
+        for route, stats in status.pop('federer_load', {}).items():
+            for key in self.FEDERER_KEYS:
+                # routes with only rejected requests have no percentiles
+                if key in stats:
+                    status['openbts_load']['federer.%s.%s' % (route, key)] = \
+                        stats[key]
+        # Counters of the queued log handler, if it's enabled
+        for key, val in logger.queue_stats().items():
+            status['openbts_load']['logger.' + key] = val
+
+        # Add bts locale
         status['bts_locale'] = self.conf['locale']
-        status['notifications'] = subscriber.notif_status().get_notification()
         # Add delta protocol context (if available) to let server know,
         # client supports delta optimization & has a prior delta state
         if delta.DeltaProtocol.CTX_KEY not in status:  # just a precaution
@@ -238,6 +434,8 @@ class endaga_ic(object):
             self._checkin_load_stats['req_sz'] = status_len
             self._checkin_load_stats['raw_req_sz'] = decompressed_status_len
             self._checkin_load_stats['post_lat'] = time.time() - post_start
+            self._drain.record(num_events, decompressed_status_len,
+                               time.time() - post_start, False)
             raise
 
         post_end = time.time()
@@ -289,6 +487,20 @@ class endaga_ic(object):
 
         checkin_end = time.time()
 
+        # Keep checking in while a backlog of events is being acked.
+        self._drain.record(num_events, decompressed_status_len,
+                           post_end - post_start,
+                           not (r.status_code == 413 or
+                                r.status_code >= 500))
+        if num_events and r.status_code == 200:
+            remaining = events.EventStore().backlog()
+            self.draining = (remaining < backlog and
+                             remaining >= EventDrain.MIN_BATCH)
+            self._checkin_load_stats['events_drain_rate'] = (
+                (backlog - remaining) / (checkin_end - checkin_start))
+        self._checkin_load_stats['events_backlog'] = backlog
+        self._checkin_load_stats['events_sent'] = num_events
+
         self._checkin_load_stats['req_sz'] = status_len  # request payload SZ
         self._checkin_load_stats['raw_req_sz'] = decompressed_status_len
         self._checkin_load_stats['rsp_sz'] = response_len  # response payload SZ
@@ -0,0 +1,67 @@
+"""Local lookup service for the FreeSWITCH scripts.
+
+The FreeSWITCH hooks in the call-setup path (VBTS_Get_Service_Tariff,
+VBTS_Get_IMSI_From_Number, etc.) ask endaga-lookupd for billing and
+subscriber data over a Unix socket, so that they don't pay for importing
+core.billing/core.subscriber and connecting to the db and BSS on each call.
+See core.lookupd.server and core.lookupd.client.
+
+Copyright (c) 2016-present, Facebook, Inc.
+All rights reserved.
+
+This source code is licensed under the BSD-style license found in the
+LICENSE file in the root directory of this source tree. An additional grant
+of patent rights can be found in the PATENTS file in the same directory.
+"""
+
+import os
+
+
+SOCKET_PATH = os.environ.get('ENDAGA_LOOKUPD_SOCKET',
+                             '/var/run/endaga-lookupd.sock')
+
+# Lookups whose (positive) results the server may cache for a few seconds:
+# these mappings only change when a subscriber is provisioned or deleted.
+# Balances, status and SIP registration data are never cached.
+CACHEABLE = frozenset([
+    'get_caller_id',
+    'get_imsi_from_number',
+    'get_imsi_from_username',
+    'get_username_from_imsi',
+])
+
+# Lookups that query the BSS (over the Osmocom VTY or the OpenBTS ZMQ
+# clients). Those clients aren't thread-safe, so the server runs these one
+# at a time.
+SERIALIZED = frozenset([
+    'get_caller_id',
+    'get_imsi_from_number',
+    'get_imsi_from_username',
+    'get_ip',
+    'get_port',
+    'get_username_from_imsi',
+    'is_authed',
+])
+
+
+def get_methods():
+    """Returns a dict of the lookups that can be served, by name.
+
+    Imports are deferred since they connect to the db and BSS.
+    """
+    from core import billing
+    from core.subscriber import subscriber
+    return {
+        'get_service_tariff': billing.get_service_tariff,
+        'get_seconds_available': billing.get_seconds_available,
+        'get_account_balance': subscriber.get_account_balance,
+        'get_account_status':
+            lambda imsi: subscriber.status().get_account_status(imsi),
+        'get_caller_id': subscriber.get_caller_id,
+        'get_ip': subscriber.get_ip,
+        'get_port': subscriber.get_port,
+        'get_imsi_from_number': subscriber.get_imsi_from_number,
+        'get_imsi_from_username': subscriber.get_imsi_from_username,
+        'get_username_from_imsi': subscriber.get_username_from_imsi,
+        'is_authed': subscriber.is_authed,
+    }
@@ -0,0 +1,155 @@
+"""Thin client for endaga-lookupd, for use by the FreeSWITCH scripts.
+
+Each thread keeps its connection to the server open between calls. If the
+server isn't running, lookups are done in-process instead, so the scripts
+keep working (slowly) without it.
+
+Copyright (c) 2016-present, Facebook, Inc.
+All rights reserved.
+
+This source code is licensed under the BSD-style license found in the
+LICENSE file in the root directory of this source tree. An additional grant
+of patent rights can be found in the PATENTS file in the same directory.
+"""
+
+import json
+import socket
+import threading
+
+from core import exceptions
+from core import lookupd
+
+
+class LookupdError(Exception):
+    """A lookup failed on the server with an unexpected exception."""
+    pass
+
+
+class LookupClient(object):
+
+    def __init__(self, path=lookupd.SOCKET_PATH, timeout=2.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.path)
+        except socket.error:
+            sock.close()
+            raise
+        self._local.sock = sock
+        self._local.rfile = sock.makefile('rb')
+        return sock
+
+    def close(self):
+        sock = getattr(self._local, 'sock', None)
+        if sock is not None:
+            self._local.rfile.close()
+            sock.close()
+            self._local.sock = None
+
+    def call(self, method, *args):
+        """Runs a lookup on the server.
+
+        A request is sent again, once, only if the server refused or closed
+        the connection, i.e., it didn't get the request. A slow reply is
+        never waited for twice.
+
+        Raises:
+          socket.error if the server can't be reached
+          LookupdError if the server doesn't reply in time
+          the exception raised by the lookup: SubscriberNotFound, BSSError or
+          LookupdError for anything else
+        """
+        request = json.dumps({'method': method, 'args': args}).encode('utf-8')
+        # retry once on a fresh connection, in case the server restarted
+        for attempt in range(2):
+            try:
+                sock = getattr(self._local, 'sock', None) or self._connect()
+                sock.sendall(request + b'\n')
+                line = self._local.rfile.readline()
+            except socket.timeout:
+                # the server may still be working on it; don't replay it
+                self.close()
+                raise LookupdError("lookupd timed out on %s" % method)
+            except ConnectionError:
+                self.close()
+                if attempt:
+                    raise
+                continue
+            if line:
+                break
+            self.close()
+            if attempt:
+                raise socket.error("lookupd closed the connection")
+        response = json.loads(line.decode('utf-8'))
+        if 'error' in response:
+            exc = getattr(exceptions, response['error'], None)
+            if not (isinstance(exc, type) and issubclass(exc, Exception)):
+                exc = LookupdError
+            raise exc(response['message'])
+        return response['result']
+
+
+_client = LookupClient()
+_local_methods = None
+
+
+def call(method, *args):
+    """Runs a lookup via endaga-lookupd, or in-process if it's unavailable."""
+    global _local_methods
+    try:
+        return _client.call(method, *args)
+    except socket.error:
+        if _local_methods is None:
+            _local_methods = lookupd.get_methods()
+        return _local_methods[method](*args)
+
+
+def get_service_tariff(service_type, activity_type, destination_number=''):
+    return call('get_service_tariff', service_type, activity_type,
+                destination_number)
+
+
+def get_seconds_available(account_balance, service_type, destination_number):
+    return call('get_seconds_available', account_balance, service_type,
+                destination_number)
+
+
+def get_account_balance(imsi):
+    return call('get_account_balance', imsi)
+
+
+def get_account_status(imsi):
+    return call('get_account_status', imsi)
+
+
+def get_caller_id(imsi):
+    return call('get_caller_id', imsi)
+
+
+def get_ip(imsi):
+    return call('get_ip', imsi)
+
+
+def get_port(imsi):
+    return call('get_port', imsi)
+
+
+def get_imsi_from_number(number, canonicalize=True):
+    return call('get_imsi_from_number', number, canonicalize)
+
+
+def get_imsi_from_username(username):
+    return call('get_imsi_from_username', username)
+
+
+def get_username_from_imsi(imsi):
+    return call('get_username_from_imsi', imsi)
+
+
+def is_authed(imsi):
+    return call('is_authed', imsi)
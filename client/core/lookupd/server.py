@@ -0,0 +1,120 @@
+"""endaga-lookupd: serves billing and subscriber lookups on a Unix socket.
+
+Requests and responses are JSON objects, one per line:
+  {"method": "get_service_tariff", "args": ["off_network_send", "call", "56"]}
+  {"result": 800}
+or, if the lookup raised an exception,
+  {"error": "SubscriberNotFound", "message": "IMSI001010000000000"}
+
+The server is long-lived, so the ConfigDB cache, the compiled tariff table
+and the db connection pool stay warm between calls.
+
+Copyright (c) 2016-present, Facebook, Inc.
+All rights reserved.
+
+This source code is licensed under the BSD-style license found in the
+LICENSE file in the root directory of this source tree. An additional grant
+of patent rights can be found in the PATENTS file in the same directory.
+"""
+
+import json
+import os
+import socketserver
+import threading
+import time
+
+from ccm.common import logger
+from core import lookupd
+from core.exceptions import SubscriberNotFound
+
+
+class _LookupHandler(socketserver.StreamRequestHandler):
+    """Serves requests from one client connection until it's closed."""
+
+    def handle(self):
+        for line in self.rfile:
+            self.wfile.write(self.server.dispatch(line))
+            self.wfile.flush()
+
+
+class LookupServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Threaded Unix socket server for core.lookupd lookups."""
+
+    daemon_threads = True
+
+    def __init__(self, path=lookupd.SOCKET_PATH, methods=None, cache_ttl=10):
+        """
+        Args:
+          path: the socket path; a stale socket file is removed
+          methods: dict of lookup functions by name (default:
+                   lookupd.get_methods())
+          cache_ttl: seconds to cache results of lookupd.CACHEABLE methods
+        """
+        self.methods = methods if methods is not None else lookupd.get_methods()
+        self.cache_ttl = cache_ttl
+        # (method, args) -> (expiry time, result)
+        self._cache = {}
+        self._cache_lock = threading.Lock()
+        # held while running a lookupd.SERIALIZED method
+        self._bss_lock = threading.Lock()
+        if os.path.exists(path):
+            os.remove(path)
+        socketserver.UnixStreamServer.__init__(self, path, _LookupHandler)
+        # FreeSWITCH doesn't run as the same user as the endaga daemons.
+        os.chmod(path, 0o666)
+
+    def server_close(self):
+        socketserver.UnixStreamServer.server_close(self)
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+
+    def dispatch(self, line):
+        """Runs the lookup described by a request line.
+
+        Returns the encoded response line.
+        """
+        try:
+            request = json.loads(line.decode('utf-8'))
+            method = request['method']
+            args = request.get('args', [])
+            response = {'result': self.lookup(method, args)}
+        except Exception as e:
+            if not isinstance(e, SubscriberNotFound):
+                logger.error("lookupd: request %s failed: %s" % (line, e))
+            response = {'error': e.__class__.__name__, 'message': str(e)}
+        return json.dumps(response).encode('utf-8') + b'\n'
+
+    def lookup(self, method, args):
+        func = self.methods[method]
+        if method not in lookupd.CACHEABLE or not self.cache_ttl:
+            return self._run(method, func, args)
+        key = (method, tuple(args))
+        now = time.time()
+        with self._cache_lock:
+            cached = self._cache.get(key)
+        if cached and cached[0] > now:
+            return cached[1]
+        result = self._run(method, func, args)
+        with self._cache_lock:
+            if len(self._cache) > 10000:
+                self._cache.clear()
+            self._cache[key] = (now + self.cache_ttl, result)
+        return result
+
+    def _run(self, method, func, args):
+        if method not in lookupd.SERIALIZED:
+            return func(*args)
+        with self._bss_lock:
+            return func(*args)
+
+
+def main():
+    """Main routine run by endaga-lookupd."""
+    from core.config_database import ConfigDB
+    ConfigDB.enable_cache()
+    conf = ConfigDB()
+    server = LookupServer(cache_ttl=conf.get('lookupd.cache_ttl', 10))
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
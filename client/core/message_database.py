@@ -10,63 +10,99 @@ LICENSE file in the root directory of this source tree. An additional grant
 of patent rights can be found in the PATENTS file in the same directory.
 """
 
-import os
+import collections
+import threading
 
-import psycopg2
+from core.db import ConnectorFactory
+from core.db.connector import DatabaseError
 
 
-# In our CI system, Postgres credentials are stored in env vars.
-PG_USER = os.environ.get('PG_USER', 'endaga')
-PG_PASSWORD = os.environ.get('PG_PASSWORD', 'endaga')
+class MessageDB(object):
+    """Remembers the last max_len inbound message ids.
 
+    Federer creates a MessageDB per request and runs as several processes,
+    so the ids are kept in the endaga_msgid table that they all share. Each
+    process also keeps the ids it has recently seen in memory, so repeats it
+    has already seen don't cost a query, and new ids cost one.
+    """
 
-class MessageDB(object):
-    def __init__(self, max_len=5000):
+    # msgids, least recently seen first; shared by the MessageDBs of a
+    # process
+    _recent = collections.OrderedDict()
+    _recent_lock = threading.Lock()
+
+    def __init__(self, max_len=5000, connector=None, trim_interval=None):
+        """
+        Args:
+          max_len: number of ids to remember
+          connector: the db connector to use
+          trim_interval: old ids are dropped from the table once per this
+                         many new ids (default: a tenth of max_len)
+        """
         self.max_len = max_len
-        self.conn = psycopg2.connect(host='localhost', database='endaga',
-                                     user=PG_USER, password=PG_PASSWORD)
+        self.trim_interval = trim_interval or max(1, max_len // 10)
+        self._connector = (connector or
+                           ConnectorFactory.get_psycopg_connector())
         self._createdb()
 
     def __contains__(self, msgid):
-        cur = self.conn.cursor()
-        try:
-            cur.execute("SELECT msgid FROM endaga_msgid WHERE msgid=%s;",
-                        (msgid,))
-            if cur.fetchone() is None:
-                return False
+        if self._recently_seen(msgid):
             return True
-        except (psycopg2.ProgrammingError, IndexError):
+        try:
+            return bool(self._connector.exec_and_get_option(
+                "SELECT msgid FROM endaga_msgid WHERE msgid=%s;", (msgid,)))
+        except DatabaseError:
             return False
 
     def _createdb(self):
-        cur = self.conn.cursor()
-        cur.execute("CREATE TABLE IF NOT EXISTS endaga_msgid(id serial PRIMARY"
-                    " KEY, msgid text UNIQUE NOT NULL);")
-        self.conn.commit()
+        self._connector.exec_stmt(
+            "CREATE TABLE IF NOT EXISTS endaga_msgid(id serial PRIMARY"
+            " KEY, msgid text UNIQUE NOT NULL);")
 
-    def resize(self, most_recent_id, commit=False):
+    def _recently_seen(self, msgid):
+        with self._recent_lock:
+            if msgid not in self._recent:
+                return False
+            self._recent.pop(msgid)
+            self._recent[msgid] = None
+            return True
+
+    def _remember(self, msgid):
+        with self._recent_lock:
+            self._recent.pop(msgid, None)
+            self._recent[msgid] = None
+            while len(self._recent) > self.max_len:
+                self._recent.popitem(last=False)
+
+    def _resize(self, cur, most_recent_id):
+        cur.execute("DELETE FROM endaga_msgid WHERE id <= %s;",
+                    (most_recent_id - self.max_len,))
+
+    def resize(self, most_recent_id):
         """Drops any records with ids at least max_len less than the current
         highest id.
         """
-        cur = self.conn.cursor()
-        cur.execute("DELETE FROM endaga_msgid WHERE id <= %s;",
-                    (most_recent_id - self.max_len,))
-        if commit:
-            self.conn.commit()
+        self._connector.with_cursor(self._resize, most_recent_id)
 
     def seen(self, msgid):
         """Returns True if the msgid has been seen before and False otherwise.
 
         As a side effect, adds the msgid to the DB if it hasn't been seen
-        before and calls resize.
+        before. Every trim_interval ids, calls resize. Ids are numbered by
+        the table, so that's done by one process even if there are several.
         """
-        if self.__contains__(msgid):
+        if self._recently_seen(msgid):
             return True
-        else:
-            cur = self.conn.cursor()
-            cur.execute("INSERT INTO endaga_msgid (msgid) VALUES(%s) RETURNING"
-                        " id;", (msgid,))
-            max_id = int(cur.fetchone()[0])
-            self.resize(max_id)
-            self.conn.commit()
-            return False
+
+        def worker(cur):
+            # If another process added the msgid first, there's no new row.
+            cur.execute("INSERT INTO endaga_msgid (msgid) VALUES(%s)"
+                        " ON CONFLICT (msgid) DO NOTHING RETURNING id;",
+                        (msgid,))
+            row = cur.fetchone()
+            if row and row[0] % self.trim_interval == 0:
+                self._resize(cur, row[0])
+            return row
+        row = self._connector.with_cursor(worker)
+        self._remember(msgid)
+        return row is None
@@ -0,0 +1,149 @@
+"""Per-route request latency histograms.
+
+Federer runs as several FastCGI processes, so each process counts its
+requests in memory and periodically adds the counts to a shared table, from
+which the checkin reports (and resets) them.
+
+Copyright (c) 2016-present, Facebook, Inc.
+All rights reserved.
+
+This source code is licensed under the BSD-style license found in the
+LICENSE file in the root directory of this source tree. An additional grant
+of patent rights can be found in the PATENTS file in the same directory.
+"""
+
+import bisect
+import collections
+import threading
+import time
+
+from ccm.common import logger
+from core.db import ConnectorFactory
+
+
+# Upper bounds of the latency buckets, in seconds.
+BOUNDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BUCKETS = ['le_%g' % b for b in BOUNDS] + ['le_inf']
+
+
+def summarize(counts):
+    """Summarizes the histogram of a route.
+
+    Args:
+      counts: dict with the count of each bucket in BUCKETS, the number of
+              'rejected' requests and the 'sum' of latencies
+
+    Returns a dict with the request count, rejected count, mean latency,
+    the 50th and 95th percentile latencies (estimated as the upper bound of
+    the bucket they fall in, or the largest bound if they're beyond it) and
+    the count of each bucket.
+    """
+    buckets = [int(counts.get(b, 0)) for b in BUCKETS]
+    total = sum(buckets)
+    summary = {
+        'count': total,
+        'rejected': int(counts.get('rejected', 0)),
+    }
+    if total:
+        summary['mean'] = counts.get('sum', 0) / total
+        for name, p in (('p50', 0.5), ('p95', 0.95)):
+            rank, seen = p * total, 0
+            for i, count in enumerate(buckets):
+                seen += count
+                if seen >= rank:
+                    break
+            summary[name] = BOUNDS[min(i, len(BOUNDS) - 1)]
+    summary.update(zip(BUCKETS, buckets))
+    return summary
+
+
+class RequestStats(object):
+    """Counts the requests handled by a process, by route.
+
+    Counts are added to the request_stats table every flush_period seconds:
+    on the next request after that, or by a background thread if the
+    process is idle, so that each checkin reports the requests handled
+    since the last one.
+    """
+
+    TABLE = 'request_stats'
+
+    def __init__(self, flush_period=10, connector=None):
+        self.flush_period = flush_period
+        self._connector = (connector or
+                           ConnectorFactory.get_psycopg_connector())
+        self._connector.exec_stmt(
+            "CREATE TABLE IF NOT EXISTS %s("
+            " route text, key text, value double precision,"
+            " PRIMARY KEY (route, key));" % self.TABLE)
+        self._lock = threading.Lock()
+        # (route, bucket or 'rejected' or 'sum') -> value
+        self._counts = collections.Counter()
+        self._last_flush = time.time()
+        self._flusher = None  # started on the first request
+
+    def record(self, route, latency, rejected=False):
+        """Counts a request.
+
+        Args:
+          route: name of the route
+          latency: seconds taken to handle the request, or to reject it
+          rejected: whether the request was rejected rather than handled
+        """
+        with self._lock:
+            if self._flusher is None:
+                self._flusher = threading.Thread(
+                    target=self._flush_periodically, name='RequestStats')
+                self._flusher.daemon = True
+                self._flusher.start()
+            if rejected:
+                self._counts[(route, 'rejected')] += 1
+            else:
+                bucket = BUCKETS[bisect.bisect_left(BOUNDS, latency)]
+                self._counts[(route, bucket)] += 1
+                self._counts[(route, 'sum')] += latency
+            due = time.time() - self._last_flush >= self.flush_period
+        if due:
+            self.flush()
+
+    def _flush_periodically(self):
+        while True:
+            time.sleep(max(self.flush_period, 0.1))
+            if time.time() - self._last_flush >= self.flush_period:
+                self.flush()
+
+    def flush(self):
+        """Adds the counts so far to the table."""
+        with self._lock:
+            counts, self._counts = self._counts, collections.Counter()
+            self._last_flush = time.time()
+        if not counts:
+            return
+
+        def worker(cur):
+            values = b",".join(cur.mogrify("(%s, %s, %s)", key + (value, ))
+                               for key, value in sorted(counts.items()))
+            cur.execute(
+                b"INSERT INTO " + self.TABLE.encode('utf-8') +
+                b" AS s (route, key, value) VALUES " + values +
+                b" ON CONFLICT (route, key) DO UPDATE"
+                b" SET value = s.value + EXCLUDED.value;")
+        try:
+            self._connector.with_cursor(worker)
+        except Exception as e:
+            logger.warning("request stats: flush failed: %s" % e)
+            # keep them for the next flush
+            with self._lock:
+                self._counts.update(counts)
+
+    def pop(self):
+        """Removes the counts of all processes from the table.
+
+        Returns a dict of summaries (see summarize) keyed by route.
+        """
+        rows = self._connector.exec_and_fetch(
+            "DELETE FROM %s RETURNING route, key, value;" % self.TABLE)
+        routes = collections.defaultdict(dict)
+        for route, key, value in rows:
+            routes[route][key] = value
+        return {route: summarize(counts) for route, counts in routes.items()}
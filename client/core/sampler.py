@@ -0,0 +1,128 @@
+"""Background sampling of BTS load, noise and system utilization.
+
+Load and noise can vary quite a bit over a checkin interval, so rather than
+sending one point sample with each checkin we poll them periodically into
+fixed-size ring buffers and send a summary of the window.
+
+Copyright (c) 2016-present, Facebook, Inc.
+All rights reserved.
+
+This source code is licensed under the BSD-style license found in the
+LICENSE file in the root directory of this source tree. An additional grant
+of patent rights can be found in the PATENTS file in the same directory.
+"""
+
+import collections
+import math
+import numbers
+import threading
+
+from ccm.common import logger
+
+
+def summarize(values):
+    """Gets the min, mean, median and 95th percentile of some values.
+
+    The percentile is nearest-rank, so it's always one of the values.
+    """
+    ordered = sorted(values)
+    n = len(ordered)
+    mid = n // 2
+    if n % 2:
+        median = ordered[mid]
+    else:
+        median = (ordered[mid - 1] + ordered[mid]) / 2.0
+    return {
+        'min': ordered[0],
+        'mean': sum(ordered) / float(n),
+        'median': median,
+        'p95': ordered[int(math.ceil(0.95 * n)) - 1],
+    }
+
+
+class Sampler(object):
+    """Polls sources of numeric stats on a background thread.
+
+    Each source is a function returning a dict of stats, e.g. bts.get_load.
+    The last `window` values of each stat are kept.
+    """
+
+    def __init__(self, sources, period=5, window=12):
+        """
+        Args:
+          sources: dict of source functions by name
+          period: seconds between samples
+          window: number of samples to keep of each stat
+        """
+        self.sources = sources
+        self.period = period
+        self.window = window
+        # (source, stat) -> deque of the latest values
+        self._buffers = {}
+        self._lock = threading.Lock()
+        self._failing = set()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='sampler')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.sample()
+            self._stop.wait(self.period)
+
+    def sample(self):
+        """Takes one sample from each source."""
+        for name, source in list(self.sources.items()):
+            try:
+                stats = source()
+            except Exception as e:
+                # only log when a source starts failing, not every period
+                if name not in self._failing:
+                    logger.warning("sampler: %s failed: %s" % (name, e))
+                    self._failing.add(name)
+                continue
+            self._failing.discard(name)
+            with self._lock:
+                for key, value in stats.items():
+                    if (not isinstance(value, numbers.Real) or
+                            isinstance(value, bool)):
+                        continue
+                    buf = self._buffers.get((name, key))
+                    if buf is None:
+                        buf = collections.deque(maxlen=self.window)
+                        self._buffers[(name, key)] = buf
+                    buf.append(value)
+
+    def summary(self, name):
+        """Summarizes the samples from a source.
+
+        Returns a dict with the median of each stat under its own key, so
+        existing consumers see a smoothed value, and the full summary under
+        <key>.min, <key>.mean, <key>.median and <key>.p95. The dict is empty
+        if there are no samples.
+        """
+        with self._lock:
+            samples = [(key, list(buf))
+                       for (source, key), buf in self._buffers.items()
+                       if source == name and buf]
+        result = {}
+        for key, values in samples:
+            stats = summarize(values)
+            result[key] = stats['median']
+            for stat, value in stats.items():
+                result['%s.%s' % (key, stat)] = value
+        return result
@@ -25,7 +25,8 @@ class OpenBTSSubscriber(BaseSubscriber):
         self.conf = ConfigDB()
         self.sip_auth_serve = openbts.components.SIPAuthServe(
             socket_timeout=self.conf['bss_timeout'],
-            cli_timeout=self.conf['bss_timeout'])
+            cli_timeout=self.conf['bss_timeout'],
+            persistent_cli=True)
 
     def add_subscriber_to_hlr(self, imsi, number, ip, port):
         """Adds a subscriber to the system."""
@@ -48,11 +49,23 @@ class OpenBTSSubscriber(BaseSubscriber):
     def get_subscribers(self, imsi=None):
         """Get subscribers, filter by IMSI if it's specified."""
         try:
+            if imsi is None:
+                return self.sip_auth_serve.get_all_subscribers()
             return self.sip_auth_serve.get_subscribers(imsi=imsi)
         except Exception:
             exc_type, exc_value, exc_trace = sys.exc_info()
             raise BSSError("%s: %s" % (exc_type, exc_value)).with_traceback(exc_trace)
 
+    def get_subscriber_imsis(self):
+        """Get a set of subscriber imsis, with a single SIPAuthServe read."""
+        try:
+            subs = self.sip_auth_serve.get_all_subscribers(
+                include_numbers=False)
+        except Exception:
+            exc_type, exc_value, exc_trace = sys.exc_info()
+            raise BSSError("%s: %s" % (exc_type, exc_value)).with_traceback(exc_trace)
+        return {s['name'] for s in subs}
+
     def add_number(self, imsi, number):
         """Associate another number with an IMSI.
 
@@ -18,22 +18,17 @@ of patent rights can be found in the PATENTS file in the same directory.
 
 
 
-import os
 import sys
 
-import psycopg2
 from osmocom.vty.subscribers import Subscribers
 
+from ccm.common import logger
 from core import number_utilities
 from core.config_database import ConfigDB
 from core.subscriber.base import BaseSubscriber, SubscriberNotFound
 from core.exceptions import BSSError
 
 
-# In our CI system, Postgres credentials are stored in env vars.
-PG_USER = os.environ.get('PG_USER', 'endaga')
-PG_PASSWORD = os.environ.get('PG_PASSWORD', 'endaga')
-
 class OsmocomSubscriber(BaseSubscriber):
 
     def __init__(self):
@@ -42,7 +37,7 @@ class OsmocomSubscriber(BaseSubscriber):
         self.subscribers = Subscribers(host=self.conf['bts.osmocom.ip'],
             port=self.conf['bts.osmocom.bsc_vty_port'],
             hlr_loc=self.conf['bts.osmocom.hlr_loc'],
-            timeout=self.conf['bss_timeout'])
+            timeout=self.conf['bss_timeout'], pooled=True)
 
     def add_subscriber_to_hlr(self, imsi, number, ip, port):
         """Adds a subscriber to the system.
@@ -65,44 +60,82 @@ class OsmocomSubscriber(BaseSubscriber):
             exc_type, exc_value, exc_trace = sys.exc_info()
             raise BSSError("%s: %s" % (exc_type, exc_value)).with_traceback(exc_trace)
 
+    def add_subscribers_to_hlr(self, subs):
+        """Adds several subscribers over a single VTY session.
+
+        Osmocom only supports one number per IMSI, so any others are
+        ignored. Returns the set of IMSIs that could not be added.
+        """
+        failed = set(subs)
+        try:
+            with self.subscribers as s:
+                for imsi, numbers in subs.items():
+                    try:
+                        try:
+                            s.show('imsi', imsi)
+                        except ValueError:
+                            s.create(imsi)
+                        s.set_extension(imsi, numbers[0])
+                        s.set_authorized(imsi, 1)
+                    except ValueError as e:
+                        logger.error("HLR add fail! IMSI: %s Error: %s" %
+                                     (imsi, e))
+                        continue
+                    if len(numbers) > 1:
+                        logger.warning("only one number per imsi: %s" %
+                                       imsi)
+                    failed.discard(imsi)
+        except Exception as e:
+            logger.error("HLR add fail! %d IMSIs not added: %s" %
+                         (len(failed), e))
+        return failed
+
+    def delete_subscribers_from_hlr(self, imsis):
+        """Removes several subscribers over a single VTY session.
+
+        Returns the set of IMSIs that could not be removed.
+        """
+        failed = set(imsis)
+        try:
+            with self.subscribers as s:
+                for imsi in imsis:
+                    try:
+                        s.delete(imsi)
+                    except ValueError:
+                        pass  # not in the HLR
+                    failed.discard(imsi)
+        except Exception as e:
+            logger.error("HLR delete fail! %d IMSIs not removed: %s" %
+                         (len(failed), e))
+        return failed
+
     def get_subscribers(self, imsi=''):
         """Get subscriber by imsi."""
         imsi = imsi + "%"
         subscribers = []
-        with psycopg2.connect(host='localhost', database='endaga', user=PG_USER,
-                password=PG_PASSWORD) as connection:
-            with connection.cursor() as cursor:
-                cursor.execute(
-                    "SELECT imsi, balance FROM subscribers WHERE imsi LIKE %s", (imsi,))
-                try:
-                    with self.subscribers as s:
-                        for row in cursor.fetchall():
-                            sub_record = s.show('imsi', row[0])
-                            if len(sub_record):
-                                subscribers.append({
-                                    'account_balance': row[1],
-                                    'name': row[0], # interface describes name as IMSI
-                                    'port': self.get_port(row[0]),
-                                    'ipaddr': self.get_ip(row[0]),
-                                    'caller_id': sub_record['extension'],
-                                    'numbers': [sub_record['extension']]})
-                except Exception:
-                    exc_type, exc_value, exc_trace = sys.exc_info()
-                    raise BSSError("%s: %s" % (exc_type, exc_value)).with_traceback(exc_trace)
+        rows = self._connector.exec_and_fetch(
+            "SELECT imsi, balance FROM subscribers WHERE imsi LIKE %s", (imsi,))
+        try:
+            with self.subscribers as s:
+                for row in rows:
+                    sub_record = s.show('imsi', row[0])
+                    if len(sub_record):
+                        subscribers.append({
+                            'account_balance': row[1],
+                            'name': row[0], # interface describes name as IMSI
+                            'port': self.get_port(row[0]),
+                            'ipaddr': self.get_ip(row[0]),
+                            'caller_id': sub_record['extension'],
+                            'numbers': [sub_record['extension']]})
+        except Exception:
+            exc_type, exc_value, exc_trace = sys.exc_info()
+            raise BSSError("%s: %s" % (exc_type, exc_value)).with_traceback(exc_trace)
         return subscribers
 
     def get_subscriber_imsis(self):
         """Get a set of subscriber imsis."""
-        with psycopg2.connect(host='localhost', database='endaga', user=PG_USER,
-                              password=PG_PASSWORD) as connection:
-            with connection.cursor() as cursor:
-                cursor.execute("SELECT imsi FROM subscribers")
-                try:
-                    return {row[0] for row in cursor.fetchall()}
-                except Exception:
-                    exc_type, exc_value, exc_trace = sys.exc_info()
-                    raise BSSError("%s: %s" % (exc_type, exc_value)).with_traceback(exc_trace)
-        return set()
+        rows = self._connector.exec_and_fetch("SELECT imsi FROM subscribers")
+        return {row[0] for row in rows}
 
     def add_number(self, imsi, number):
         """Associate another number with an IMSI.
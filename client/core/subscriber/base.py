@@ -22,20 +22,24 @@ import dateutil.parser as dateparser
 
 from ccm.common import crdt, logger
 from core.db.kvstore import KVStore
-from core.exceptions import SubscriberNotFound, EventNotFound
+from core.exceptions import BSSError, EventNotFound, SubscriberNotFound
 from core.freeswitch_strings import BASE_MESSAGES
 from itertools import count
 
 
 class BaseSubscriber(KVStore):
 
+    # The balances the cloud sent in its last checkin response, i.e., the
+    # state it has acknowledged. Shared by every instance in the process.
+    _acked = {}
+
     def __init__(self, connector=None):
 
         super(BaseSubscriber, self).__init__('subscribers', connector,
                                              key_name='imsi',
                                              val_name='balance')
 
-    def get_subscriber_states(self, imsis=None):
+    def get_subscriber_states(self, imsis=None, deltas=False):
         """
         Return a dictionary containing all the subscriber info.  Format is:
 
@@ -46,6 +50,10 @@ class BaseSubscriber(KVStore):
         Args:
             imsis: A list of IMSIs to get state for. If None, returns
                    everything.
+            deltas: If True, balances the cloud has acknowledged are
+                    replaced by their delta from that state, and left out
+                    if there is none. Merging the delta into the cloud's
+                    balance has the same result as merging the whole one.
         Returns: if imsis is None => return ALL subscribers
                  imsis is an empty list [] => return an empty dictionary
                  otherwise => return information about the subscribers listed
@@ -61,6 +69,17 @@ class BaseSubscriber(KVStore):
 
         res = {}
         for (imsi, balance) in subs:
+            if deltas and imsi in self._acked:
+                try:
+                    delta = crdt.PNCounter.from_json(balance).delta(
+                        self._acked[imsi])
+                except ValueError as e:
+                    logger.error("Balance delta fail! IMSI: %s, %s Error: %s"
+                                 % (imsi, balance, e))
+                else:
+                    if not delta.is_used():
+                        continue
+                    balance = delta.serialize()
             res[imsi] = {}
             # ship this as json string straight from db
             res[imsi]['balance'] = balance
@@ -306,6 +325,49 @@ class BaseSubscriber(KVStore):
         """
         raise NotImplementedError()
 
+    def add_subscribers_to_hlr(self, subs):
+        """Adds several subscribers to the radio stack HLR.
+
+        Failures are logged rather than raised, so that one bad subscriber
+        doesn't hold up the others.
+
+        Arguments:
+            subs: dict of lists of numbers (e164, minus the leading +) by
+                  IMSI; the first number is the subscriber's caller ID
+
+        Returns: the set of IMSIs that could not be added
+        """
+        failed = set()
+        for imsi, numbers in subs.items():
+            try:
+                self.add_subscriber_to_hlr(imsi, numbers[0], None, None)
+                for n in numbers[1:]:
+                    self.add_number(imsi, n)
+            except BSSError as e:
+                logger.error("HLR add fail! IMSI: %s Error: %s" % (imsi, e))
+                failed.add(imsi)
+        return failed
+
+    def delete_subscribers_from_hlr(self, imsis):
+        """Removes several subscribers from the radio stack HLR.
+
+        Subscribers that aren't in the HLR are ignored; other failures are
+        logged rather than raised.
+
+        Returns: the set of IMSIs that could not be removed
+        """
+        failed = set()
+        for imsi in imsis:
+            try:
+                self.delete_subscriber_from_hlr(imsi)
+            except SubscriberNotFound:
+                pass
+            except BSSError as e:
+                logger.error("HLR delete fail! IMSI: %s Error: %s" %
+                             (imsi, e))
+                failed.add(imsi)
+        return failed
+
     def get_subscribers(self, imsi=None):
         """Gets the list of subscribers that are provisioned in the GSM
            stacks HLR, filtering by the prefix, imsi, if specified.
@@ -445,6 +507,11 @@ class BaseSubscriber(KVStore):
         This updates the BTS with all subscribers instructed by the cloud; any
         subscribers that are not reported by the cloud will be removed from
         this BTS.
+
+        HLR changes are made in batches, then all balances are merged and
+        written in a single transaction; only rows whose counter actually
+        changed are written. The cloud's balances are kept as the state it
+        has acknowledged, for get_subscriber_states(deltas=True).
         """
         # dict where keys are imsis and values are sub info
         bts_imsis = self.get_subscriber_imsis()
@@ -454,39 +521,61 @@ class BaseSubscriber(KVStore):
         subs_to_delete = bts_imsis.difference(net_imsis)
         subs_to_update = bts_imsis.intersection(net_imsis)
 
-        for imsi in subs_to_delete:
-            self.delete_subscriber(imsi)
+        # keep the balance of subs we failed to remove from the HLR
+        subs_to_delete -= self.delete_subscribers_from_hlr(subs_to_delete)
 
         # TODO(shasan) does not add new numbers
-        for imsi in subs_to_update:
-            sub = net_subs[imsi]
-            try:
-                bal = crdt.PNCounter.from_state(sub['balance'])
-                self.update_balance(imsi, bal)
-            except SubscriberNotFound as e:
-                logger.warning(
-                    "Balance sync fail! IMSI: %s is not found Error: %s" %
-                    (imsi, e))
-            except ValueError as e:
-                logger.error("Balance sync fail! IMSI: %s, %s Error: %s" %
-                             (imsi, sub['balance'], e))
-                subs_to_add.add(imsi)  # try to add it (again)
-
+        new_subs = {}
         for imsi in subs_to_add:
-            sub = net_subs[imsi]
-            numbers = sub['numbers']
+            numbers = net_subs[imsi]['numbers']
             if not numbers:
                 logger.notice("IMSI with no numbers? %s" % imsi)
                 continue
-            self.create_subscriber(imsi, numbers[0])
-            for n in numbers[1:]:
-                self.add_number(imsi, n)
+            new_subs[imsi] = numbers
+        subs_to_add = set(new_subs) - self.add_subscribers_to_hlr(new_subs)
+
+        balances = {}
+        for imsi in subs_to_update | subs_to_add:
+            sub = net_subs[imsi]
             try:
-                bal = crdt.PNCounter.from_state(sub['balance'])
-                self.update_balance(imsi, bal)
-            except (SubscriberNotFound, ValueError) as e:
+                balances[imsi] = crdt.PNCounter.from_state(sub['balance'])
+            except ValueError as e:
                 logger.error("Balance sync fail! IMSI: %s, %s Error: %s" %
-                                (imsi, sub['balance'], e))
+                             (imsi, sub['balance'], e))
+        BaseSubscriber._acked = balances
+
+        # TODO(shasan): this needs SERIALIZABLE isolation level for correctness
+        def _sync(cur):
+            current = self._get_many(cur, subs_to_update | subs_to_add,
+                                     lock=True)
+            changed = []
+            for imsi in subs_to_update | subs_to_add:
+                if imsi in current:
+                    # subs being added may be known locally but missing from
+                    # the HLR, so merge into their balance too
+                    if imsi not in balances:
+                        continue
+                    try:
+                        bal = crdt.PNCounter.from_json(current[imsi])
+                    except ValueError as e:
+                        logger.error(
+                            "Balance sync fail! IMSI: %s, %s Error: %s" %
+                            (imsi, current[imsi], e))
+                        continue
+                    new_bal = crdt.PNCounter.merge(bal, balances[imsi])
+                    if new_bal.state == bal.state:
+                        continue
+                elif imsi in subs_to_update:
+                    logger.warning(
+                        "Balance sync fail! IMSI: %s is not found" % imsi)
+                    continue
+                else:
+                    new_bal = balances.get(imsi, crdt.PNCounter())
+                changed.append((imsi, new_bal.serialize()))
+            self._upsert_many(cur, changed)
+            self._delete_many(cur, subs_to_delete)
+
+        self._write(_sync)
 
     def status(self, update=None):
         status = BaseSubscriberStatus()
@@ -575,65 +664,52 @@ class BaseSubscriberStatus(KVStore):
         return {key for key in self.get_subscriber_status().keys()}
 
     def process_update(self, net_subs):
+        """
+        Syncs subscriber states with the cloud: the balance of subscribers
+        that aren't active is zeroed, and all state changes are written in
+        one transaction.
+        """
         from core import events
-        bts_imsis = self.get_subscriber_imsis()
-        net_imsis = set(net_subs.keys())
-        subs_to_add = net_imsis.difference(bts_imsis)
-        subs_to_delete = bts_imsis.difference(net_imsis)
-        subs_to_update = bts_imsis.intersection(net_imsis)
+        current = dict(self.items())
         subscriber = BaseSubscriber()
 
-        for imsi in subs_to_delete:
-            self.delete_subscriber(imsi)
-
-        for imsi in subs_to_update:
-            sub = net_subs[imsi]
-            sub_state = sub['state']
-            sub_validity = sub['validity']
-            sub_info = {"state": sub_state, "validity": sub_validity}
-            # Error Transfer Count this won't sync to cloud
-            if 'ie_count' not in sub:
-                sub['ie_count'] = 0
-
-            sub_info = {"state": sub_state, "validity": sub_validity,
-                        "ie_count": sub['ie_count']}
-            try:
-                if str(sub_state).lower() not in ['active', 'active*']:
-                    old_balance = subscriber.get_account_balance(imsi)
-                    if old_balance > 0:
-                        subscriber.subtract_credit(imsi, str(old_balance))
-                        reason = 'Subscriber expired: Setting balance zero' \
-                                 ' (deduct_money)'
-                        events.create_add_money_event(imsi, old_balance, 0,
-                                                      reason)
-                self.update_status(imsi, json.dumps(sub_info))
-            except SubscriberNotFound as e:
+        expired = [imsi for imsi, sub in net_subs.items()
+                   if str(sub['state']).lower() not in ['active', 'active*']]
+        balances = dict(subscriber.get_multiple(expired))
+
+        changed = []
+        for imsi, sub in net_subs.items():
+            sub_info = {"state": sub['state'], "validity": sub['validity']}
+            if imsi in current:
+                # Error Transfer Count this won't sync to cloud
+                sub_info['ie_count'] = sub.get('ie_count', 0)
+            if imsi in balances:
+                try:
+                    old_balance = int(
+                        crdt.PNCounter.from_json(balances[imsi]).value())
+                except ValueError as e:
+                    logger.error("State sync fail! IMSI: %s, %s Error: %s" %
+                                 (imsi, sub_info, e))
+                    continue
+                if old_balance > 0:
+                    subscriber.subtract_credit(imsi, str(old_balance))
+                    reason = 'Subscriber expired: Setting balance zero' \
+                             ' (deduct_money)'
+                    events.create_add_money_event(imsi, old_balance, 0,
+                                                  reason)
+            elif imsi in expired:
                 logger.warning(
-                    "State sync fail! IMSI: %s is not found Error: %s" %
-                    (imsi, e))
-            except ValueError as e:
-                logger.error("State sync fail! IMSI: %s, %s Error: %s" %
-                             (imsi, sub_info, e))
-                subs_to_add.add(imsi)  # try to add it (again)
+                    "State sync fail! IMSI: %s is not found" % imsi)
+                continue
+            status = json.dumps(sub_info)
+            if current.get(imsi) != status:
+                changed.append((imsi, status))
 
-        for imsi in subs_to_add:
-            sub = net_subs[imsi]
-            sub_state = sub['state']
-            sub_validity = sub['validity']
-            sub_info = {"state": sub_state, "validity": sub_validity}
-            try:
-                if str(sub_state).lower() not in ['active', 'active*']:
-                    old_balance = subscriber.get_account_balance(imsi)
-                    if old_balance > 0:
-                        subscriber.subtract_credit(imsi, str(old_balance))
-                        reason = 'Subscriber expired:setting balance zero' \
-                                 ' (deduct_money)'
-                        events.create_add_money_event(imsi, old_balance, 0,
-                                                      reason)
-                self.create_subscriber_status(imsi, json.dumps(sub_info))
-            except (SubscriberNotFound, ValueError) as e:
-                logger.error("State sync fail! IMSI: %s, %s Error: %s" %
-                             (imsi, sub_info, e))
+        def _sync(cur):
+            self._upsert_many(cur, changed)
+            self._delete_many(cur, set(current) - set(net_subs))
+
+        self._write(_sync)
 
     def get_account_status(self, imsi):
         status = json.loads(self.get(imsi))
@@ -9,16 +9,18 @@ LICENSE file in the root directory of this source tree. An additional grant
 of patent rights can be found in the PATENTS file in the same directory.
 """
 
+import bisect
+import collections
 from datetime import datetime
 from datetime import timedelta
 import glob
 import gzip
+import json
 import os
 import re
 import subprocess
 
 import dateutil.parser
-import dateutil.tz
 import delegator
 import netifaces
 import psutil
@@ -27,7 +29,180 @@ import pytz
 from ccm.common import logger
 from core.config_database import ConfigDB
 
-def log_stream(log_path, window_start=None, window_end=None):
+# Where log_stream keeps the checkpoint indexes of gzipped logs.
+LOG_INDEX_DIR = '/var/tmp/endaga-log-index'
+# Bytes of log between the checkpoints of a gzipped log's index.
+LOG_INDEX_INTERVAL = 1 << 20
+# The binary search of a plain log stops when its range is this small.
+LOG_SEEK_BLOCK = 1 << 16
+
+_EPOCH = datetime(1970, 1, 1)
+_EPOCH_UTC = datetime.fromtimestamp(0, pytz.utc)
+# RFC 3339, as written by rsyslog
+_LOG_TIME_RE = re.compile(
+    br'(\d{4})-(\d\d)-(\d\d)T(\d\d):(\d\d):(\d\d)(?:\.(\d+))?'
+    br'(?:Z|([+-])(\d\d):?(\d\d))$')
+
+
+def _log_time(msg):
+    """Returns the timestamp of a log entry in seconds since the epoch, or
+    None if it's unparseable or not timezone aware.
+
+    RFC 3339 timestamps are parsed directly, others by dateutil.
+    """
+    try:
+        token = msg.split(None, 1)[0]
+    except IndexError:
+        return None
+    match = _LOG_TIME_RE.match(token)
+    if match:
+        (year, month, day, hour, minute, second, fraction, sign, off_hour,
+         off_minute) = match.groups()
+        try:
+            entry_time = (datetime(int(year), int(month), int(day), int(hour),
+                                   int(minute), int(second)) -
+                          _EPOCH).total_seconds()
+        except ValueError:
+            return None
+        if fraction:
+            entry_time += float(b'.' + fraction)
+        if sign:
+            offset = int(off_hour) * 3600 + int(off_minute) * 60
+            entry_time += offset if sign == b'-' else -offset
+        return entry_time
+    try:
+        entry_time = dateutil.parser.parse(token.decode('utf-8', 'replace'))
+        return (entry_time - _EPOCH_UTC).total_seconds()
+    except (TypeError, ValueError, OverflowError):
+        # if timestamp isn't timezone aware, or unparseable skip it
+        return None
+
+
+def _seek_line(f, offset):
+    """Moves to the start of the first line at or after offset."""
+    if offset:
+        f.seek(offset - 1)
+        f.readline()
+    else:
+        f.seek(0)
+
+
+def _window_entries(f, start, end):
+    """Yields the entries of f from the current position that fall in
+    [start, end], stopping at the first one after end."""
+    for msg in f:
+        entry_time = _log_time(msg)
+        if entry_time is None:
+            continue
+        if entry_time > end:
+            return
+        if entry_time >= start:
+            yield msg
+
+
+def _plain_entries(fname, start, end):
+    """Yields the entries of a plain log in [start, end], finding the
+    first one by binary search on the file offset."""
+    with open(fname, 'rb') as f:
+        lo, hi = 0, os.fstat(f.fileno()).st_size
+        while hi - lo > LOG_SEEK_BLOCK:
+            mid = (lo + hi) // 2
+            _seek_line(f, mid)
+            entry_time = None
+            # look for a timestamp in the next block at most
+            while entry_time is None and f.tell() - mid < LOG_SEEK_BLOCK:
+                msg = f.readline()
+                if not msg:
+                    break
+                entry_time = _log_time(msg)
+            if entry_time is None or entry_time >= start:
+                hi = mid
+            else:
+                lo = mid
+        _seek_line(f, lo)
+        for msg in _window_entries(f, start, end):
+            yield msg
+
+
+def _gzip_index_name(log_name, fname):
+    # rotation renames archives, so they're known by inode, size and mtime
+    st = os.stat(fname)
+    return '%s@%d-%d-%d.json' % (log_name, st.st_ino, st.st_size,
+                                 int(st.st_mtime))
+
+
+def _build_gzip_index(fname):
+    """Reads a gzipped log and returns the timestamps of its first and last
+    entries, and checkpoints: the (offset, timestamp) of the first entry
+    after every LOG_INDEX_INTERVAL bytes of log.
+    """
+    points = []
+    tail = collections.deque(maxlen=100)
+    offset = next_point = 0
+    with gzip.open(fname, 'rb') as f:
+        for msg in f:
+            if offset >= next_point:
+                entry_time = _log_time(msg)
+                if entry_time is not None:
+                    points.append([offset, entry_time])
+                    next_point = offset + LOG_INDEX_INTERVAL
+            offset += len(msg)
+            tail.append(msg)
+    last = None
+    for msg in reversed(tail):
+        last = _log_time(msg)
+        if last is not None:
+            break
+    return {
+        'first': points[0][1] if points else None,
+        'last': last,
+        'points': points,
+    }
+
+
+def _gzip_index(index_dir, name, fname):
+    """Returns the index of a gzipped log, building and saving it if there
+    isn't one yet."""
+    path = os.path.join(index_dir, name)
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        pass
+    index = _build_gzip_index(fname)
+    try:
+        os.makedirs(index_dir, exist_ok=True)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(index, f)
+        os.rename(path + '.tmp', path)
+    except OSError as e:
+        logger.warning("log_stream: can't save index of %s: %s" % (fname, e))
+    return index
+
+
+def _gzip_entries(fname, start, end, index):
+    """Yields the entries of a gzipped log in [start, end], skipping to the
+    last checkpoint before start if there's an index.
+
+    Seeking in a gzip file still decompresses the data skipped over, but
+    none of it is split into lines or parsed.
+    """
+    with gzip.open(fname, 'rb') as f:
+        if index is not None:
+            if index['first'] is None or index['first'] > end:
+                return
+            if index['last'] is not None and index['last'] < start:
+                return
+            times = [t for _, t in index['points']]
+            i = bisect.bisect_left(times, start) - 1
+            if i >= 0:
+                f.seek(index['points'][i][0])
+        for msg in _window_entries(f, start, end):
+            yield msg
+
+
+def log_stream(log_path, window_start=None, window_end=None,
+               index_dir=LOG_INDEX_DIR):
     """Given a path to a log file, this method returns an ordered
     stream of entries. This stream supports log rotation and archival
     assuming rotated logs have the same path followed by a dot suffix.
@@ -35,7 +210,13 @@ def log_stream(log_path, window_start=None, window_end=None):
     the log entries to a particular time window.
 
     All log entries must contain timestamps that contain no spaces and
-    must be timezone aware.
+    must be timezone aware, and the entries of each file must be in time
+    order. Entries are returned as bytes.
+
+    Plain logs are searched for the start of the window by binary search.
+    Gzipped logs are indexed the first time they are read (see
+    _build_gzip_index) so that later reads can skip the archives outside
+    the window and parts of the others.
 
     Arguments:
         log_path: the absolute path to the log
@@ -43,34 +224,45 @@ def log_stream(log_path, window_start=None, window_end=None):
             it is assumed from the beginning of time.
         window_end: a timezone aware datetime. If None is specified
             it is assumed until the current time.
+        index_dir: where to keep the indexes of gzipped logs, or None to
+            not index them
     """
-    def open_raw_or_gzip(fname, mode):
-        if fname[-3:] == '.gz':
-            return gzip.open(fname, mode)
-        else:
-            return open(fname, mode)
-
     if window_start is None:
         window_start = datetime.fromtimestamp(0, pytz.utc)
     if window_end is None:
         window_end = datetime.now(pytz.utc)
+    start = (window_start - _EPOCH_UTC).total_seconds()
+    end = (window_end - _EPOCH_UTC).total_seconds()
 
     fnames = glob.glob(log_path) + glob.glob("%s.*" % log_path)
     fnames.sort(key=os.path.getmtime)
-    fnames = [f for f in fnames if datetime.fromtimestamp(
-        os.path.getmtime(f), dateutil.tz.tzlocal()) >= window_start]
 
-    for fname in fnames:
-        with open_raw_or_gzip(fname, 'r') as f:
-            for msg in f:
+    log_name = os.path.basename(log_path)
+    index_names = {f: _gzip_index_name(log_name, f)
+                   for f in fnames if f[-3:] == '.gz'}
+    if index_dir is not None and os.path.isdir(index_dir):
+        # drop the indexes of archives that have been rotated away
+        current = set(index_names.values())
+        for name in os.listdir(index_dir):
+            if name.startswith(log_name + '@') and name not in current:
                 try:
-                    entry_time = dateutil.parser.parse(msg.split()[0])
-                    if window_start <= entry_time <= window_end:
-                        yield msg
-                except (TypeError, ValueError):
-                    # if timestamp isn't timezone aware, or unparseable skip it
+                    os.remove(os.path.join(index_dir, name))
+                except OSError:
                     pass
 
+    for fname in fnames:
+        if os.path.getmtime(fname) < start:
+            continue
+        if fname[-3:] == '.gz':
+            index = None
+            if index_dir is not None:
+                index = _gzip_index(index_dir, index_names[fname], fname)
+            entries = _gzip_entries(fname, start, end, index)
+        else:
+            entries = _plain_entries(fname, start, end)
+        for msg in entries:
+            yield msg
+
 def uptime():
     """
     Returns (whole) seconds since boot, or -1 if failure.
@@ -126,12 +318,21 @@ class SystemUtilizationTracker(object):
         self.last_bytes_sent = 0
         self.last_bytes_received = 0
 
-    def get_data(self):
-        """Gets system utilization stats."""
-        # Get system utilization stats.
-        cpu_percent = psutil.cpu_percent(interval=1)
-        memory_percent = psutil.virtual_memory().percent
-        disk_percent = psutil.disk_usage('/').percent
+    @staticmethod
+    def sample(cpu_interval=None):
+        """Gets CPU, memory and disk utilization.
+
+        With the default cpu_interval of None this doesn't block, and the CPU
+        utilization is measured since the previous call.
+        """
+        return {
+            'cpu_percent': psutil.cpu_percent(interval=cpu_interval),
+            'memory_percent': psutil.virtual_memory().percent,
+            'disk_percent': psutil.disk_usage('/').percent,
+        }
+
+    def get_network_deltas(self):
+        """Gets the bytes sent and received since the previous call."""
         network_io = psutil.net_io_counters()
         # Compute deltas for sent and received bytes.  Note this is system-wide
         # network usage and not necessarily GPRS-related.
@@ -148,13 +349,17 @@ class SystemUtilizationTracker(object):
                 network_io.bytes_recv - self.last_bytes_received)
         self.last_bytes_received = network_io.bytes_recv
         return {
-            'cpu_percent': cpu_percent,
-            'memory_percent': memory_percent,
-            'disk_percent': disk_percent,
             'bytes_sent_delta': bytes_sent_delta,
             'bytes_received_delta': bytes_received_delta,
         }
 
+    def get_data(self):
+        """Gets system utilization stats."""
+        # Get system utilization stats.
+        data = self.sample(cpu_interval=1)
+        data.update(self.get_network_deltas())
+        return data
+
 def upgrade_endaga(channel):
     """Upgrades the endaga metapackage."""
     # Validate.
@@ -26,6 +26,7 @@ from core.billing import get_sms_cost
 from core.billing import process_prices
 from core.billing import round_to_billable_unit
 from core.billing import round_up_to_nearest_100
+from core.billing import TariffTable
 from core import config_database
 
 TARIFF = 100
@@ -230,6 +231,44 @@ class GetPrefixFromNumberTest(unittest.TestCase):
         self.assertEqual('3', get_prefix_from_number(number))
 
 
+class TariffTableTest(unittest.TestCase):
+    """Testing core.billing.TariffTable."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.table = TariffTable([
+            ('prices.off_network_send.1.cost_to_subscriber_per_min', 10),
+            ('prices.off_network_send.1.cost_to_subscriber_per_sms', 1),
+            ('prices.off_network_send.1876.cost_to_subscriber_per_min', 20),
+            ('prices.off_network_send.1876.billable_unit', 30),
+            # no per-minute price, so this prefix is never matched
+            ('prices.off_network_send.18.cost_to_subscriber_per_sms', 5),
+            ('prices.off_network_send.123456.cost_to_subscriber_per_min', 40),
+            ('prices.on_network_send.cost_to_subscriber_per_min', 50),
+            ('free_seconds', 5),
+        ])
+
+    def test_longest_prefix(self):
+        """The longest matching prefix wins."""
+        tariff = self.table.lookup('off_network_send', '18765551234')
+        self.assertEqual(('1876', 20, None, 30), tariff)
+        tariff = self.table.lookup('off_network_send', '18005551234')
+        self.assertEqual(('1', 10, 1, None), tariff)
+
+    def test_prefix_length_limit(self):
+        """Only the first five digits of a number are matched."""
+        self.assertEqual('1', self.table.match('1234567890').prefix)
+
+    def test_no_match(self):
+        self.assertEqual(None, self.table.match('55512345'))
+        tariff = self.table.lookup('off_network_send', '55512345')
+        self.assertEqual((None, None, None, None), tariff)
+
+    def test_prefixless(self):
+        tariff = self.table.lookup('on_network_send', '18765551234')
+        self.assertEqual((None, 50, None, None), tariff)
+
+
 class RoundCostToBillableUnit(unittest.TestCase):
     """Testing core.billing.round_to_billable_unit."""
 
@@ -0,0 +1,80 @@
+"""Micro-benchmark of XML CDR parsing.
+
+Extracts the tags that federer's CDR handler bills from (see
+core.federer_handlers.cdr.CDR_TAGS) from each of the CDR fixtures, which
+are real FreeSWITCH CDRs, two ways: building a minidom DOM and searching it
+once per tag, as the handler used to; and with a single pass of
+ccm.common.utils.xml_cdr.parse_tags.
+
+Usage:
+    $ python -m core.tests.cdr_benchmark [iterations]
+
+Copyright (c) 2016-present, Facebook, Inc.
+All rights reserved.
+
+This source code is licensed under the BSD-style license found in the
+LICENSE file in the root directory of this source tree. An additional grant
+of patent rights can be found in the PATENTS file in the same directory.
+"""
+
+import glob
+import sys
+import time
+import xml.dom.minidom
+
+from ccm.common.utils.xml_cdr import parse_tags
+from core.federer_handlers.cdr import CDR_TAGS
+
+
+FIXTURES = 'core/tests/fixtures/*.xml'
+
+
+def dom_extract(cdr_xml):
+    dom = xml.dom.minidom.parseString(cdr_xml)
+    tags = {}
+    for tag_name in CDR_TAGS:
+        tags[tag_name] = [
+            (e.parentNode.nodeName,
+             ''.join(n.data for n in e.childNodes
+                     if n.nodeType == n.TEXT_NODE))
+            for e in dom.getElementsByTagName(tag_name)]
+    return tags
+
+
+def run(extract, cdrs, n):
+    """Extracts the tags from each CDR n times; returns per-CDR latencies."""
+    latencies = []
+    for _ in range(n):
+        for cdr_xml in cdrs:
+            start = time.time()
+            extract(cdr_xml)
+            latencies.append(time.time() - start)
+    return latencies
+
+
+def report(name, latencies):
+    latencies = sorted(latencies)
+    print("%-12s mean %8.3f ms  p50 %8.3f ms  p95 %8.3f ms" % (
+        name,
+        1000 * sum(latencies) / len(latencies),
+        1000 * latencies[len(latencies) // 2],
+        1000 * latencies[int(len(latencies) * 0.95)]))
+
+
+def main(n):
+    cdrs = []
+    for path in sorted(glob.glob(FIXTURES)):
+        with open(path) as f:
+            cdrs.append(f.read())
+    # Both should find the same tags.
+    for cdr_xml in cdrs:
+        expected = {k: v for k, v in dom_extract(cdr_xml).items() if v}
+        assert parse_tags(cdr_xml, CDR_TAGS) == expected
+    print("%d CDRs, %d bytes on average" % (
+        len(cdrs), sum(len(c) for c in cdrs) // len(cdrs)))
+    report('minidom', run(dom_extract, cdrs, n))
+    report('parse_tags', run(lambda c: parse_tags(c, CDR_TAGS), cdrs, n))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
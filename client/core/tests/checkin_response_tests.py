@@ -165,10 +165,14 @@ class SubscriberUpdateTest(unittest.TestCase):
             self.sub1: {
                 'numbers': ['123456'],
                 'balance': bal1,
+                'state': 'active',
+                'validity': '2099-01-01',
             },
             self.sub2: {
                 'numbers': ['765432'],
                 'balance': bal2,
+                'state': 'active',
+                'validity': '2099-01-01',
             }
         }
 
@@ -247,6 +251,28 @@ class SubscriberUpdateTest(unittest.TestCase):
         bal = crdt.PNCounter.from_state(json.loads(subs_post[self.sub1]['balance'])).value()
         self.assertEqual(20000, bal)
 
+    def test_sub_deltas(self):
+        """Only what the cloud hasn't acknowledged is sent back."""
+        self.test_sub_add()
+        subs = subscriber.get_subscriber_states(deltas=True)
+        self.assertEqual({}, subs)
+        subscriber.subtract_credit(self.sub1, 1000)
+        subs = subscriber.get_subscriber_states(deltas=True)
+        self.assertEqual([self.sub1], list(subs))
+        delta = json.loads(subs[self.sub1]['balance'])
+        self.assertEqual({}, delta['p'])
+        self.assertEqual([1000], list(delta['n'].values()))
+        # the cloud merges the delta and acknowledges it
+        cloud_bal = crdt.PNCounter.merge(
+            crdt.PNCounter.from_state(self.sub_section[self.sub1]['balance']),
+            crdt.PNCounter.from_json(subs[self.sub1]['balance']))
+        self.assertEqual(4000, cloud_bal.value())
+        self.sub_section[self.sub1]['balance'] = cloud_bal.state
+        self.checkin_response['response']['subscribers'] = self.sub_section
+        CheckinHandler(json.dumps(self.checkin_response))
+        self.assertEqual({}, subscriber.get_subscriber_states(deltas=True))
+
+
 class AutoupgradeTest(unittest.TestCase):
     """We can parse and store autoupgrade data."""
 
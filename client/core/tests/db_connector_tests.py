@@ -16,12 +16,16 @@ of patent rights can be found in the PATENTS file in the same directory.
 
 
 
+import os
 from random import randrange
 import sqlite3
+import tempfile
+import threading
 import unittest
 
 from core.db.connector import ConnectorAbort, ConnectorError, DatabaseError
-from .sqlite3_connector import RestartError, Sqlite3Connector
+from .sqlite3_connector import (RestartError, Sqlite3Connector,
+                                Sqlite3PooledConnector)
 
 
 class DbConnectorTest(unittest.TestCase):
@@ -149,3 +153,86 @@ class DbConnectorTest(unittest.TestCase):
             raise sqlite3.Error()
         with self.assertRaises(DatabaseError):
             self.connector.with_cursor(tester)
+
+
+class PooledConnectorTest(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(fd)
+        self.connector = Sqlite3PooledConnector(self.path, pool_size=2,
+                                                checkout_timeout=0.1)
+        self.connector.exec_stmt(
+            "CREATE TABLE pool_test(key text UNIQUE NOT NULL, value INTEGER);")
+
+    def tearDown(self):
+        self.connector.close_all()
+        os.remove(self.path)
+
+    def test_connections_reused(self):
+        """Sequential transactions reuse a pooled connection."""
+        for i in range(10):
+            self.connector.exec_stmt(
+                "INSERT INTO pool_test (key, value) VALUES (%s, %s);",
+                ('key%d' % i, i))
+        self.assertEqual(1, self.connector.connections_made)
+        self.assertEqual(10, self.connector.exec_and_fetch_one(
+            "SELECT count(*) FROM pool_test;")[0])
+
+    def test_nested_transaction_shares_connection(self):
+        """A nested transaction joins the one already open on the thread."""
+        def outer(cur):
+            cur.execute("INSERT INTO pool_test (key, value) VALUES (%s, 1);",
+                        ('key0', ))
+            # would time out if it needed a second connection
+            return self.connector.exec_and_fetch_one(
+                "SELECT value FROM pool_test WHERE key=%s;", ('key0', ))[0]
+        self.connector._pool_size = 1
+        self.assertEqual(1, self.connector.with_cursor(outer))
+
+    def test_pool_size_bounded(self):
+        """Checkout fails once all connections are in use by other threads."""
+        held = threading.Event()
+        release = threading.Event()
+
+        def hold(cur):
+            held.set()
+            release.wait(5)
+
+        threads = [threading.Thread(target=self.connector.with_cursor,
+                                    args=(hold, )) for _ in range(2)]
+        for t in threads:
+            held.clear()
+            t.start()
+            held.wait(5)
+        try:
+            with self.assertRaises(ConnectorError):
+                self.connector.exec_stmt("SELECT 1;")
+        finally:
+            release.set()
+            for t in threads:
+                t.join()
+        self.assertEqual(2, self.connector.connections_made)
+        # connections are available again once returned
+        self.connector.exec_stmt("SELECT 1;")
+
+    def test_broken_connection_replaced(self):
+        """A connection that raised a restart error isn't reused."""
+        attempts = []
+
+        def restart_once(cur):
+            attempts.append(cur.connection)
+            if len(attempts) == 1:
+                raise RestartError()
+        self.connector.with_cursor(restart_once)
+        self.assertIsNot(attempts[0], attempts[1])
+        self.assertEqual(2, self.connector.connections_made)
+
+    def test_health_check(self):
+        """Idle connections that fail a ping are replaced."""
+        self.connector._health_check_interval = 0
+        self.connector.exec_stmt("SELECT 1;")
+        for conn, _ in self.connector._idle:
+            conn.close()
+        self.connector.exec_stmt("SELECT 1;")
+        self.assertEqual(2, self.connector.connections_made)
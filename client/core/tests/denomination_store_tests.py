@@ -0,0 +1,70 @@
+"""Tests for core.denomination_store.
+
+Usage:
+    $ nosetests core.tests.denomination_store_tests
+
+Copyright (c) 2017-present, Facebook, Inc.
+All rights reserved.
+
+This source code is licensed under the BSD-style license found in the
+LICENSE file in the root directory of this source tree. An additional grant
+of patent rights can be found in the PATENTS file in the same directory.
+"""
+
+import unittest
+
+from core.db import ConnectorFactory
+from core.denomination_store import DenominationStore
+
+
+BRACKETS = [
+    {'id': 1, 'start_amount': 100, 'end_amount': 1000, 'validity': '7'},
+    {'id': 2, 'start_amount': 1001, 'end_amount': 5000, 'validity': '30'},
+    # overlaps both, and ends highest
+    {'id': 3, 'start_amount': 900, 'end_amount': 8000, 'validity': '60'},
+]
+
+
+class DenominationStoreTest(unittest.TestCase):
+
+    cache_ttl = None
+
+    def setUp(self):
+        self.store = DenominationStore(
+            ConnectorFactory.get_default_connector(), self.cache_ttl)
+        self.store.sync([])
+
+    def test_sync(self):
+        """Only the differences are applied."""
+        self.assertTrue(self.store.sync(BRACKETS))
+        self.assertFalse(self.store.sync(BRACKETS))
+        self.assertEqual([1, 2, 3], sorted(self.store.get_all_id()))
+        changed = [dict(BRACKETS[0], validity='14'), BRACKETS[2]]
+        self.assertTrue(self.store.sync(changed))
+        self.assertEqual([1, 3], sorted(self.store.get_all_id()))
+        self.assertEqual((1, 100, 1000, 14), self.store.get_record(1))
+
+    def test_validity_days(self):
+        self.store.sync(BRACKETS)
+        for amount, validity in [(99, None), (100, 7), (500, 7), (899, 7),
+                                 (900, 60), (1000, 60), (1000.5, 60),
+                                 (8000, 60), (8000.5, None), (9000, None)]:
+            self.assertEqual(validity, self.store.get_validity_days(amount))
+        self.store.sync(BRACKETS[:2])
+        for amount, validity in [(900, 7), (1000.5, None), (1001, 30),
+                                 (6000, None)]:
+            self.assertEqual(validity, self.store.get_validity_days(amount))
+
+    def test_shared_table(self):
+        """Lookups of other instances see the changes of a sync."""
+        other = DenominationStore(ConnectorFactory.get_default_connector(),
+                                  self.cache_ttl)
+        self.assertEqual(None, other.get_validity_days(500))
+        self.store.sync(BRACKETS)
+        self.assertEqual(7, other.get_validity_days(500))
+
+
+class CachedDenominationStoreTest(DenominationStoreTest):
+    """Lookups served from the in-process bracket table."""
+
+    cache_ttl = 60
@@ -0,0 +1,88 @@
+"""Micro-benchmark of EventStore write throughput.
+
+Compares writing one event per EventStore and commit (the historic
+behaviour of events._create_event) against group commit via add_many and
+the BufferedEventWriter. Requires the local Postgres test database.
+
+Usage:
+    $ python -m core.tests.event_store_benchmark [num_events]
+
+Copyright (c) 2016-present, Facebook, Inc.
+All rights reserved.
+
+This source code is licensed under the BSD-style license found in the
+LICENSE file in the root directory of this source tree. An additional grant
+of patent rights can be found in the PATENTS file in the same directory.
+"""
+
+import sys
+import time
+
+from core.event_store import BufferedEventWriter, EventStore
+
+
+def _event(i):
+    return {
+        'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'imsi': 'IMSI%015d' % (i % 1000),
+        'oldamt': 1000,
+        'newamt': 900,
+        'change': -100,
+        'reason': 'benchmark',
+        'kind': 'benchmark',
+        'version': 5,
+    }
+
+
+def _cleanup():
+    EventStore()._connector.exec_stmt(
+        "DELETE FROM endaga_events WHERE data->>'kind'='benchmark';")
+
+
+def store_per_event(n):
+    for i in range(n):
+        EventStore().add(_event(i))
+
+
+def shared_connection(n):
+    store = EventStore()
+    for i in range(n):
+        store.add(_event(i))
+
+
+def add_many(n, batch=100):
+    store = EventStore()
+    for start in range(0, n, batch):
+        store.add_many([_event(i) for i in range(start, min(n, start + batch))])
+
+
+def buffered(n, synchronous_commit=True):
+    writer = BufferedEventWriter(max_events=100, max_delay=0.1,
+                                 synchronous_commit=synchronous_commit)
+    for i in range(n):
+        writer.add(_event(i))
+    writer.close()
+
+
+CASES = [
+    ('EventStore() + add per event', store_per_event),
+    ('shared EventStore, add per event', shared_connection),
+    ('add_many, 100 per batch', add_many),
+    ('BufferedEventWriter(100), sync', buffered),
+    ('BufferedEventWriter(100), async',
+     lambda n: buffered(n, synchronous_commit=False)),
+]
+
+
+def main(n):
+    _cleanup()
+    for name, case in CASES:
+        start = time.time()
+        case(n)
+        elapsed = time.time() - start
+        print("%-36s %10.0f events/sec" % (name, n / elapsed))
+        _cleanup()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,155 @@
+"""Tests for the EventStore and its group-commit writer.
+
+Usage:
+    $ nosetests core.tests.event_store_tests
+
+Copyright (c) 2016-present, Facebook, Inc.
+All rights reserved.
+
+This source code is licensed under the BSD-style license found in the
+LICENSE file in the root directory of this source tree. An additional grant
+of patent rights can be found in the PATENTS file in the same directory.
+"""
+
+import time
+import unittest
+
+from core.event_store import BufferedEventWriter, EventStore
+
+
+class StubEventStore(object):
+    """Records batches passed to add_many, optionally failing."""
+
+    def __init__(self, batches, fail=False):
+        self.batches = batches
+        self.fail = fail
+
+    def add_many(self, event_dicts):
+        if self.fail:
+            raise IOError("write failed")
+        self.batches.append(list(event_dicts))
+
+
+class BufferedEventWriterTest(unittest.TestCase):
+    """Testing core.event_store.BufferedEventWriter."""
+
+    def setUp(self):
+        self.batches = []
+
+    def _writer(self, fail=False, **kwargs):
+        return BufferedEventWriter(
+            store_factory=lambda: StubEventStore(self.batches, fail), **kwargs)
+
+    def test_write_through_by_default(self):
+        """Each event is written before add() returns by default."""
+        writer = self._writer()
+        writer.add({'n': 1})
+        writer.add({'n': 2})
+        self.assertEqual([[{'n': 1}], [{'n': 2}]], self.batches)
+        self.assertEqual(0, writer.pending())
+
+    def test_flush_on_batch_size(self):
+        """Events are written in one batch once max_events are pending."""
+        writer = self._writer(max_events=3, max_delay=60)
+        writer.add({'n': 1})
+        writer.add({'n': 2})
+        self.assertEqual([], self.batches)
+        writer.add({'n': 3})
+        self.assertEqual([[{'n': 1}, {'n': 2}, {'n': 3}]], self.batches)
+
+    def test_flush_on_timer(self):
+        """A partial batch is written after max_delay."""
+        writer = self._writer(max_events=100, max_delay=0.01)
+        writer.add_many([{'n': 1}, {'n': 2}])
+        deadline = time.time() + 2
+        while writer.pending() and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual([[{'n': 1}, {'n': 2}]], self.batches)
+
+    def test_close_flushes(self):
+        writer = self._writer(max_events=100, max_delay=60)
+        writer.add({'n': 1})
+        writer.close()
+        self.assertEqual([[{'n': 1}]], self.batches)
+
+    def test_failed_write_is_retried_in_order(self):
+        """A failed batch stays ahead of later events and is retried."""
+        writer = self._writer(fail=True, max_events=2, max_delay=60)
+        writer.add({'n': 1})
+        with self.assertRaises(IOError):
+            writer.add({'n': 2})
+        self.assertEqual(2, writer.pending())
+        # The next flush reconnects.
+        writer._store_factory = lambda: StubEventStore(self.batches)
+        writer.add_many([{'n': 3}])
+        self.assertEqual([[{'n': 1}, {'n': 2}, {'n': 3}]], self.batches)
+
+
+class EventStoreAddManyTest(unittest.TestCase):
+    """Testing core.event_store.EventStore.add_many."""
+
+    def setUp(self):
+        EventStore().drop_table()
+        self.event_store = EventStore()
+
+    def tearDown(self):
+        self.event_store.drop_table()
+
+    def test_add_many(self):
+        """Batches are stored in order with consecutive seqnos."""
+        events = [{'imsi': 'IMSI%03d' % i, 'n': i} for i in range(5)]
+        self.event_store.add_many(events)
+        self.event_store.add({'imsi': 'IMSI005', 'n': 5})
+        stored = self.event_store.get_events()
+        self.assertEqual(list(range(6)), [e['n'] for e in stored])
+        seqnos = [e['seq'] for e in stored]
+        self.assertEqual(list(range(seqnos[0], seqnos[0] + 6)), seqnos)
+
+    def test_add_many_empty(self):
+        self.event_store.add_many([])
+        self.assertEqual([], self.event_store.get_events())
+
+    def test_backlog(self):
+        self.assertEqual(0, self.event_store.backlog())
+        self.event_store.add_many([{'n': i} for i in range(3)])
+        self.assertEqual(3, self.event_store.backlog())
+        self.event_store.ack(self.event_store.get_events()[1]['seq'])
+        self.assertEqual(1, self.event_store.backlog())
+
+    def test_asynchronous_commit(self):
+        store = EventStore(synchronous_commit=False)
+        store.add_many([{'imsi': 'IMSI001'}, {'imsi': 'IMSI002'}])
+        self.assertEqual(2, len(self.event_store.get_events()))
+
+
+class ModifiedSubsTest(unittest.TestCase):
+    """Testing the dirty IMSI index behind EventStore.modified_subs."""
+
+    def setUp(self):
+        EventStore().drop_table()
+        self.event_store = EventStore()
+
+    def tearDown(self):
+        self.event_store.drop_table()
+
+    def test_add_and_ack(self):
+        """IMSIs stay dirty until their latest event is acked."""
+        self.event_store.add({'imsi': 'IMSI001'})
+        self.event_store.add_many([{'imsi': 'IMSI002'}, {'imsi': 'IMSI001'},
+                                   {'kind': 'no imsi'}])
+        self.assertEqual(['IMSI001', 'IMSI002'],
+                         sorted(self.event_store.modified_subs()))
+        seqnos = [e['seq'] for e in self.event_store.get_events()]
+        self.event_store.ack(seqnos[1])
+        self.assertEqual(['IMSI001'], self.event_store.modified_subs())
+        self.event_store.ack(seqnos[-1])
+        self.assertEqual([], self.event_store.modified_subs())
+
+    def test_index_backfilled(self):
+        """An index created for an existing backlog is populated from it."""
+        self.event_store.add_many([{'imsi': 'IMSI001'}, {'imsi': 'IMSI002'}])
+        self.event_store._connector.exec_stmt(
+            "DROP TABLE endaga_dirty_imsis;")
+        EventStore._schema_ready = False
+        self.assertEqual(['IMSI001', 'IMSI002'],
+                         sorted(EventStore().modified_subs()))
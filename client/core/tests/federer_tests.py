@@ -15,6 +15,8 @@ of patent rights can be found in the PATENTS file in the same directory.
 
 
 
+import threading
+import time
 import unittest
 
 import itsdangerous
@@ -33,6 +35,52 @@ from core.subscriber import subscriber
 from core.exceptions import SubscriberNotFound
 
 
+class WorkerPoolTest(unittest.TestCase):
+    """Testing the bounded worker pool in front of the federer app."""
+
+    def setUp(self):
+        self.release = threading.Event()
+
+        def slow_app(environ, start_response):
+            self.release.wait(5)
+            start_response('200 OK', [('Content-Type', 'text/plain')])
+            return [b'ok']
+        self.stats = mock.Mock()
+        self.pool = core.federer.WorkerPool(slow_app, max_workers=1,
+                                            queue_timeout=0.1, retry_after=7,
+                                            stats=self.stats)
+
+    def _request(self, path, responses):
+        def start_response(status, headers):
+            responses.append((status, dict(headers)))
+        self.pool({'PATH_INFO': path}, start_response)
+
+    def test_busy(self):
+        """Requests are rejected with a 503 when all workers are busy."""
+        responses = []
+        thread = threading.Thread(target=self._request,
+                                  args=('/cdr', responses))
+        thread.start()
+        time.sleep(0.05)
+        self._request('/config/deactivate_number', responses)
+        self.release.set()
+        thread.join()
+        self._request('/smscdr', responses)
+        self.assertEqual(['503 Service Unavailable', '200 OK', '200 OK'],
+                         [status for status, _ in responses])
+        self.assertEqual('7', responses[0][1]['Retry-After'])
+        self.assertEqual(
+            [('config', True), ('cdr', False), ('smscdr', False)],
+            [(args[0], args[2]) for args, _ in
+             self.stats.record.call_args_list])
+
+    def test_route_name(self):
+        self.assertEqual('config',
+                         core.federer.route_name('/config/deactivate_number'))
+        self.assertEqual('cdr', core.federer.route_name('/cdr'))
+        self.assertEqual('index', core.federer.route_name('/'))
+
+
 class CallCDRTestCase(unittest.TestCase):
     """Handling call CDRs."""
 
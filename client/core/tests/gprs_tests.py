@@ -264,6 +264,57 @@ class ScrapeTest(unittest.TestCase):
         self.assertEqual(0, records[1]['uploaded_bytes_delta'])
         self.assertEqual(0, records[1]['downloaded_bytes_delta'])
 
+    def test_scraper_counters(self):
+        """A scraper keeps the last counters even if old records go away."""
+        scraper = utilities.GPRSScraper(self.gprs_db)
+        self.mock_subscriber.gprs_return_value = {
+            'IMSI000432': {
+                'ipaddr': '192.168.99.1',
+                'uploaded_bytes': 100,
+                'downloaded_bytes': 200,
+            },
+            'IMSI000433': {
+                'ipaddr': '192.168.99.2',
+                'uploaded_bytes': 10,
+                'downloaded_bytes': 20,
+            },
+        }
+        self.assertEqual(2, scraper.scrape())
+        # Simulate a cleanup of old records between scrapes.
+        self.gprs_db.empty()
+        self.mock_subscriber.gprs_return_value['IMSI000432'].update(
+            uploaded_bytes=150, downloaded_bytes=260)
+        self.assertEqual(2, scraper.scrape())
+        records = self.gprs_db.get_latest_records()
+        self.assertEqual(['IMSI000432', 'IMSI000433'], sorted(records))
+        self.assertEqual(50, records['IMSI000432']['uploaded_bytes_delta'])
+        self.assertEqual(60, records['IMSI000432']['downloaded_bytes_delta'])
+        self.assertEqual(0, records['IMSI000433']['uploaded_bytes_delta'])
+
+    def test_latest_records(self):
+        """The latest record of each IMSI can be fetched at once."""
+        self.gprs_db.add_records([
+            ('IMSI000111', '192.168.99.1', 10, 20, 10, 20),
+            ('IMSI000222', '192.168.99.2', 30, 40, 30, 40),
+            ('IMSI000111', '192.168.99.1', 50, 60, 40, 40),
+        ])
+        records = self.gprs_db.get_latest_records()
+        self.assertEqual(2, len(records))
+        self.assertEqual(50, records['IMSI000111']['uploaded_bytes'])
+        self.assertEqual(30, records['IMSI000222']['uploaded_bytes'])
+        self.assertEqual(
+            records['IMSI000111'],
+            self.gprs_db.get_latest_record('IMSI000111'))
+
+    def test_large_byte_counts(self):
+        """Byte counts don't overflow on long-lived sessions."""
+        up_bytes = 5 * 2 ** 32
+        self.gprs_db.add_record('IMSI000111', '192.168.99.1', up_bytes, 20,
+                                up_bytes, 20)
+        record = self.gprs_db.get_latest_record('IMSI000111')
+        self.assertEqual(up_bytes, record['uploaded_bytes'])
+        self.assertEqual(up_bytes, record['uploaded_bytes_delta'])
+
 
 class EventGenerationTest(unittest.TestCase):
     """Testing core.gprs.generate_gprs_events."""
@@ -279,40 +330,6 @@ class EventGenerationTest(unittest.TestCase):
         # Connect to the GPRSDB and EventStore.
         cls.gprs_db = gprs_database.GPRSDB()
         cls.event_store = events.EventStore()
-        # Add some records to the GPRSDB.  The method we're testing should
-        # extract these records and create events in the EventStore.
-        cls.now = time.time()
-        records = [
-            (psycopg2.TimestampFromTicks(cls.now - 120), 'IMSI901550000000084',
-             '192.168.99.1', 50, 80, 50, 80),
-            (psycopg2.TimestampFromTicks(cls.now - 60), 'IMSI901550000000084',
-             '192.168.99.1', 50, 80, 0, 0),
-            (psycopg2.TimestampFromTicks(cls.now - 30), 'IMSI901550000000084',
-             '192.168.99.1', 300, 500, 250, 420),
-            (psycopg2.TimestampFromTicks(cls.now - 10), 'IMSI901550000000084',
-             '192.168.99.1', 700, 600, 400, 100),
-            (psycopg2.TimestampFromTicks(cls.now - 5), 'IMSI901550000000084',
-             '192.168.99.1', 750, 625, 50, 25),
-            # Create events for a different IMSI.
-            (psycopg2.TimestampFromTicks(cls.now - 60), 'IMSI901550000000082',
-             '192.168.99.2', 50, 80, 0, 0),
-            (psycopg2.TimestampFromTicks(cls.now - 10), 'IMSI901550000000082',
-             '192.168.99.2', 400, 300, 350, 220),
-            (psycopg2.TimestampFromTicks(cls.now - 5), 'IMSI901550000000082',
-             '192.168.99.2', 450, 325, 50, 25),
-        ]
-        schema = ('record_timestamp, imsi, ipaddr, uploaded_bytes,'
-                  ' downloaded_bytes, uploaded_bytes_delta,'
-                  ' downloaded_bytes_delta')
-        connection = psycopg2.connect(host='localhost', database='endaga',
-                                      user=PG_USER, password=PG_PASSWORD)
-        with connection.cursor() as cursor:
-            for record in records:
-                values = "%s, '%s', '%s', %s, %s, %s, %s" % record
-                command = 'insert into gprs_records (%s) values(%s)' % (
-                    schema, values)
-                cursor.execute(command)
-        connection.commit()
 
     @classmethod
     def tearDownClass(cls):
@@ -324,20 +341,40 @@ class EventGenerationTest(unittest.TestCase):
         cls.gprs_db.empty()
 
     def setUp(self):
-        """Wipe the EventStore before each test."""
-        self.event_store.drop_table()
+        """Wipe the GPRSDB and the EventStore before each test.
 
-    def test_capture_events_in_interval(self):
-        """We can get events in an interval."""
-        delta_t = 30
-        utilities.generate_gprs_events(self.now - delta_t, self.now)
+        Then add some records to the GPRSDB, as if from two scrapes.  The
+        method we're testing should create events from the summed deltas.
+        """
+        self.gprs_db.empty()
+        self.event_store.drop_table()
+        # Recreate the tables for the event writer.
+        self.event_store = events.EventStore()
+        self.gprs_db.add_records([
+            ('IMSI901550000000084', '192.168.99.1', 50, 80, 50, 80),
+            ('IMSI901550000000082', '192.168.99.2', 50, 80, 0, 0),
+        ])
+        self.gprs_db.add_records([
+            ('IMSI901550000000084', '192.168.99.1', 300, 500, 250, 420),
+            ('IMSI901550000000082', '192.168.99.2', 400, 300, 350, 220),
+        ])
+        self.gprs_db.add_records([
+            ('IMSI901550000000084', '192.168.99.1', 300, 500, 0, 0),
+            ('IMSI901550000000082', '192.168.99.2', 400, 300, 0, 0),
+        ])
+
+    def test_capture_events(self):
+        """We create an event per IMSI with the bytes since the last call."""
+        now = time.time()
+        delta_t = 60
+        utilities.generate_gprs_events(now - delta_t, now)
         generated_events = self.event_store.get_events()
         self.assertEqual(2, len(generated_events))
-        imsis = ['IMSI901550000000084', 'IMSI901550000000082']
-        self.assertItemsEqual(imsis, [e['imsi'] for e in generated_events])
-        self.assertEqual(700 + 400,
+        imsis = ['IMSI901550000000082', 'IMSI901550000000084']
+        self.assertEqual(imsis, sorted(e['imsi'] for e in generated_events))
+        self.assertEqual(300 + 350,
                          sum([e['up_bytes'] for e in generated_events]))
-        self.assertEqual(545 + 245,
+        self.assertEqual(500 + 220,
                          sum([e['down_bytes'] for e in generated_events]))
         for event in generated_events:
             # The subscriber's balance should be unchanged as data usage is
@@ -346,19 +383,24 @@ class EventGenerationTest(unittest.TestCase):
             self.assertEqual('gprs', event['kind'])
             self.assertEqual(delta_t, event['timespan'])
 
-    def test_capture_events_in_longer_interval(self):
-        """We can get events in an interval.
+    def test_no_usage_since_last_call(self):
+        """We should not create events when the byte deltas are both zero.
 
-        We should also not create events when the byte deltas are both zero.
+        Usage is only reported once.
         """
-        delta_t = 150
-        utilities.generate_gprs_events(self.now - delta_t, self.now)
-        generated_events = self.event_store.get_events()
-        # We should get all the events except for the one where the byte deltas
-        # are zero.
-        self.assertEqual(2, len(generated_events))
-        self.assertEqual(750 + 400,
-                         sum([e['up_bytes'] for e in generated_events]))
+        now = time.time()
+        utilities.generate_gprs_events(now - 60, now)
+        self.assertEqual(2, len(self.event_store.get_events()))
+        self.gprs_db.add_records([
+            ('IMSI901550000000084', '192.168.99.1', 310, 500, 10, 0),
+            ('IMSI901550000000082', '192.168.99.2', 400, 300, 0, 0),
+        ])
+        utilities.generate_gprs_events(now, now + 60)
+        generated_events = self.event_store.get_events()[2:]
+        self.assertEqual(1, len(generated_events))
+        self.assertEqual('IMSI901550000000084', generated_events[0]['imsi'])
+        self.assertEqual(10, generated_events[0]['up_bytes'])
+        self.assertEqual(0, generated_events[0]['down_bytes'])
 
 
 class CleanupTest(unittest.TestCase):
@@ -416,3 +458,20 @@ class CleanupTest(unittest.TestCase):
         utilities.clean_old_gprs_records(self.now - 1)
         records = self.gprs_db.get_records()
         self.assertEqual(0, len(records))
+
+    def test_partitions(self):
+        """Scraped records are dropped with their partition."""
+        self.gprs_db.add_record('IMSI901550000000084', '192.168.99.1', 800,
+                                700, 50, 75)
+        period = self.gprs_db.PARTITION_PERIOD
+        # The partition isn't dropped until all of its records are old.
+        utilities.clean_old_gprs_records(self.now - 1)
+        records = self.gprs_db.get_records()
+        self.assertEqual(1, len(records))
+        utilities.clean_old_gprs_records(self.now + 2 * period)
+        records = self.gprs_db.get_records(end_timestamp=self.now + 60)
+        self.assertEqual(0, len(records))
+        # A new partition is created for the next records.
+        self.gprs_db.add_record('IMSI901550000000084', '192.168.99.1', 900,
+                                800, 100, 100)
+        self.assertEqual(1, len(self.gprs_db.get_records()))
@@ -11,12 +11,16 @@ LICENSE file in the root directory of this source tree. An additional grant
 of patent rights can be found in the PATENTS file in the same directory.
 """
 
+import json
+import time
 import unittest
 
 import mock
 
 from core import interconnect
+from core import request_stats
 from core.config_database import ConfigDB
+from core.exceptions import BSSError
 from core.tests import mocks
 
 
@@ -29,6 +33,7 @@ class EndagaICTest(unittest.TestCase):
         cls.config_db['bts_secret'] = 'test-secret-123'
         cls.original_logger = interconnect.logger
         cls.mock_logger = mock.Mock()
+        cls.mock_logger.queue_stats.return_value = {}
         interconnect.logger = cls.mock_logger
         # Mock bts for TMSIs
         cls.original_bts = interconnect.bts
@@ -56,3 +61,151 @@ class EndagaICTest(unittest.TestCase):
         self.assertTrue(self.mock_logger.error.called)
         # Repair the requests monkeypatch.
         interconnect.requests = original_requests
+
+
+class SlowBTS(mocks.MockBTS):
+    """MockBTS with a slow get_noise and a failing get_band."""
+
+    def get_noise(self):
+        time.sleep(0.5)
+        return super(SlowBTS, self).get_noise()
+
+    def get_band(self):
+        raise BSSError("no band")
+
+
+class StatusCollectionTest(unittest.TestCase):
+    """Testing the concurrent status collection in endaga_ic.checkin."""
+
+    def setUp(self):
+        self.config_db = ConfigDB()
+        self.original_bts = interconnect.bts
+        interconnect.bts = SlowBTS()
+        self.original_subscriber = interconnect.subscriber
+        interconnect.subscriber = mocks.MockSubscriber()
+        self.original_requests = interconnect.requests
+        self.mock_requests = mocks.MockRequests(200)
+        interconnect.requests = self.mock_requests
+        self.original_snowflake = interconnect.snowflake
+        interconnect.snowflake = mocks.MockSnowflake()
+        self.ic = interconnect.endaga_ic(self.config_db)
+        self.ic.utilization_tracker = mock.Mock()
+        self.ic.utilization_tracker.get_data.return_value = {'cpu_percent': 1}
+        self.ic.utilization_tracker.sample.return_value = {'cpu_percent': 1}
+        self.ic.COLLECT_TIMEOUT = 0.2
+
+    def tearDown(self):
+        interconnect.bts = self.original_bts
+        interconnect.subscriber = self.original_subscriber
+        interconnect.requests = self.original_requests
+        interconnect.snowflake = self.original_snowflake
+
+    def _posted_status(self):
+        # checkin posts the session's requests, which MockRequests replaces
+        data = self.ic.session.post_data
+        if isinstance(data, bytes):
+            data = interconnect.GzipFile(
+                fileobj=interconnect.BytesIO(data)).read().decode('utf-8')
+        return json.loads(data)['status']
+
+    def test_deadline(self):
+        """Late and failed collectors are left out of the checkin."""
+        with mock.patch.object(interconnect, 'CheckinHandler'):
+            self.ic.checkin()
+        status = self._posted_status()
+        self.assertEqual({'cpu_percent': 1}, status['system_utilization'])
+        self.assertTrue('versions' in status)
+        self.assertTrue('subscribers' in status)
+        self.assertFalse('openbts_noise' in status)
+        self.assertFalse('radio' in status)
+
+    def test_latency_stats(self):
+        """Collector latencies are sent with the next checkin."""
+        with mock.patch.object(interconnect, 'CheckinHandler'):
+            self.ic.checkin()
+            # The bts group is still running, so it's skipped this time.
+            self.ic.checkin()
+            load = self._posted_status()['openbts_load']
+            # noise and radio, which runs after it
+            self.assertEqual(2, load['checkin.collect_missed'])
+            self.assertTrue(load['checkin.collect_lat'] < 0.5)
+            self.assertTrue(load['checkin.collect.usage_lat'] < 0.2)
+            time.sleep(0.5)
+            self.ic.checkin()
+        load = self._posted_status()['openbts_load']
+        self.assertTrue(load['checkin.collect.noise_lat'] >= 0.5)
+
+    def test_sampled_sections(self):
+        """With a sampler running, summaries of the samples are sent."""
+        interconnect.bts = mocks.MockBTS()
+        self.ic.start_sampler(0.01, 3)
+        deadline = time.time() + 2
+        while (not self.ic._sampler.summary('openbts_load') and
+               time.time() < deadline):
+            time.sleep(0.01)
+        self.ic.utilization_tracker.get_network_deltas.return_value = {
+            'bytes_sent_delta': 10}
+        with mock.patch.object(interconnect, 'CheckinHandler'):
+            self.ic.checkin()
+        self.ic.stop_sampler()
+        status = self._posted_status()
+        self.assertEqual(2, status['openbts_load']['sdcch_load'])
+        self.assertEqual(2, status['openbts_load']['sdcch_load.p95'])
+        self.assertEqual(
+            {'cpu_percent': 1, 'cpu_percent.min': 1, 'cpu_percent.mean': 1,
+             'cpu_percent.median': 1, 'cpu_percent.p95': 1,
+             'bytes_sent_delta': 10},
+            status['system_utilization'])
+
+    def test_federer_stats(self):
+        """Federer's request latencies are sent, once."""
+        stats = request_stats.RequestStats()
+        stats.pop()
+        stats.record('cdr', 0.02)
+        stats.record('cdr', 0.2)
+        stats.record('cdr', 1, rejected=True)
+        stats.flush()
+        interconnect.bts = mocks.MockBTS()
+        with mock.patch.object(interconnect, 'CheckinHandler'):
+            self.ic.checkin()
+            load = self._posted_status()['openbts_load']
+            self.assertEqual(2, load['federer.cdr.count'])
+            self.assertEqual(1, load['federer.cdr.rejected'])
+            self.assertEqual(0.25, load['federer.cdr.p95'])
+            self.assertFalse('federer.cdr.le_0.025' in load)
+            self.ic.checkin()
+        load = self._posted_status()['openbts_load']
+        self.assertFalse('federer.cdr.count' in load)
+
+
+class EventDrainTest(unittest.TestCase):
+    """Testing core.interconnect.EventDrain."""
+
+    def setUp(self):
+        self.drain = interconnect.EventDrain()
+
+    def test_scales_with_backlog(self):
+        self.assertEqual(100, self.drain.batch_size(0, 30))
+        self.assertEqual(100, self.drain.batch_size(500, 30))
+        self.assertEqual(2000, self.drain.batch_size(20000, 30))
+        self.assertEqual(5000, self.drain.batch_size(10 ** 6, 30))
+
+    def test_failure_halves_limit(self):
+        self.drain.record(4000, 10 ** 6, 30, False)
+        self.assertEqual(2000, self.drain.batch_size(10 ** 6, 30))
+        self.drain.record(2000, 10 ** 6, 1, True)
+        self.assertEqual(4000, self.drain.batch_size(10 ** 6, 30))
+        # never below the normal batch size
+        for _ in range(10):
+            self.drain.record(self.drain.batch_size(10 ** 6, 30), 10 ** 6,
+                              30, False)
+        self.assertEqual(100, self.drain.batch_size(10 ** 6, 30))
+
+    def test_measured_limits(self):
+        """Batches fit the request size and half the timeout."""
+        # 1 KB and 5 ms per event
+        self.drain.record(1000, 1024 * 1000, 5, True)
+        self.assertEqual(3000, self.drain.batch_size(10 ** 6, 30))
+        # 2 KB per event
+        self.drain.record(1000, 2048 * 1000, 1, True)
+        self.assertEqual(2048, self.drain.batch_size(10 ** 6, 30))
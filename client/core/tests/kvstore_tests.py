@@ -127,6 +127,17 @@ class KVStoreTest(unittest.TestCase):
             self.assertEqual(item[1], self.db[item[0]])
             del self.db[item[0]]
 
+    def test_set_multiple_bulk(self):
+        """We can set more values than fit in one statement."""
+        data = [('bulk-%d' % i, 'val-%d' % i) for i in range(1000)]
+        # later duplicates win
+        data.append(('bulk-0', 'new-val'))
+        self.db.set_multiple(data)
+        self.assertEqual('new-val', self.db['bulk-0'])
+        self.assertEqual('val-999', self.db['bulk-999'])
+        for key, _ in data[:-1]:
+            del self.db[key]
+
     def test_get(self):
         """We can get with a default value."""
         self.db['test-key'] = 'yup!'
@@ -200,6 +211,80 @@ class KVStoreTest(unittest.TestCase):
             del self.db[k]
 
 
+class CachedStubDatabase(KVStore):
+
+    def __init__(self, table_name='cached_test_db', cache_ttl=60):
+        super(CachedStubDatabase, self).__init__(
+            table_name, None, cache_ttl=cache_ttl)
+
+
+class CachedKVStoreTest(KVStoreTest):
+    """We can use the KVStore methods in cached mode."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.db = CachedStubDatabase()
+
+
+class StubListener(object):
+
+    def __init__(self):
+        self.notified = False
+
+    def poll(self):
+        notified, self.notified = self.notified, False
+        return notified
+
+
+class CacheTest(unittest.TestCase):
+    """Cached KVStores are kept up to date."""
+
+    def setUp(self):
+        self.db = CachedStubDatabase('cache_test_db')
+        self.uncached = StubDatabase(table_name='cache_test_db')
+        self.db['key'] = 'old'
+
+    def tearDown(self):
+        self.db._cache.ttl = 60
+        self.db._cache.listener = None
+
+    def test_reads_cached(self):
+        """Writes that bypass the cache aren't seen until it's reloaded."""
+        self.uncached['key'] = 'new'
+        self.assertEqual('old', self.db['key'])
+        self.db._cache.ttl = 0
+        self.assertEqual('new', self.db['key'])
+
+    def test_write_through(self):
+        """Writes via any cached instance update the shared snapshot."""
+        other = CachedStubDatabase('cache_test_db')
+        other.set_multiple([('key', 'new'), ('key2', 'val2')])
+        self.assertEqual('new', self.db['key'])
+        self.assertEqual([('key2', 'val2')], self.db.get_multiple(['key2']))
+        del other['key2']
+        self.assertFalse('key2' in self.db)
+
+    def test_notification(self):
+        """A notification from another process invalidates the cache."""
+        listener = StubListener()
+        self.db._cache.listener = listener
+        self.uncached['key'] = 'new'
+        self.assertEqual('old', self.db['key'])
+        listener.notified = True
+        self.assertEqual('new', self.db['key'])
+
+    def test_enable_cache(self):
+        """enable_cache() caches reads of existing uncached instances."""
+        self.assertEqual(None, self.uncached._cache)
+        StubDatabase.enable_cache(60)
+        try:
+            self.assertTrue(self.uncached._cache is self.db._cache)
+            self.assertEqual('old', self.uncached['key'])
+        finally:
+            StubDatabase.enable_cache(None)
+        self.assertEqual(None, self.uncached._cache)
+
+
 class TransactionTest(unittest.TestCase):
     """
     Test that transactions work the way they are supposed to.
@@ -291,7 +376,7 @@ class TransactionTest(unittest.TestCase):
         self.db._connector.with_cursor(outer)
 
     def test_nested_txn_abort(self):
-        """ Aborting a nested transaction does not roll back updates."""
+        """ Aborting a nested transaction rolls back the outer one too."""
         def inner(conn, v1_expected, delta):
             with conn:
                 cur = conn.cursor()
@@ -308,9 +393,13 @@ class TransactionTest(unittest.TestCase):
             self.db._set(cur, 'key-1', v1)
             delta = randrange(1e7, 2e7)
             self.db._connector.execute(inner, v1, delta)
-            # change made in inner context are NOT rolled back
-            self.assertEqual(v1 + delta, self.db._get_option(cur, 'key-1'))
+            # changes made in both contexts are rolled back, since the
+            # transaction belongs to the connection
+            self.assertEqual(v0, self.db._get_option(cur, 'key-1'))
 
+        # set an initial value
+        v0 = randrange(0, 1e5)
+        self.db['key-1'] = v0
         self.db._connector.with_cursor(outer)
 
     def test_interleaved_txn_abort(self):
@@ -331,16 +420,14 @@ class TransactionTest(unittest.TestCase):
             self.db._set(cur, 'key-1', v1)
             delta = randrange(1e7, 2e7)
             self.db._connector.execute(inner, cur, v1, delta)
-            # change made in inner context should NOT have been rolled back
-            self.assertEqual(v1 + delta, self.db._get_option(cur, 'key-1'))
-            return v1 + delta
+            # change made with the outer cursor was rolled back too
+            self.assertEqual(v0, self.db._get_option(cur, 'key-1'))
 
         # set an initial value
         v0 = randrange(0, 1e5)
         self.db['key-1'] = v0
-        v2 = self.db._connector.with_cursor(outer)
-        # check that inner connection was not rolled back
-        self.assertEqual(v2, self.db['key-1'])
+        self.db._connector.with_cursor(outer)
+        self.assertEqual(v0, self.db['key-1'])
 
     def test_inner_commit(self):
         """We can commit a nested transaction."""
@@ -0,0 +1,118 @@
+"""Micro-benchmark of the dialplan lookups served by endaga-lookupd.
+
+Replays the lookups FreeSWITCH makes while setting up an outbound call
+(caller IMSI from number, account status and balance, tariff and seconds
+available, caller ID) three ways: in a fresh interpreter per call, as the
+VBTS_* scripts did when FreeSWITCH reloaded them; calling core.billing and
+core.subscriber in a warm process; and through the endaga-lookupd client.
+The server runs in a thread of this process on a temporary socket; a
+benchmark subscriber is created for the run and deleted afterwards. The
+server is threaded, so this needs the Postgres test backend.
+
+Usage:
+    $ CCM_DB_TEST_BACKEND=postgres python -m core.tests.lookupd_benchmark [num_calls]
+
+Copyright (c) 2016-present, Facebook, Inc.
+All rights reserved.
+
+This source code is licensed under the BSD-style license found in the
+LICENSE file in the root directory of this source tree. An additional grant
+of patent rights can be found in the PATENTS file in the same directory.
+"""
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from core import lookupd
+from core.lookupd.client import LookupClient
+from core.lookupd.server import LookupServer
+from core.subscriber import subscriber
+
+
+IMSI = 'IMSI001019999999999'
+NUMBER = '5559999999'
+DESTINATION = '15105550123'
+
+
+def replay(call, n):
+    """Runs the lookups for n outbound calls; returns per-call latencies."""
+    latencies = []
+    for _ in range(n):
+        start = time.time()
+        imsi = call('get_imsi_from_number', NUMBER, False)
+        call('get_account_status', imsi)
+        balance = call('get_account_balance', imsi)
+        tariff = call('get_service_tariff', 'off_network_send', 'call',
+                      DESTINATION)
+        # get_seconds_available divides by the tariff.
+        if tariff:
+            call('get_seconds_available', balance, 'off_network_send',
+                 DESTINATION)
+        call('get_caller_id', imsi)
+        latencies.append(time.time() - start)
+    return latencies
+
+
+def cold_call():
+    """Runs the lookups for one call, with imports and connections."""
+    # The fake BSS keeps numbers in memory, not in the db.
+    if subscriber.get_imsi_from_number(NUMBER, False) is None:
+        subscriber.add_subscriber_to_hlr(IMSI, NUMBER, None, None)
+    methods = lookupd.get_methods()
+    replay(lambda m, *a: methods[m](*a), 1)
+
+
+def cold(n):
+    latencies = []
+    for _ in range(n):
+        start = time.time()
+        subprocess.check_call([
+            sys.executable, '-c',
+            'from core.tests import lookupd_benchmark; '
+            'lookupd_benchmark.cold_call()'])
+        latencies.append(time.time() - start)
+    return latencies
+
+
+def report(name, latencies):
+    latencies = sorted(latencies)
+    print("%-24s mean %8.3f ms  p50 %8.3f ms  p95 %8.3f ms" % (
+        name,
+        1000 * sum(latencies) / len(latencies),
+        1000 * latencies[len(latencies) // 2],
+        1000 * latencies[int(len(latencies) * 0.95)]))
+
+
+def main(n):
+    subscriber.create_subscriber(IMSI, NUMBER)
+    subscriber.status().create_subscriber_status(
+        IMSI, json.dumps({'state': 'active', 'valid_through': ''}))
+    tmpdir = tempfile.mkdtemp()
+    path = os.path.join(tmpdir, 'lookupd.sock')
+    server = LookupServer(path)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    try:
+        report('fresh interpreter', cold(min(n, 20)))
+        methods = lookupd.get_methods()
+        report('in-process', replay(lambda m, *a: methods[m](*a), n))
+        client = LookupClient(path)
+        report('endaga-lookupd', replay(client.call, n))
+        client.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+        shutil.rmtree(tmpdir)
+        subscriber.delete_subscriber(IMSI)
+        subscriber.status().delete_subscriber(IMSI)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
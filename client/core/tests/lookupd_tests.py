@@ -0,0 +1,168 @@
+"""Tests for the endaga-lookupd server and client.
+
+Usage:
+    $ nosetests core.tests.lookupd_tests
+
+Copyright (c) 2016-present, Facebook, Inc.
+All rights reserved.
+
+This source code is licensed under the BSD-style license found in the
+LICENSE file in the root directory of this source tree. An additional grant
+of patent rights can be found in the PATENTS file in the same directory.
+"""
+
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import unittest
+
+from core.exceptions import SubscriberNotFound
+from core.lookupd import client
+from core.lookupd.client import LookupClient, LookupdError
+from core.lookupd.server import LookupServer
+
+
+class StubMethods(dict):
+    """Lookup functions that count how often they're called."""
+
+    def __init__(self):
+        self.calls = []
+        # the most get_port calls that ran at once
+        self.max_running = 0
+        running = []
+        lock = threading.Lock()
+        numbers = {'5551234': 'IMSI001010000000001'}
+
+        def get_imsi_from_number(number, canonicalize=True):
+            self.calls.append(('get_imsi_from_number', number))
+            if number not in numbers:
+                raise SubscriberNotFound(number)
+            return numbers[number]
+
+        def get_account_balance(imsi):
+            self.calls.append(('get_account_balance', imsi))
+            return 1000
+
+        def get_ip(imsi):
+            raise ValueError("no ip for %s" % imsi)
+
+        def get_port(imsi):
+            with lock:
+                running.append(imsi)
+                self.max_running = max(self.max_running, len(running))
+            time.sleep(0.02)
+            with lock:
+                running.remove(imsi)
+            return 5060
+
+        def is_authed(imsi):
+            self.calls.append(('is_authed', imsi))
+            time.sleep(0.2)
+            return True
+
+        dict.__init__(self, get_imsi_from_number=get_imsi_from_number,
+                      get_account_balance=get_account_balance,
+                      get_ip=get_ip, get_port=get_port, is_authed=is_authed)
+
+
+class LookupdTest(unittest.TestCase):
+    """Testing core.lookupd over a real Unix socket."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'lookupd.sock')
+        self.methods = StubMethods()
+        self.server = LookupServer(self.path, self.methods, cache_ttl=60)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.client = LookupClient(self.path)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tmpdir)
+
+    def test_round_trip(self):
+        self.assertEqual(1000,
+                         self.client.call('get_account_balance', 'IMSI001'))
+        self.assertEqual('IMSI001010000000001',
+                         self.client.call('get_imsi_from_number', '5551234',
+                                          False))
+
+    def test_subscriber_not_found(self):
+        """SubscriberNotFound is re-raised by the client."""
+        with self.assertRaises(SubscriberNotFound):
+            self.client.call('get_imsi_from_number', '5550000')
+
+    def test_unexpected_error(self):
+        with self.assertRaises(LookupdError):
+            self.client.call('get_ip', 'IMSI001')
+        with self.assertRaises(LookupdError):
+            self.client.call('no_such_method')
+        # The connection is still usable afterwards.
+        self.assertEqual(1000,
+                         self.client.call('get_account_balance', 'IMSI001'))
+
+    def test_cache(self):
+        """Only lookupd.CACHEABLE results are cached."""
+        for _ in range(3):
+            self.client.call('get_imsi_from_number', '5551234', False)
+            self.client.call('get_account_balance', 'IMSI001')
+        self.assertEqual(1, self.methods.calls.count(
+            ('get_imsi_from_number', '5551234')))
+        self.assertEqual(3, self.methods.calls.count(
+            ('get_account_balance', 'IMSI001')))
+
+    def test_serialized(self):
+        """BSS lookups of concurrent connections run one at a time."""
+        results = []
+
+        def lookup():
+            results.append(self.client.call('get_port', 'IMSI001'))
+            self.client.close()
+        threads = [threading.Thread(target=lookup) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual([5060] * 4, results)
+        self.assertEqual(1, self.methods.max_running)
+
+    def test_reconnect(self):
+        """The client reconnects if its connection was dropped."""
+        self.client.call('get_account_balance', 'IMSI001')
+        self.client._local.sock.shutdown(socket.SHUT_RDWR)
+        self.assertEqual(1000,
+                         self.client.call('get_account_balance', 'IMSI001'))
+
+    def test_timeout(self):
+        """A slow lookup isn't sent again, nor run in-process."""
+        saved = client._client, client._local_methods
+        client._client = LookupClient(self.path, timeout=0.05)
+        client._local_methods = self.methods
+        try:
+            with self.assertRaises(LookupdError):
+                client.is_authed('IMSI001')
+        finally:
+            client._client.close()
+            client._client, client._local_methods = saved
+        self.assertEqual([('is_authed', 'IMSI001')], self.methods.calls)
+
+    def test_fallback(self):
+        """Lookups are done in-process if the server isn't running."""
+        self.server.shutdown()
+        self.server.server_close()
+        saved = client._client, client._local_methods
+        client._client = LookupClient(self.path)
+        client._local_methods = self.methods
+        try:
+            self.assertEqual(1000, client.get_account_balance('IMSI001'))
+            with self.assertRaises(SubscriberNotFound):
+                client.get_imsi_from_number('5550000')
+        finally:
+            client._client, client._local_methods = saved
@@ -0,0 +1,62 @@
+"""Tests for core.message_database.
+
+Usage:
+    $ nosetests core.tests.message_database_tests
+
+Copyright (c) 2016-present, Facebook, Inc.
+All rights reserved.
+
+This source code is licensed under the BSD-style license found in the
+LICENSE file in the root directory of this source tree. An additional grant
+of patent rights can be found in the PATENTS file in the same directory.
+"""
+
+import unittest
+
+import mock
+
+from core.message_database import MessageDB
+
+
+class MessageDBTest(unittest.TestCase):
+
+    def setUp(self):
+        self.msgid_db = MessageDB(max_len=10)
+        self.msgid_db._connector.exec_stmt("DELETE FROM endaga_msgid;")
+        MessageDB._recent.clear()
+
+    def _count(self):
+        return self.msgid_db._connector.exec_and_fetch(
+            "SELECT count(*) FROM endaga_msgid;")[0][0]
+
+    def test_seen(self):
+        self.assertFalse(self.msgid_db.seen('abc'))
+        self.assertTrue(self.msgid_db.seen('abc'))
+        self.assertTrue('abc' in self.msgid_db)
+        self.assertFalse('def' in self.msgid_db)
+
+    def test_repeats_are_answered_from_memory(self):
+        self.msgid_db.seen('abc')
+        with mock.patch.object(self.msgid_db, '_connector') as connector:
+            self.assertTrue(self.msgid_db.seen('abc'))
+            self.assertTrue(MessageDB().seen('abc'))
+        self.assertFalse(connector.with_cursor.called)
+
+    def test_seen_by_another_process(self):
+        """Ids are shared with other processes through the table."""
+        self.msgid_db.seen('abc')
+        MessageDB._recent.clear()
+        self.assertTrue(self.msgid_db.seen('abc'))
+        self.assertTrue('abc' in self.msgid_db)
+
+    def test_trim(self):
+        """Old ids are dropped from memory and, periodically, the table."""
+        self.msgid_db.trim_interval = 5
+        for i in range(25):
+            self.assertFalse(self.msgid_db.seen('msg%d' % i))
+        self.assertEqual(10, len(MessageDB._recent))
+        self.assertFalse('msg0' in MessageDB._recent)
+        # up to trim_interval - 1 ids more than max_len
+        self.assertTrue(10 <= self._count() < 15)
+        self.assertTrue(self.msgid_db.seen('msg24'))
+        self.assertFalse(self.msgid_db.seen('msg0'))
@@ -61,7 +61,7 @@ class MockSubscriber(BaseSubscriber):
         }]
 
     @classmethod
-    def get_subscriber_states(cls, imsis=None):
+    def get_subscriber_states(cls, imsis=None, deltas=False):
         return {"IMSI123": {"balance": "foo"}}
 
     def delete_number(self, imsi, number):
@@ -82,6 +82,13 @@ class MockSubscriber(BaseSubscriber):
     def get_subscribers(self, imsi=None):
         return self.get_subscriber_return_value
 
+    def get_subscriber_imsis(self):
+        # Like get_subscribers, treat every IMSI with GPRS usage as
+        # registered unless get_subscriber_return_value is emptied.
+        if not self.get_subscriber_return_value:
+            return set()
+        return set(self.gprs_return_value or {})
+
     def get_gprs_usage(self):
         return self.gprs_return_value
 
@@ -156,8 +163,8 @@ class MockBTS(BaseBTS):
 class MockEvents(object):
     """Mocking the core.events module."""
 
-    def usage(self):
-        return []
+    def usage(self, num=100):
+        return {'events': []}
 
     class CheckinHandler(object):
         """Mocking core.events.CheckinHandler."""
@@ -178,6 +185,9 @@ class MockEvents(object):
         def add(self, event_dict):
             self.mock_events.append(event_dict)
 
+        def backlog(self):
+            return len(self.mock_events)
+
 
 class MockSnowflake(object):
     """Mocking snowflake."""
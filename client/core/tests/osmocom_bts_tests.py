@@ -0,0 +1,75 @@
+"""Tests for the Osmocom BTS getters at core.bts._osmocom
+
+Copyright (c) 2016-present, Facebook, Inc.
+All rights reserved.
+
+This source code is licensed under the BSD-style license found in the
+LICENSE file in the root directory of this source tree. An additional grant
+of patent rights can be found in the PATENTS file in the same directory.
+
+Run this test from the project root:
+    $ nosetests core.tests.osmocom_bts_tests
+"""
+
+import unittest
+
+import mock
+
+from core.bts import _osmocom
+from core.exceptions import BSSError
+
+
+SHOW_BTS = (
+    "BTS 0 is of sysmobts type in band GSM850, has CI 1 LAC 1, BSIC 63 "
+    "(NCC=7, BCC=7) and 1 TRX\r\n"
+    "  OML Link state: connected.\r\n"
+    "  Current Channel Load:\r\n"
+    "             CCCH+SDCCH4:   0% (1/4)\r\n"
+    "                   TCH/F:   0% (0/2)")
+SHOW_TRX = "TRX 0 of BTS 0 is on ARFCN 128"
+SHOW_NETWORK = (
+    "BSC is on Country Code 901, Network Code 55 and has 1 BTS\r\n"
+    "  Long network name: 'Test_Network'\r\n"
+    "  Short network name: 'Test'")
+
+
+@mock.patch('osmocom.vty.base.BaseVTY.close')
+@mock.patch('osmocom.vty.base.BaseVTY.open')
+class StatusTest(unittest.TestCase):
+    """The getters share one batched read of show bts, trx and network."""
+
+    def setUp(self):
+        self.bts = _osmocom.OsmocomBTS()
+        self.bts.bts.pipeline = mock.Mock(
+            return_value=['', SHOW_BTS, SHOW_TRX, SHOW_NETWORK, ''])
+
+    def test_one_exchange(self, mock_open, mock_close):
+        self.assertEqual('GSM850', self.bts.get_band())
+        self.assertEqual('128', self.bts.get_arfcn_c0())
+        self.assertEqual('901', self.bts.get_mcc())
+        self.assertEqual('55', self.bts.get_mnc())
+        self.assertEqual('Test', self.bts.get_short_name())
+        load = self.bts.get_load()
+        self.assertEqual(1, load['ccch_sdcch4_load'])
+        self.assertEqual(2, load['tch_f_max'])
+        self.assertEqual(1, mock_open.call_count)
+        self.assertEqual(1, self.bts.bts.pipeline.call_count)
+
+    def test_set_drops_status(self, mock_open, mock_close):
+        self.bts.get_band()
+        with mock.patch('osmocom.vty.bts.BTS.set_band'):
+            self.bts.set_band('GSM900')
+        self.bts.get_band()
+        self.assertEqual(2, self.bts.bts.pipeline.call_count)
+
+    def test_ttl(self, mock_open, mock_close):
+        self.bts.get_band()
+        self.bts._status_time -= self.bts.STATUS_TTL
+        self.bts.get_band()
+        self.assertEqual(2, self.bts.bts.pipeline.call_count)
+
+    def test_invalid_bts(self, mock_open, mock_close):
+        self.bts.bts.pipeline.return_value = [
+            '', "% can't find BTS '0'", '', SHOW_NETWORK, '']
+        with self.assertRaises(BSSError):
+            self.bts.get_band()
@@ -0,0 +1,76 @@
+"""Tests for core.request_stats.
+
+Usage:
+    $ nosetests core.tests.request_stats_tests
+
+Copyright (c) 2016-present, Facebook, Inc.
+All rights reserved.
+
+This source code is licensed under the BSD-style license found in the
+LICENSE file in the root directory of this source tree. An additional grant
+of patent rights can be found in the PATENTS file in the same directory.
+"""
+
+import time
+import unittest
+
+from core import request_stats
+from core.request_stats import RequestStats
+
+
+class RequestStatsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.stats = RequestStats(flush_period=3600)
+        self.stats.pop()
+
+    def test_summarize(self):
+        counts = {'le_0.01': 9, 'le_0.1': 10, 'le_inf': 1, 'rejected': 2,
+                  'sum': 2.0}
+        summary = request_stats.summarize(counts)
+        self.assertEqual(20, summary['count'])
+        self.assertEqual(2, summary['rejected'])
+        self.assertAlmostEqual(0.1, summary['mean'])
+        self.assertEqual(0.1, summary['p50'])
+        self.assertEqual(0.1, summary['p95'])
+        self.assertEqual(0, summary['le_0.005'])
+        self.assertEqual(1, summary['le_inf'])
+        # Beyond the largest bound, report that bound.
+        self.assertEqual(10, request_stats.summarize({'le_inf': 1})['p95'])
+
+    def test_flush_and_pop(self):
+        """Counts are summed across flushes (and processes) until popped."""
+        other = RequestStats(flush_period=3600)
+        for stats in (self.stats, other):
+            stats.record('cdr', 0.003)
+            stats.record('cdr', 0.04)
+            stats.record('config', 0.3)
+            stats.flush()
+        # Not flushed yet.
+        self.stats.record('config', 0.3)
+        popped = self.stats.pop()
+        self.assertEqual(['cdr', 'config'], sorted(popped))
+        self.assertEqual(4, popped['cdr']['count'])
+        self.assertEqual(2, popped['cdr']['le_0.005'])
+        self.assertEqual(2, popped['cdr']['le_0.05'])
+        self.assertEqual(0.005, popped['cdr']['p50'])
+        self.assertEqual(2, popped['config']['count'])
+        self.assertEqual({}, self.stats.pop())
+        self.stats.flush()
+        self.assertEqual(1, self.stats.pop()['config']['count'])
+
+    def test_periodic_flush(self):
+        self.stats.flush_period = 0
+        self.stats.record('cdr', 0.003)
+        self.assertEqual(1, self.stats.pop()['cdr']['count'])
+
+    def test_idle_flush(self):
+        """Counts are flushed even if no other request comes."""
+        stats = RequestStats(flush_period=0.1)
+        stats.record('cdr', 0.003)
+        for _ in range(50):
+            time.sleep(0.1)
+            popped = self.stats.pop()
+            if popped:
+                break
+        self.assertEqual(1, popped['cdr']['count'])
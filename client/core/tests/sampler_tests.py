@@ -0,0 +1,85 @@
+"""Tests for core.sampler.
+
+Usage:
+    $ nosetests core.tests.sampler_tests
+
+Copyright (c) 2016-present, Facebook, Inc.
+All rights reserved.
+
+This source code is licensed under the BSD-style license found in the
+LICENSE file in the root directory of this source tree. An additional grant
+of patent rights can be found in the PATENTS file in the same directory.
+"""
+
+import time
+import unittest
+
+from core.exceptions import BSSError
+from core.sampler import Sampler, summarize
+
+
+class SummarizeTest(unittest.TestCase):
+
+    def test_odd(self):
+        self.assertEqual({'min': 1, 'mean': 3.0, 'median': 3, 'p95': 5},
+                         summarize([5, 1, 3, 4, 2]))
+
+    def test_even(self):
+        stats = summarize([4, 1, 3, 2])
+        self.assertEqual(2.5, stats['median'])
+        self.assertEqual(2.5, stats['mean'])
+
+    def test_p95(self):
+        """The 95th percentile is nearest-rank."""
+        self.assertEqual(95, summarize(list(range(1, 101)))['p95'])
+        self.assertEqual(7, summarize([7])['p95'])
+
+
+class SamplerTest(unittest.TestCase):
+    """Testing core.sampler.Sampler."""
+
+    def setUp(self):
+        self.loads = iter(range(100))
+        self.fail = False
+        self.sampler = Sampler({
+            'load': self._load,
+        }, period=0.01, window=3)
+
+    def _load(self):
+        if self.fail:
+            raise BSSError("BTS down")
+        return {'sdcch_load': next(self.loads), 'name': 'c0', 'up': True}
+
+    def test_window(self):
+        """Only the last `window` samples are summarized."""
+        for _ in range(5):
+            self.sampler.sample()
+        summary = self.sampler.summary('load')
+        self.assertEqual(3, summary['sdcch_load'])
+        self.assertEqual(2, summary['sdcch_load.min'])
+        self.assertEqual(4, summary['sdcch_load.p95'])
+        self.assertEqual(3.0, summary['sdcch_load.mean'])
+        self.assertEqual(3, summary['sdcch_load.median'])
+        # non-numeric stats are ignored
+        self.assertEqual(5, len(summary))
+
+    def test_no_samples(self):
+        self.assertEqual({}, self.sampler.summary('load'))
+        self.assertEqual({}, self.sampler.summary('noise'))
+
+    def test_failing_source(self):
+        """A failing source is skipped, keeping its earlier samples."""
+        self.sampler.sample()
+        self.fail = True
+        self.sampler.sample()
+        self.sampler.sample()
+        self.assertEqual(0, self.sampler.summary('load')['sdcch_load'])
+
+    def test_thread(self):
+        self.sampler.start()
+        deadline = time.time() + 2
+        while (self.sampler.summary('load').get('sdcch_load', 0) < 3 and
+               time.time() < deadline):
+            time.sleep(0.01)
+        self.sampler.stop()
+        self.assertTrue(self.sampler.summary('load')['sdcch_load'] >= 3)
@@ -14,7 +14,7 @@ of patent rights can be found in the PATENTS file in the same directory.
 import re
 import sqlite3
 
-from core.db.connector import BaseConnector
+from core.db.connector import BaseConnector, PooledConnector
 
 
 # exception used to simulate db restart during testing
@@ -49,8 +49,11 @@ class Sqlite3Connector(BaseConnector):
     db_errors = (sqlite3.Error, )
 
     def __init__(self):
-        # reuse a single sqlite3 in-memory instance across simulated restarts
-        self._backend = sqlite3.connect(':memory:', factory=Sqlite3Connection)
+        # reuse a single sqlite3 in-memory instance across simulated restarts;
+        # it's shared with threads of the code under test (e.g. the checkin
+        # status collectors), which sqlite3 serialises
+        self._backend = sqlite3.connect(':memory:', factory=Sqlite3Connection,
+                                        check_same_thread=False)
         # set the max number of connection retry attempts to two
         super(Sqlite3Connector, self).__init__(2)
 
@@ -58,6 +61,26 @@ class Sqlite3Connector(BaseConnector):
         self._connection = self._backend
 
 
+class Sqlite3PooledConnector(PooledConnector):
+    """
+    Pool of connections to a sqlite3 db file, for testing PooledConnector.
+    """
+
+    db_restart_errors = (RestartError, )
+    db_errors = (sqlite3.Error, )
+
+    def __init__(self, path, pool_size=2, **kwargs):
+        self._path = path
+        # count connections created, so tests can check reuse
+        self.connections_made = 0
+        super(Sqlite3PooledConnector, self).__init__(pool_size, **kwargs)
+
+    def new_connection(self):
+        self.connections_made += 1
+        return sqlite3.connect(self._path, factory=Sqlite3Connection,
+                               check_same_thread=False)
+
+
 class Sqlite3Cursor(sqlite3.Cursor):
     """
     sqlite3 uses simple '?' positional specifiers for param substitution
@@ -20,7 +20,10 @@ import json
 from random import randrange
 import unittest
 
+from ccm.common import crdt
 from core.subscriber import subscriber
+from core.subscriber._fakehlr import FakeSubscriberDB
+from core.subscriber.base import BaseSubscriberStatus
 
 
 class CreditTest(unittest.TestCase):
@@ -124,3 +127,82 @@ class CreditTest(unittest.TestCase):
         decrement = prior + randrange(1, 1000)
         subscriber.subtract_credit(self.TEST_IMSI, decrement)
         self.assertEqual(0, subscriber.get_account_balance(self.TEST_IMSI))
+
+
+class ProcessUpdateTest(unittest.TestCase):
+    """Testing the bulk sync of subscribers from a checkin response."""
+
+    @staticmethod
+    def balance(amount):
+        bal = crdt.PNCounter('cloud')
+        bal.increment(amount)
+        return bal.state
+
+    def setUp(self):
+        self.subscriber = FakeSubscriberDB()
+        # only consider the subs created by this test
+        self.subscriber._hlr = {}
+        self.imsis = ['IMSI90158%010d' % randrange(100, 1e10)
+                      for _ in range(3)]
+        for i, imsi in enumerate(self.imsis[:2]):
+            self.subscriber.create_subscriber(imsi, '555000%d' % i)
+        self.subscriber.update_balance(
+            self.imsis[0], crdt.PNCounter.from_state(self.balance(100)))
+        self.writes = []
+        upsert_many = self.subscriber._upsert_many
+
+        def spy(cur, data):
+            self.writes.extend(data)
+            upsert_many(cur, data)
+        self.subscriber._upsert_many = spy
+
+    def tearDown(self):
+        for imsi in self.imsis:
+            if imsi in self.subscriber:
+                del self.subscriber[imsi]
+
+    def test_process_update(self):
+        """Subs are added, merged and removed; unchanged rows aren't written.
+        """
+        self.subscriber.process_update({
+            self.imsis[0]: {'numbers': ['5550000'],
+                            'balance': self.balance(100)},
+            self.imsis[2]: {'numbers': ['5550002', '5550003'],
+                            'balance': self.balance(250)},
+        })
+        self.assertEqual({self.imsis[2]}, {k for k, _ in self.writes})
+        self.assertEqual(100,
+                         self.subscriber.get_account_balance(self.imsis[0]))
+        self.assertEqual(250,
+                         self.subscriber.get_account_balance(self.imsis[2]))
+        self.assertEqual(['5550002', '5550003'],
+                         self.subscriber._hlr[self.imsis[2]]['numbers'])
+        self.assertNotIn(self.imsis[1], self.subscriber)
+        self.assertNotIn(self.imsis[1], self.subscriber._hlr)
+
+    def test_merge(self):
+        """Cloud balances are merged with the local ones."""
+        self.subscriber.subtract_credit(self.imsis[0], 30)
+        self.subscriber.process_update({
+            self.imsis[0]: {'numbers': ['5550000'],
+                            'balance': self.balance(150)},
+            self.imsis[1]: {'numbers': ['5550001'], 'balance': 'corrupt'},
+        })
+        self.assertEqual(120,
+                         self.subscriber.get_account_balance(self.imsis[0]))
+        self.assertEqual(0,
+                         self.subscriber.get_account_balance(self.imsis[1]))
+
+    def test_status(self):
+        """Expired subs have their balance zeroed."""
+        status = BaseSubscriberStatus()
+        status.create_subscriber_status(
+            self.imsis[1], json.dumps({'state': 'active', 'validity': ''}))
+        status.process_update({
+            self.imsis[0]: {'state': 'expired', 'validity': '2017-01-01'},
+        })
+        self.assertEqual('expired', status.get_account_status(self.imsis[0]))
+        self.assertNotIn(self.imsis[1], status)
+        self.assertEqual(0,
+                         self.subscriber.get_account_balance(self.imsis[0]))
+        del status[self.imsis[0]]
@@ -12,9 +12,14 @@ of patent rights can be found in the PATENTS file in the same directory.
 """
 
 import datetime
+import gzip
+import os
+import shutil
+import tempfile
 import unittest
 
 import mock
+import pytz
 
 import core
 from core import config_database
@@ -29,6 +34,98 @@ class SystemUtilitiesTest(unittest.TestCase):
         self.assertTrue(uptime() > 0)
 
 
+class LogStreamTest(unittest.TestCase):
+    """Testing log_stream on a rotated log.
+
+    The log has an entry every minute: syslog.2.gz has the first 2000,
+    syslog.1 the next 2000 and syslog the last 2000, with some unparseable
+    lines mixed in.
+    """
+
+    START = datetime.datetime(2016, 1, 1, tzinfo=pytz.utc)
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.index_dir = os.path.join(self.tmpdir, 'index')
+        self.log_path = os.path.join(self.tmpdir, 'syslog')
+        self.entries = []
+        files = [('syslog.2.gz', gzip.open), ('syslog.1', open),
+                 ('syslog', open)]
+        for n, (name, opener) in enumerate(files):
+            with opener(os.path.join(self.tmpdir, name), 'wb') as f:
+                for i in range(2000 * n, 2000 * (n + 1)):
+                    t = self.START + datetime.timedelta(minutes=i)
+                    msg = ('%s host endaga: entry %d\n' % (
+                        t.strftime('%Y-%m-%dT%H:%M:%S.%f+00:00'), i))
+                    f.write(msg.encode('utf-8'))
+                    self.entries.append(msg.encode('utf-8'))
+                    if i % 100 == 0:
+                        f.write(b'not a log entry\n')
+            mtime = (t - system_utilities._EPOCH_UTC).total_seconds()
+            os.utime(os.path.join(self.tmpdir, name), (mtime, mtime))
+        self.original_interval = system_utilities.LOG_INDEX_INTERVAL
+        self.original_block = system_utilities.LOG_SEEK_BLOCK
+        system_utilities.LOG_INDEX_INTERVAL = 4096
+        system_utilities.LOG_SEEK_BLOCK = 1024
+
+    def tearDown(self):
+        system_utilities.LOG_INDEX_INTERVAL = self.original_interval
+        system_utilities.LOG_SEEK_BLOCK = self.original_block
+        shutil.rmtree(self.tmpdir)
+
+    def stream(self, first, last):
+        window_start = self.START + datetime.timedelta(minutes=first)
+        window_end = self.START + datetime.timedelta(minutes=last)
+        return list(system_utilities.log_stream(
+            self.log_path, window_start, window_end, self.index_dir))
+
+    def test_windows(self):
+        """Windows within and across files return the same entries."""
+        for first, last in [(0, 5999), (10, 20), (1990, 2010), (2500, 4500),
+                            (5990, 7000), (-100, 30)]:
+            self.assertEqual(self.entries[max(first, 0):last + 1],
+                             self.stream(first, last))
+            # again, with the index
+            self.assertEqual(self.entries[max(first, 0):last + 1],
+                             self.stream(first, last))
+
+    def test_outside(self):
+        self.assertEqual([], self.stream(-100, -1))
+        self.assertEqual([], self.stream(6000, 7000))
+
+    def test_index(self):
+        """With the index, reading a window of an archive only parses the
+        entries after the last checkpoint before it."""
+        self.assertEqual(self.entries[1500:1511], self.stream(1500, 1510))
+        self.assertEqual(1, len(os.listdir(self.index_dir)))
+        with mock.patch('core.system_utilities._log_time',
+                        wraps=system_utilities._log_time) as log_time:
+            self.assertEqual(self.entries[1500:1511],
+                             self.stream(1500, 1510))
+        self.assertTrue(log_time.call_count < 150)
+
+    def test_stale_index(self):
+        """Indexes of archives that were rotated away are removed."""
+        os.makedirs(self.index_dir)
+        stale = os.path.join(self.index_dir, 'syslog@1-2-3.json')
+        other = os.path.join(self.index_dir, 'auth.log@1-2-3.json')
+        for path in (stale, other):
+            open(path, 'w').close()
+        self.stream(0, 10)
+        self.assertFalse(os.path.exists(stale))
+        self.assertTrue(os.path.exists(other))
+
+    def test_log_time(self):
+        """Timestamps that aren't RFC 3339 are parsed by dateutil."""
+        for token in (b'2016-01-01T01:00:00+01:00', b'2016-01-01T00:00:00Z',
+                      b'2015-12-31T19:00:00.000000-0500',
+                      b'2016-01-01T00:00:00UTC'):
+            self.assertEqual(1451606400,
+                             system_utilities._log_time(token + b' msg'))
+        for msg in (b'2016-01-01T00:00:00 naive', b'garbage', b''):
+            self.assertEqual(None, system_utilities._log_time(msg))
+
+
 class AutoupgradeTest(unittest.TestCase):
     """Testing the autoupgrade methods."""
 
@@ -10,8 +10,8 @@ of patent rights can be found in the PATENTS file in the same directory.
 
 from freeswitch import consoleLog
 
-from core.subscriber import subscriber
-from core.subscriber.base import SubscriberNotFound
+from core.lookupd import client as lookupd
+from core.exceptions import SubscriberNotFound
 
 
 def chat(message, imsi):
@@ -21,7 +21,7 @@ def chat(message, imsi):
       imsi: a subscriber's IMSI
     """
     try:
-        account_balance = str(subscriber.get_account_balance(imsi))
+        account_balance = str(lookupd.get_account_balance(imsi))
     except SubscriberNotFound:
         account_balance = ''
     consoleLog('info', "Returned Chat: " + account_balance + "\n")
@@ -35,7 +35,7 @@ def fsapi(session, stream, env, imsi):
       imsi: a subscriber's IMSI
     """
     try:
-        account_balance = str(subscriber.get_account_balance(imsi))
+        account_balance = str(lookupd.get_account_balance(imsi))
     except SubscriberNotFound:
         account_balance = ''
     consoleLog('info', "Returned FSAPI: " + account_balance + "\n")
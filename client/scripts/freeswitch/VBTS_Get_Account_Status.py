@@ -10,8 +10,8 @@ of patent rights can be found in the PATENTS file in the same directory.
 
 from freeswitch import consoleLog
 
-from core.subscriber import subscriber
-from core.subscriber.base import SubscriberNotFound
+from core.lookupd import client as lookupd
+from core.exceptions import SubscriberNotFound
 
 
 def chat(message, args):
@@ -33,10 +33,10 @@ def chat(message, args):
             subscriber_state = 'active'
         else:
             subscriber_state = str(
-                subscriber.status().get_account_status(imsi)).lower()
+                lookupd.get_account_status(imsi)).lower()
     else:
         subscriber_state = str(
-                subscriber.status().get_account_status(imsi)).lower()
+                lookupd.get_account_status(imsi)).lower()
     try:
         account_status = False
         if not dest_imsi:
@@ -74,10 +74,10 @@ def fsapi(session, stream, env, args):
             subscriber_state = 'active'
         else:
             subscriber_state = str(
-                subscriber.status().get_account_status(imsi)).lower()
+                lookupd.get_account_status(imsi)).lower()
     else:
         subscriber_state = str(
-                subscriber.status().get_account_status(imsi)).lower()
+                lookupd.get_account_status(imsi)).lower()
     try:
         account_status = False
         if not dest_imsi:
@@ -13,7 +13,7 @@ of patent rights can be found in the PATENTS file in the same directory.
 import sys
 
 from freeswitch import consoleLog
-from core.subscriber import subscriber
+from core.lookupd import client as lookupd
 
 def chat(message, imsi):
     """Handle chat requests.
@@ -22,7 +22,7 @@ def chat(message, imsi):
       imsi: a subscriber's authorization
     """
     try:
-        auth = subscriber.is_authed(imsi)
+        auth = lookupd.is_authed(imsi)
     except Exception: # handle all failurs as no auth
         exc_type, exc_value, _ = sys.exc_info()
         consoleLog('error', "%s: %s\n" % (exc_type, exc_value))
@@ -38,7 +38,7 @@ def fsapi(session, stream, env, imsi):
       imsi: a subscriber's number
     """
     try:
-        auth = subscriber.is_authed(imsi)
+        auth = lookupd.is_authed(imsi)
     except Exception: # handle all failures as no auth
         exc_type, exc_value, _ = sys.exc_info()
         consoleLog('error', "%s: %s\n" % (exc_type, exc_value))
@@ -10,8 +10,8 @@ of patent rights can be found in the PATENTS file in the same directory.
 
 from freeswitch import consoleLog
 
-from core.subscriber import subscriber
-from core.subscriber.base import SubscriberNotFound
+from core.lookupd import client as lookupd
+from core.exceptions import SubscriberNotFound
 
 def chat(message, imsi):
     """Handle chat requests.
@@ -20,7 +20,7 @@ def chat(message, imsi):
       imsi: a subscriber's IMSI
     """
     try:
-        callerid = str(subscriber.get_caller_id(imsi))
+        callerid = str(lookupd.get_caller_id(imsi))
     except SubscriberNotFound:
         callerid = ''
     consoleLog('info', "Returned Chat: " + callerid + "\n")
@@ -34,7 +34,7 @@ def fsapi(session, stream, env, imsi):
       imsi: a subscriber's IMSI
     """
     try:
-        callerid = str(subscriber.get_caller_id(imsi))
+        callerid = str(lookupd.get_caller_id(imsi))
     except SubscriberNotFound:
         callerid = ''
     consoleLog('info', "Returned FSAPI: " + callerid + "\n")
@@ -9,8 +9,8 @@ of patent rights can be found in the PATENTS file in the same directory.
 """
 
 from freeswitch import consoleLog
-from core.subscriber import subscriber
-from core.subscriber.base import SubscriberNotFound
+from core.lookupd import client as lookupd
+from core.exceptions import SubscriberNotFound
 
 
 def chat(message, msisdn):
@@ -20,7 +20,7 @@ def chat(message, msisdn):
       msisdn: a subscriber's number
     """
     try:
-        imsi = str(subscriber.get_imsi_from_number(msisdn, False))
+        imsi = str(lookupd.get_imsi_from_number(msisdn, False))
     except SubscriberNotFound:
         imsi = ''
     consoleLog('info', "Returned Chat: " + imsi + "\n")
@@ -34,7 +34,7 @@ def fsapi(session, stream, env, msisdn):
       msisdn: a subscriber's number
     """
     try:
-        imsi = str(subscriber.get_imsi_from_number(msisdn, False))
+        imsi = str(lookupd.get_imsi_from_number(msisdn, False))
     except SubscriberNotFound:
         imsi = ''
     consoleLog('info', "Returned FSAPI: " + imsi + "\n")
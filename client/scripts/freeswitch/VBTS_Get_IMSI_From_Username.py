@@ -10,8 +10,8 @@ of patent rights can be found in the PATENTS file in the same directory.
 """
 
 from freeswitch import consoleLog
-from core.subscriber import subscriber
-from core.subscriber.base import SubscriberNotFound
+from core.lookupd import client as lookupd
+from core.exceptions import SubscriberNotFound
 
 
 def chat(message, username):
@@ -21,7 +21,7 @@ def chat(message, username):
       username: a sip username in the HLR
     """
     try:
-        imsi = str(subscriber.get_imsi_from_username(username))
+        imsi = str(lookupd.get_imsi_from_username(username))
     except SubscriberNotFound:
         imsi = ''
     consoleLog('info', "Returned Chat: " + imsi + "\n")
@@ -35,7 +35,7 @@ def fsapi(session, stream, env, username):
       username: a sip username in the hlr
     """
     try:
-        imsi = str(subscriber.get_imsi_from_username(username))
+        imsi = str(lookupd.get_imsi_from_username(username))
     except SubscriberNotFound:
         imsi = ''
     consoleLog('info', "Returned FSAPI: " + imsi + "\n")
@@ -10,7 +10,7 @@ of patent rights can be found in the PATENTS file in the same directory.
 
 from freeswitch import consoleLog
 
-from core.subscriber import subscriber
+from core.lookupd import client as lookupd
 
 
 def chat(message, imsi):
@@ -19,7 +19,7 @@ def chat(message, imsi):
     Args:
       imsi: a subscriber's IMSI
     """
-    ip_address = str(subscriber.get_ip(imsi))
+    ip_address = str(lookupd.get_ip(imsi))
     consoleLog('info', "Returned Chat: " + ip_address + "\n")
     message.chat_execute('set', '_openbts_ret=%s' % ip_address)
 
@@ -30,6 +30,6 @@ def fsapi(session, stream, env, imsi):
     Args:
       imsi: a subscriber's IMSI
     """
-    ip_address = str(subscriber.get_ip(imsi))
+    ip_address = str(lookupd.get_ip(imsi))
     consoleLog('info', "Returned FSAPI: " + ip_address + "\n")
     stream.write(ip_address)
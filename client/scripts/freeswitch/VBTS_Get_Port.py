@@ -10,7 +10,7 @@ of patent rights can be found in the PATENTS file in the same directory.
 
 from freeswitch import consoleLog
 
-from core.subscriber import subscriber
+from core.lookupd import client as lookupd
 
 
 def chat(message, imsi):
@@ -19,7 +19,7 @@ def chat(message, imsi):
     Args:
       imsi: a subscriber's IMSI
     """
-    port = str(subscriber.get_port(imsi))
+    port = str(lookupd.get_port(imsi))
     consoleLog('info', "Returned Chat: " + port + "\n")
     message.chat_execute('set', '_openbts_ret=%s' % port)
 
@@ -30,6 +30,6 @@ def fsapi(session, stream, env, imsi):
     Args:
       imsi: a subscriber's IMSI
     """
-    port = str(subscriber.get_port(imsi))
+    port = str(lookupd.get_port(imsi))
     consoleLog('info', "Returned FSAPI: " + port + "\n")
     stream.write(port)
@@ -7,7 +7,7 @@
 
 from freeswitch import consoleLog
 
-from core import billing
+from core.lookupd import client as lookupd
 from core import number_utilities
 
 
@@ -20,7 +20,7 @@ def chat(message, args):
     balance, service_type, destination_number = args.split('|')
     # Sanitize the destination number.
     destination_number = number_utilities.strip_number(destination_number)
-    res = str(billing.get_seconds_available(
+    res = str(lookupd.get_seconds_available(
         int(balance), service_type, destination_number))
     consoleLog('info', "Returned Chat: " + res + "\n")
     message.chat_execute('set', 'service_type=%s' % res)
@@ -35,7 +35,7 @@ def fsapi(session, stream, env, args):
     balance, service_type, destination_number = args.split('|')
     # Sanitize the destination number.
     destination_number = number_utilities.strip_number(destination_number)
-    res = str(billing.get_seconds_available(
+    res = str(lookupd.get_seconds_available(
         int(balance), service_type, destination_number))
     consoleLog('info', "Returned FSAPI: " + res + "\n")
     stream.write(res)
@@ -12,8 +12,8 @@ We use this because OpenBTS and Osmocom handle SIP user extensions differently.
 """
 
 from freeswitch import consoleLog
-from core.subscriber import subscriber
-from core.subscriber.base import SubscriberNotFound
+from core.lookupd import client as lookupd
+from core.exceptions import SubscriberNotFound
 
 
 def chat(message, imsi):
@@ -23,7 +23,7 @@ def chat(message, imsi):
       imsi: a subscriber's number
     """
     try:
-        name = str(subscriber.get_username_from_imsi(imsi))
+        name = str(lookupd.get_username_from_imsi(imsi))
     except SubscriberNotFound:
         name = ''
     consoleLog('info', "Returned Chat: " + name + "\n")
@@ -37,7 +37,7 @@ def fsapi(session, stream, env, imsi):
       imsi: a subscriber's number
     """
     try:
-        name = str(subscriber.get_username_from_imsi(imsi))
+        name = str(lookupd.get_username_from_imsi(imsi))
     except SubscriberNotFound:
         name = ''
     consoleLog('info', "Returned FSAPI: " + name + "\n")
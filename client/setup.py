@@ -38,6 +38,7 @@ setup(
         'core.fake_phone',
         'core.apps',
         'core.gprs',
+        'core.lookupd',
         'core.subscriber',
         'core.sms',
         'core.sms.freeswitch',
@@ -82,6 +83,7 @@ setup(
         'scripts/federer_server',
         'scripts/update_installed_versions',
         'scripts/endaga-gprsd',
+        'scripts/endaga-lookupd',
         'scripts/fake_phone_client',
         'scripts/rsyslog_processor',
         'scripts/log_level',
@@ -116,6 +118,7 @@ setup(
             'conf/registration/runwritable.conf',
             'conf/registration/endagad.conf',
             'conf/endaga-gprsd/endaga-gprsd-supervisor.conf',
+            'conf/endaga-lookupd/endaga-lookupd-supervisor.conf',
         ]),
         ('/etc/lighttpd/conf-enabled/', [
             'conf/10-federer-fastcgi.conf',
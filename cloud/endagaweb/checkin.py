@@ -247,36 +247,60 @@ class CheckinResponder(object):
         of the checkin. Multiple checkin sections can use this, and as long as
         they're all just a dictionary of key-value timeseries pairs they can be
         processed with this generic handler.
+
+        The values are inserted in one statement, since sampled stats carry
+        several keys each.
         """
         now = django.utils.timezone.now()
-        for key in section.keys():
-            with transaction.atomic():
-                stat = TimeseriesStat(
-                    key=key, value=section[key], date=now,
-                    bts=self.bts, network=self.bts.network)
-                stat.save()
+        TimeseriesStat.objects.bulk_create([
+            TimeseriesStat(key=key, value=section[key], date=now,
+                           bts=self.bts, network=self.bts.network)
+            for key in section.keys()])
 
     def subscribers_handler(self, subscribers):
         """
         Update the subscribers' balance info based on what the client submits.
 
+        Clients send only the delta from the balance we last sent them (older
+        ones send it whole), and merging either gives the same result. The
+        subscribers are locked and loaded in one query, and only balances
+        that actually changed are saved.
+
         TODO(shasan): handle new numbers?
         """
+        client_bals = {}
         for imsi in subscribers:
             bal = subscribers[imsi]['balance']
             try:
                 # comes in as JSON
-                client_bal = crdt.PNCounter.from_json(bal)
+                client_bals[imsi] = crdt.PNCounter.from_json(bal)
             except ValueError:
                 logging.error("Invalid balance! Skipping %s:%s" %
                               (imsi, bal))
-                continue
-            try:
-                Subscriber.update_balance(imsi, client_bal)
-            except Subscriber.DoesNotExist:
-                logging.error("Subscriber %s doesn't exist, skipping!" %
-                              (imsi, ))
-                continue
+        if not client_bals:
+            return
+        with transaction.atomic():
+            # lock in a fixed order, since towers report overlapping IMSIs
+            subs = Subscriber.objects.select_for_update().filter(
+                imsi__in=list(client_bals)).order_by('pk')
+            subs = dict((s.imsi, s) for s in subs)
+            for imsi, client_bal in client_bals.items():
+                if imsi not in subs:
+                    logging.error("Subscriber %s doesn't exist, skipping!" %
+                                  (imsi, ))
+                    continue
+                s = subs[imsi]
+                try:
+                    sbal = crdt.PNCounter.from_json(s.crdt_balance)
+                except ValueError:
+                    logging.error("Invalid stored balance! Skipping %s:%s" %
+                                  (imsi, s.crdt_balance))
+                    continue
+                new_bal = crdt.PNCounter.merge(client_bal, sbal)
+                if new_bal.state == sbal.state:
+                    continue
+                s.crdt_balance = new_bal.serialize()
+                s.save()
 
     def subscriber_status_handler(self, subscriber_status):
         """
@@ -24,6 +24,7 @@ from django import test
 from django.test import TestCase
 
 from ccm.common import crdt
+from endagaweb import checkin
 from endagaweb import models
 from endagaweb import tasks
 import time
@@ -125,6 +126,34 @@ class SubscriberBalanceTests(TestBase):
         with self.assertRaises(ValueError):
             sub.balance = randrange(1, 1000)
 
+    def test_checkin_balance_delta(self):
+        """ A BTS's delta merges like its whole balance would. """
+        imsi = self.gen_imsi()
+        sbal = crdt.PNCounter.from_json(
+            self.add_sub(imsi, balance=500).crdt_balance)
+        bts_bal = crdt.PNCounter.merge(sbal, crdt.PNCounter('bts'), 'bts')
+        bts_bal.decrement(100)
+        delta = bts_bal.delta(sbal)
+        handler = checkin.CheckinResponder(None)
+        for _ in range(2):
+            handler.subscribers_handler(
+                {imsi: {'balance': delta.serialize()},
+                 self.gen_imsi(): {'balance': delta.serialize()}})
+            self.assertEqual(self.get_sub(imsi).balance, 400)
+
+    def test_checkin_invalid_stored_balance(self):
+        """ A corrupt stored balance only skips that subscriber. """
+        bad, good = self.gen_imsi(), self.gen_imsi()
+        sub = self.add_sub(bad)
+        sub.crdt_balance = 'garbage'
+        sub.save()
+        self.add_sub(good, balance=500)
+        update = self.gen_crdt(100).serialize()
+        checkin.CheckinResponder(None).subscribers_handler(
+            {bad: {'balance': update}, good: {'balance': update}})
+        self.assertEqual('garbage', self.get_sub(bad).crdt_balance)
+        self.assertEqual(self.get_sub(good).balance, 600)
+
 
 class ActiveSubscriberTests(TestBase):
     """
@@ -9,7 +9,6 @@ of patent rights can be found in the PATENTS file in the same directory.
 """
 
 import urlparse
-import xml.dom.minidom
 import xml.parsers.expat
 
 from rest_framework import status
@@ -22,6 +21,7 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 
 from ccm.common import logger
+from ccm.common.utils import xml_cdr
 from endagaweb.util.api import get_network_from_user
 from endagaweb.models import Number, BTS, UserProfile, Network
 
@@ -159,19 +159,13 @@ class BillVoice(APIView):
     Receives CDRs from our internal system.
     """
 
-    def getText(self, nodelist):
-        """Get the text value of an XML tag (from the minidom doc)."""
-        rc = []
-        for node in nodelist:
-            if node.nodeType == node.TEXT_NODE:
-                rc.append(node.data)
-        return ''.join(rc)
-
     def post(self, request, format=None):
         """Handle POST requests."""
-        # First make sure the dom parses.
+        # Extract the tags we need, making sure the XML parses.
+        tag_names = ["billsec", "username", "caller_id_name",
+                     "network_addr", "destination_number"]
         try:
-            dom = xml.dom.minidom.parseString(request.POST['cdr'])
+            tags = xml_cdr.parse_tags(request.POST['cdr'], tag_names)
         except xml.parsers.expat.ExpatError:
             logger.warning("invalid XML CDR: '%s'" % (request.POST['cdr'], ))
             return Response("Bad XML", status=status.HTTP_400_BAD_REQUEST)
@@ -181,15 +175,11 @@ class BillVoice(APIView):
         # Then make sure all of the necessary pieces are there.  Fail if any
         # required tags are missing
         data = {}
-        for tag_name in ["billsec", "username", "caller_id_name",
-                         "network_addr", "destination_number"]:
-            data[tag_name] = dom.getElementsByTagName(tag_name)
-        for tag_name in data:
-            if not data[tag_name]:
+        for tag_name in tag_names:
+            data[tag_name] = xml_cdr.get_tag_text(tags, tag_name)
+            if data[tag_name] is None:
                 return Response("Missing XML",
                                 status=status.HTTP_400_BAD_REQUEST)
-            else:
-                data[tag_name] = self.getText(data[tag_name][0].childNodes)
         # Convert certain tags to ints.
         for tag_name in ["billsec"]:
             data[tag_name] = int(data[tag_name])
@@ -24,6 +24,43 @@ if not NAME:
     import uuid
     NAME = str(uuid.uuid4())
 
+# Key of the entry that holds the counts of replicas folded away by
+# PNCounter.compact(). It's an ordinary entry as far as value() and older
+# versions of this module are concerned.
+BASE = '~base'
+
+
+def _merge_counts(x, y):
+    """ Entry-wise max of two GCounter states, without zero entries. """
+    if len(x) < len(y):
+        x, y = y, x
+    z = dict(x)
+    for k, v in y.items():
+        if v > z.get(k, 0):
+            z[k] = v
+    return z
+
+
+def _ahead(x, y):
+    """ The entries of GCounter state x that are greater than in y. """
+    return dict((k, v) for (k, v) in x.items() if v > y.get(k, 0))
+
+
+def _valid_counts(state):
+    """ Returns a GCounter state as a new dict without zero entries, or
+    raises ValueError. """
+    try:
+        counts = dict(state)
+        for v in counts.values():
+            if type(v) is not int:
+                int(v)  # make sure everything is an int
+    except Exception:
+        raise ValueError("Invalid state for GCounter")
+    for k in [k for k, v in counts.items() if not v]:
+        del counts[k]
+    return counts
+
+
 class StateCRDT(object):
     """
     This class represents a state-based CRDT, or convergent replicated data
@@ -32,6 +69,7 @@ class StateCRDT(object):
 
     The "state" of the StateCRDT is a json-able object.
     """
+    __slots__ = ('name', '_state')
 
     def __init__(self, name=None):
         if name:
@@ -78,7 +116,12 @@ class StateCRDT(object):
 class GCounter(StateCRDT):
     """
     The GCounter is an increment-only counter.
+
+    Its state maps replica names to counts. Replicas that haven't counted
+    anything are left out of states built by merge() and from_state().
     """
+    __slots__ = ()
+
     def __init__(self, name=None):
         super(GCounter, self).__init__(name)
         self._state = {self.name: 0}
@@ -86,20 +129,37 @@ class GCounter(StateCRDT):
     def increment(self, amount=1):
         if abs(amount) != amount:
             raise ValueError("GCounter is increment-only, must use positive value")
-        self.state[self.name] += amount
+        self._state[self.name] = self._state.get(self.name, 0) + amount
 
     def value(self):
         """
         Returns an integer value of this counter.
         """
-        return sum(self.state.values())
+        return sum(self._state.values())
 
     def is_used(self):
-        for s in self.state.keys():
-            if (self.state[s] !=  0):
+        for v in self._state.values():
+            if v != 0:
                 return True
         return False
 
+    def delta(self, since=None):
+        """
+        Returns a GCounter with only the entries that are ahead of since,
+        i.e., what merging this counter adds to since. If since is None,
+        that's every entry.
+        """
+        if since is None:
+            return GCounter._new(dict(self.state), self.name)
+        return GCounter._new(_ahead(self.state, since.state), self.name)
+
+    @classmethod
+    def _new(cls, counts, name):
+        new = cls.__new__(cls)
+        new.name = name or NAME
+        new._state = counts
+        return new
+
     @classmethod
     def merge(cls, x, y, name=None):
         """
@@ -107,20 +167,13 @@ class GCounter(StateCRDT):
 
         For each key, in each, return the max value of the two.
         """
-        keys = set(set(x.state.keys()) | set(y.state.keys()))
-        z = dict([(k, max(x.state.get(k, 0), y.state.get(k, 0))) for k in keys])
-        return GCounter.from_state(z, name=name)
+        return cls._new(_merge_counts(x.state, y.state), name)
 
     @classmethod
     def from_state(cls, state, name=None):
-        new = GCounter(name=name)
-        try:
-            keys = set(set(new.state.keys()) | set(state.keys()))
-            new.state = dict([(k, max(new.state.get(k, 0), state.get(k, 0))) for k in keys])
-            [int(_) for _ in new.state.values()] # make sure everything is an int
-        except:
+        if not isinstance(state, dict):
             raise ValueError("Invalid state for GCounter")
-        return new
+        return cls._new(_valid_counts(state), name)
 
 
 class PNCounter(StateCRDT):
@@ -128,15 +181,32 @@ class PNCounter(StateCRDT):
     A PNCounter is a counter that can be incremented or decremented.
     Internally, it's a combination of two GCounters (one for increments and one
     for decrements).
+
+    Each replica that ever touches a counter adds an entry to it. compact()
+    folds the entries of replicas that are gone for good (e.g., deregistered
+    BTSs) into a BASE entry and starts a new epoch; merge() drops the
+    entries of those replicas from states of the previous epoch, as they're
+    already counted in BASE. Only one replica (the cloud) may compact, and
+    only once every other replica has caught up with the current epoch,
+    since a replica two epochs behind could bring back entries folded in
+    the earlier compaction. The names of the retired replicas are kept for
+    that one epoch; compact([]) then drops them.
     """
+    __slots__ = ('P', 'N', 'epoch', 'retired')
+
     def __init__(self, name=None):
         super(PNCounter, self).__init__(name)
         self.P = GCounter(self.name)
         self.N = GCounter(self.name)
-        self._state = {"p": self.P.state, "n": self.N.state}
+        self.epoch = 0
+        self.retired = frozenset()
 
     def get_state(self):
-        return {"p": self.P.state, "n": self.N.state}
+        state = {"p": self.P.state, "n": self.N.state}
+        if self.epoch:
+            state["e"] = self.epoch
+            state["r"] = sorted(self.retired)
+        return state
     state = property(get_state)
 
     def increment(self, amount=1):
@@ -152,25 +222,74 @@ class PNCounter(StateCRDT):
     def is_used(self):
         return self.P.is_used() or self.N.is_used()
 
+    def compact(self, replicas):
+        """
+        Folds the counts of the given replicas into BASE, drops zero
+        entries and starts a new epoch. The replicas must never count again.
+        """
+        for counter in (self.P, self.N):
+            counts = _valid_counts(counter.state)
+            for replica in replicas:
+                if replica != BASE and replica in counts:
+                    counts[BASE] = counts.get(BASE, 0) + counts.pop(replica)
+            counter.state = counts
+        self.epoch += 1
+        self.retired = frozenset(replicas)
+
+    def delta(self, since=None):
+        """
+        Returns a PNCounter with only the entries that are ahead of since,
+        e.g., the last state the other side acknowledged. Merging the delta
+        into since, or into anything that has since merged it, gives the same
+        result as merging this counter; merging it again changes nothing.
+        """
+        if since is None:
+            p, n = self.P.delta(), self.N.delta()
+        else:
+            p, n = self.P.delta(since.P), self.N.delta(since.N)
+        return PNCounter._new(p.state, n.state, self.epoch, self.retired,
+                              self.name)
+
+    @classmethod
+    def _new(cls, p, n, epoch, retired, name):
+        new = cls.__new__(cls)
+        new.name = name or NAME
+        new._state = None
+        new.P = GCounter._new(p, new.name)
+        new.N = GCounter._new(n, new.name)
+        new.epoch = epoch
+        new.retired = retired
+        return new
+
     @classmethod
     def merge(cls, x, y, name=None):
         """
         Returns an object that reflects the merged state of the two CRDTs.
         """
-        newP = GCounter.merge(x.P, y.P, name=name)
-        newN = GCounter.merge(x.N, y.N, name=name)
-        new_state = {"p": newP.state, "n": newN.state}
-        return PNCounter.from_state(new_state, name=name)
+        if x.epoch < y.epoch:
+            x, y = y, x
+        yp, yn = y.P.state, y.N.state
+        if y.epoch < x.epoch:
+            # already counted in x's BASE
+            yp = dict((k, v) for (k, v) in yp.items() if k not in x.retired)
+            yn = dict((k, v) for (k, v) in yn.items() if k not in x.retired)
+            retired = x.retired
+        else:
+            retired = x.retired | y.retired
+        return cls._new(_merge_counts(x.P.state, yp),
+                        _merge_counts(x.N.state, yn),
+                        x.epoch, retired, name)
 
     @classmethod
     def from_state(cls, state, name=None):
-        new = PNCounter(name=name)
         try:
-            new.P = GCounter.from_state(state['p'], name=new.name)
-            new.N = GCounter.from_state(state['n'], name=new.name)
-        except:
+            p = _valid_counts(state['p'])
+            n = _valid_counts(state['n'])
+            epoch = int(state.get('e', 0))
+            retired = frozenset(state.get('r', ()))
+        except Exception:
             raise ValueError("Invalid state for PN counter")
-        return new
+        return cls._new(p, n, epoch, retired, name)
 
     @classmethod
     def from_json(cls, jstate, name=None):
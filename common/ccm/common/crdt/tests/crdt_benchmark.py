@@ -0,0 +1,113 @@
+"""ccm.common.crdt.tests.crdt_benchmark
+times PNCounter parse, merge and serialize over a network of subscribers
+
+Builds one balance per subscriber, each touched by the cloud and several
+BTSs over time (most of them since retired), and a second, diverged copy of
+each as a BTS would send it at checkin. Then times loading all of them from
+JSON, merging the copies and serializing the results, as a checkin does on
+either side, the same once the retired BTSs have been compacted away, and
+once more with the BTS shipping only the delta from the cloud's state.
+
+Usage:
+    $ python -m ccm.common.crdt.tests.crdt_benchmark [num_subscribers]
+
+Copyright (c) 2016-present, Facebook, Inc.
+All rights reserved.
+
+This source code is licensed under the BSD-style license found in the
+LICENSE file in the root directory of this source tree. An additional grant
+of patent rights can be found in the PATENTS file in the same directory.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import random
+import sys
+import time
+
+from ccm.common.crdt import PNCounter
+
+# snowflake-like replica names
+BTSS = ['%032x' % random.getrandbits(128) for _ in range(8)]
+RETIRED = BTSS[:6]
+
+
+def build(num_subscribers):
+    """Returns the JSON balances of the cloud and of a BTS."""
+    cloud, bts = [], []
+    for _ in range(num_subscribers):
+        bal = PNCounter('cloud')
+        bal.increment(random.randint(1, 10 ** 6))
+        for name in BTSS:
+            bal = PNCounter.merge(bal, PNCounter(name), name)
+            bal.decrement(random.randint(0, 10 ** 4))
+        cloud.append(bal.serialize())
+        bal.decrement(random.randint(1, 100))
+        bts.append(bal.serialize())
+    return cloud, bts
+
+
+def report(name, latencies, total):
+    latencies = sorted(latencies)
+    print("%-24s mean %7.2f us  p50 %7.2f us  p95 %7.2f us  total %6.1f ms" % (
+        name,
+        10 ** 6 * sum(latencies) / len(latencies),
+        10 ** 6 * latencies[len(latencies) // 2],
+        10 ** 6 * latencies[int(len(latencies) * 0.95)],
+        1000 * total))
+
+
+def timed(items, fn):
+    latencies = []
+    results = []
+    start = time.time()
+    for item in items:
+        t = time.time()
+        results.append(fn(item))
+        latencies.append(time.time() - t)
+    return results, latencies, time.time() - start
+
+
+def run(label, cloud, bts):
+    parsed, latencies, total = timed(cloud + bts, PNCounter.from_json)
+    report('%s: parse' % label, latencies, total)
+    pairs = list(zip(parsed[:len(cloud)], parsed[len(cloud):]))
+    merged, latencies, total = timed(
+        pairs, lambda xy: PNCounter.merge(xy[0], xy[1], 'cloud'))
+    report('%s: merge' % label, latencies, total)
+    _, latencies, total = timed(merged, lambda bal: bal.serialize())
+    report('%s: serialize' % label, latencies, total)
+    print('%s: %.0f bytes per balance, %.0f per BTS update' % (
+        label, sum(len(s) for s in cloud) / len(cloud),
+        sum(len(s) for s in bts) / len(bts)))
+
+
+def main(num_subscribers):
+    cloud, bts = build(num_subscribers)
+    print('%d subscribers, %d replicas each' % (num_subscribers,
+                                                  len(BTSS) + 1))
+    run('full', cloud, bts)
+    if hasattr(PNCounter, 'compact'):
+        compacted = []
+        for state in cloud:
+            bal = PNCounter.from_json(state, 'cloud')
+            bal.compact(RETIRED)
+            # once every BTS has caught up, the retired names can go too
+            bal.compact([])
+            compacted.append(bal.serialize())
+        bts = [PNCounter.merge(PNCounter.from_json(c),
+                               PNCounter.from_json(b)).serialize()
+               for c, b in zip(compacted, bts)]
+        run('compacted', compacted, bts)
+    if hasattr(PNCounter, 'delta'):
+        # the BTS only ships what the cloud hasn't acknowledged yet
+        bts = [PNCounter.from_json(b).delta(PNCounter.from_json(c))
+               .serialize() for c, b in zip(cloud, bts)]
+        run('delta', cloud, bts)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -98,3 +98,118 @@ class PNCounterTestCase(TestCase):
         self.assertTrue(self.pn.is_used())
         self.pn.decrement()
         self.assertTrue(self.pn.is_used())
+
+    def test_zero_entries(self):
+        """ Replicas that haven't counted are left out of loaded states. """
+        state = {'p': {'pn4': 4, 'pn5': 0}, 'n': {'pn6': 0}}
+        pn = base.PNCounter.from_state(state, name="pntest")
+        self.assertEqual({'p': {'pn4': 4}, 'n': {}}, pn.state)
+        pn.decrement(2)
+        self.assertEqual({'p': {'pn4': 4}, 'n': {'pntest': 2}}, pn.state)
+
+    def test_merge_does_not_share_state(self):
+        self.pn.increment(5)
+        pn3 = base.PNCounter.merge(self.pn, self.pn2, "pn3")
+        pn3.increment(1)
+        self.assertEqual(self.pn.value(), 5)
+        self.assertEqual(pn3.value(), 6)
+
+
+class CompactionTestCase(TestCase):
+    def setUp(self):
+        # the cloud, an active BTS and a deregistered one
+        self.cloud = base.PNCounter("cloud")
+        self.cloud.increment(1000)
+        self.bts = base.PNCounter.merge(self.cloud, base.PNCounter("bts"),
+                                        "bts")
+        self.bts.decrement(100)
+        self.old_bts = base.PNCounter.merge(self.cloud,
+                                            base.PNCounter("old_bts"),
+                                            "old_bts")
+        self.old_bts.decrement(300)
+        for other in (self.bts, self.old_bts):
+            self.cloud = base.PNCounter.merge(self.cloud, other, "cloud")
+        self.assertEqual(600, self.cloud.value())
+
+    def test_compact(self):
+        self.cloud.compact(["old_bts"])
+        self.assertEqual(600, self.cloud.value())
+        self.assertEqual(1, self.cloud.epoch)
+        self.assertEqual({'p': {'cloud': 1000},
+                          'n': {'bts': 100, '~base': 300},
+                          'e': 1, 'r': ['old_bts']}, self.cloud.state)
+        # once everyone has caught up, the retired names are dropped
+        self.cloud.compact([])
+        self.assertEqual(2, self.cloud.epoch)
+        self.assertEqual([], self.cloud.state['r'])
+        self.assertEqual(600, self.cloud.value())
+
+    def test_merge_previous_epoch(self):
+        """ Entries of retired replicas in older states aren't counted
+        twice, and the newer epoch wins whichever way round. """
+        self.cloud.compact(["old_bts"])
+        self.bts.decrement(50)
+        for x, y in ((self.cloud, self.bts), (self.bts, self.cloud)):
+            merged = base.PNCounter.merge(x, y, "bts")
+            self.assertEqual(550, merged.value())
+            self.assertEqual(1, merged.epoch)
+            self.assertFalse('old_bts' in merged.N.state)
+        # the BTS catches up and keeps counting in the new epoch
+        self.bts = base.PNCounter.merge(self.bts, self.cloud, "bts")
+        self.bts.decrement(10)
+        merged = base.PNCounter.merge(self.cloud, self.bts, "cloud")
+        self.assertEqual(540, merged.value())
+
+    def test_serialize(self):
+        self.cloud.compact(["old_bts"])
+        pn = base.PNCounter.from_json(self.cloud.serialize(), "bts")
+        self.assertEqual(600, pn.value())
+        self.assertEqual(1, pn.epoch)
+        self.assertEqual(frozenset(["old_bts"]), pn.retired)
+
+    def test_old_format(self):
+        """ Uncompacted states don't carry an epoch, as before. """
+        self.assertEqual(set(['p', 'n']), set(self.cloud.state))
+        pn = base.PNCounter.from_json(self.cloud.serialize())
+        self.assertEqual(0, pn.epoch)
+
+
+class DeltaTestCase(TestCase):
+    def setUp(self):
+        self.cloud = base.PNCounter("cloud")
+        self.cloud.increment(1000)
+        # what the BTS last heard from the cloud
+        self.acked = base.PNCounter.from_state(self.cloud.state, "bts")
+        self.bts = base.PNCounter.merge(self.acked, base.PNCounter("bts"),
+                                        "bts")
+        self.bts.decrement(100)
+
+    def test_delta(self):
+        delta = self.bts.delta(self.acked)
+        self.assertEqual({'p': {}, 'n': {'bts': 100}}, delta.state)
+        self.assertEqual({'p': {}, 'n': {}}, self.bts.delta(self.bts).state)
+        self.assertEqual(self.bts.state, self.bts.delta().state)
+
+    def test_merge_delta(self):
+        """ Merging the delta is the same as merging the whole state, and
+        merging it again changes nothing. """
+        self.cloud.increment(50)
+        delta = self.bts.delta(self.acked)
+        merged = base.PNCounter.merge(self.cloud, delta, "cloud")
+        self.assertEqual(
+            base.PNCounter.merge(self.cloud, self.bts, "cloud").state,
+            merged.state)
+        self.assertEqual(950, merged.value())
+        self.assertEqual(
+            merged.state,
+            base.PNCounter.merge(merged, delta, "cloud").state)
+
+    def test_delta_epoch(self):
+        """ Deltas carry the epoch, so retired entries are still dropped. """
+        self.cloud.compact([])
+        self.acked = base.PNCounter.from_state(self.cloud.state, "bts")
+        self.bts = base.PNCounter.merge(self.bts, self.acked, "bts")
+        delta = self.bts.delta(self.acked)
+        self.assertEqual(1, delta.epoch)
+        merged = base.PNCounter.merge(self.cloud, delta, "cloud")
+        self.assertEqual(900, merged.value())
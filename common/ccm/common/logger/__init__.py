@@ -5,6 +5,9 @@ logger() method. We also install a syslog handler on the root logger so
 that all messages that are created using the logging module get sent to
 syslog, even if they didn't originate from this module.
 
+If the environment variable CCM_LOG_QUEUE_SIZE is set, the syslog handler
+is wrapped in a QueuedHandler so that callers don't wait on syslog.
+
 Copyright (c) 2016-present, Facebook, Inc.
 All rights reserved.
 
@@ -18,14 +21,19 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import copy
 import errno
 import logging
 from logging.handlers import SysLogHandler
 from os import environ
 from sys import stderr
 from syslog import LOG_DEBUG, LOG_LOCAL4
+import threading
+import time
 import traceback
 
+from six.moves import queue
+
 
 # add a 'notice' level, between WARNING (30)  and INFO (20)
 _NOTICE = 25
@@ -38,6 +46,126 @@ SIMPLE_FORMAT = "%(filename)s:%(lineno)d:%(funcName)s: %(message)s"
 VERBOSE_FORMAT = "[%(levelname)s] " + SIMPLE_FORMAT
 
 
+class QueuedHandler(logging.Handler):
+    """ Hands records to another handler on a background thread.
+
+    Records go through a bounded queue, so a stalled handler (e.g., syslog
+    while rsyslog flushes to flash) doesn't stall the callers; when the
+    queue is full, records are dropped and counted. A notice (or lower)
+    from the same call site and level as one emitted less than
+    dedup_interval seconds ago is suppressed, whatever its arguments, and
+    the next one emitted from that site says how many were.
+    """
+
+    # records above this level, e.g., warnings, are never suppressed
+    DEDUP_LEVEL = _NOTICE
+    # records we keep to recognise repeats before dropping stale ones
+    MAX_RECENT = 1000
+
+    def __init__(self, target, capacity=1000, dedup_interval=10.0):
+        super(QueuedHandler, self).__init__()
+        self.target = target
+        self.dedup_interval = dedup_interval
+        self.dropped = 0
+        self.suppressed = 0
+        self._queue = queue.Queue(capacity)
+        # (level, path, line) -> [time emitted, suppressed]
+        self._recent = {}
+        self._writer = threading.Thread(target=self._write,
+                                        name='QueuedHandler')
+        self._writer.daemon = True
+        self._writer.start()
+
+    def setFormatter(self, fmt):
+        # records are formatted by the target
+        super(QueuedHandler, self).setFormatter(fmt)
+        self.target.setFormatter(fmt)
+
+    def emit(self, record):
+        # other handlers get the same record, so don't change it
+        record = copy.copy(record)
+        message = record.getMessage()
+        if record.levelno <= self.DEDUP_LEVEL:
+            message = self._dedup(record, message)
+            if message is None:
+                return
+        # format what the target can't once we've returned to the caller
+        record.msg, record.args = message, None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(
+                record.exc_info)
+            record.exc_info = None
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            with self.lock:
+                self.dropped += 1
+
+    def _dedup(self, record, message):
+        """ Returns the message to emit, or None if it's suppressed. """
+        now = time.time()
+        # repeated notices differ in their arguments, e.g., the key and
+        # values of "changing key: %s -> %s (was %s)"
+        key = (record.levelno, record.pathname, record.lineno)
+        with self.lock:
+            recent = self._recent.get(key)
+            if recent and now - recent[0] < self.dedup_interval:
+                recent[1] += 1
+                self.suppressed += 1
+                return None
+            if recent and recent[1]:
+                message += " (%d similar suppressed)" % (recent[1], )
+            if len(self._recent) >= self.MAX_RECENT:
+                self._recent = dict(
+                    (k, v) for (k, v) in self._recent.items()
+                    if now - v[0] < self.dedup_interval)
+            self._recent[key] = [now, 0]
+        return message
+
+    def _write(self):
+        while True:
+            record = self._queue.get()
+            try:
+                if record is None:
+                    return
+                self.target.handle(record)
+            except Exception:
+                self.handleError(record)
+            finally:
+                self._queue.task_done()
+
+    def stats(self):
+        """ Returns the queue depth and the counts of records dropped and
+        suppressed as repeats so far. """
+        with self.lock:
+            return {
+                'queued': self._queue.qsize(),
+                'dropped': self.dropped,
+                'suppressed': self.suppressed,
+            }
+
+    def flush(self, timeout=1.0):
+        """ Waits up to timeout seconds for the queued records to be
+        written. """
+        deadline = time.time() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self._queue.all_tasks_done.wait(remaining)
+        self.target.flush()
+
+    def close(self):
+        try:
+            self._queue.put(None, timeout=1.0)
+            self._writer.join(1.0)
+        except queue.Full:
+            pass
+        self.target.close()
+        super(QueuedHandler, self).close()
+
+
 class DefaultLogger(object):
     """ Capture state of default logging config.
 
@@ -153,6 +281,9 @@ try:
     # that env, so the empty socket name prevents adding our root handler.
     if sock:
         handler = SysLogHandler(address=sock, facility=LOG_LOCAL4)
+        queue_size = int(environ.get('CCM_LOG_QUEUE_SIZE', 0))
+        if queue_size > 0:
+            handler = QueuedHandler(handler, queue_size)
     else:
         handler = None
     DefaultLogger.update_handler(
@@ -173,6 +304,14 @@ LOG_LEVELS = ['EMERGENCY', 'ALERT', 'CRITICAL', 'ERROR', 'WARNING', 'NOTICE',
               'INFO', 'DEBUG']
 
 
+def queue_stats():
+    """ Returns the stats of the default handler if it's a QueuedHandler,
+    else an empty dict. """
+    if isinstance(DefaultLogger._log_handler, QueuedHandler):
+        return DefaultLogger._log_handler.stats()
+    return {}
+
+
 def emergency(message, **kwargs):
     """Level 0"""
     _handle_log_event(logging.CRITICAL, message, **kwargs)
@@ -18,6 +18,8 @@ from __future__ import unicode_literals
 
 from io import StringIO
 import logging
+import threading
+import time
 import unittest
 
 from ccm.common import logger
@@ -97,3 +99,112 @@ class LoggerTest(unittest.TestCase):
         output = self.logbuf.read()
         # trim newline from end of output before comparing
         self.assertRegexpMatches(output[:-1], expected)
+
+
+class BlockingHandler(logging.Handler):
+    """ Collects the messages it's given, once it's unblocked. """
+
+    def __init__(self):
+        super(BlockingHandler, self).__init__()
+        self.unblocked = threading.Event()
+        self.messages = []
+
+    def emit(self, record):
+        self.unblocked.wait()
+        self.messages.append(self.format(record))
+
+
+class QueuedHandlerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.target = BlockingHandler()
+        self.handler = logger.QueuedHandler(self.target, capacity=3,
+                                            dedup_interval=60)
+        self.handler.setFormatter(logging.Formatter("%(message)s"))
+        self.log = logging.getLogger('queued_handler_test')
+        self.log.propagate = False
+        self.log.setLevel(logging.DEBUG)
+        self.log.addHandler(self.handler)
+
+    def tearDown(self):
+        self.target.unblocked.set()
+        self.log.removeHandler(self.handler)
+        self.handler.close()
+
+    def test_stalled_target(self):
+        """ Callers don't wait for the target, and records that don't fit
+        in the queue are dropped. """
+        # the first record is taken by the writer, which then blocks
+        self.log.warning("msg 0")
+        while self.handler.stats()['queued']:
+            time.sleep(0.01)
+        for i in range(1, 6):
+            self.log.warning("msg %d", i)
+        self.assertEqual({'queued': 3, 'dropped': 2, 'suppressed': 0},
+                         self.handler.stats())
+        self.target.unblocked.set()
+        self.handler.flush()
+        self.assertEqual(['msg 0', 'msg 1', 'msg 2', 'msg 3'],
+                         self.target.messages)
+
+    def test_repeats(self):
+        """ Notices from a call site are suppressed until dedup_interval
+        has passed, even when their arguments differ. """
+        self.target.unblocked.set()
+
+        def changing_key(key, new_value, old_value):
+            # logged the way core.billing does
+            self.log.log(logger._NOTICE, "changing key: %s -> %s (was %s)" %
+                         (key, new_value, old_value))
+
+        for i in range(3):
+            changing_key("prices.%d" % i, i + 1, i)
+        self.log.log(logger._NOTICE, "adding key: foo -> 1")
+        self.handler.flush()  # the queue only holds three
+        for recent in self.handler._recent.values():
+            recent[0] -= 60
+        changing_key("prices.9", 10, 9)
+        self.handler.flush()
+        self.assertEqual(["changing key: prices.0 -> 1 (was 0)",
+                          "adding key: foo -> 1",
+                          "changing key: prices.9 -> 10 (was 9) "
+                          "(2 similar suppressed)"],
+                         self.target.messages)
+        self.assertEqual(2, self.handler.stats()['suppressed'])
+
+    def test_warnings_kept(self):
+        """ Warnings and errors are never suppressed. """
+        self.target.unblocked.set()
+        for level in (logging.WARNING, logging.ERROR):
+            for imsi in ("IMSI001", "IMSI002"):
+                self.log.log(level, "Balance sync fail! IMSI: %s", imsi)
+            self.handler.flush()
+        self.assertEqual(["Balance sync fail! IMSI: IMSI001",
+                          "Balance sync fail! IMSI: IMSI002"] * 2,
+                         self.target.messages)
+        self.assertEqual(0, self.handler.stats()['suppressed'])
+
+    def test_record_unchanged(self):
+        """ Other handlers see the record as it was logged. """
+        self.target.unblocked.set()
+        seen = []
+        other = logging.Handler()
+        other.emit = lambda record: seen.append((record.msg, record.args))
+        self.log.addHandler(other)
+        try:
+            self.log.warning("value %d", 1)
+        finally:
+            self.log.removeHandler(other)
+        self.assertEqual([("value %d", (1, ))], seen)
+
+    def test_exception(self):
+        """ Tracebacks are formatted before the record is queued. """
+        self.target.unblocked.set()
+        try:
+            raise ValueError("oops")
+        except ValueError:
+            self.log.exception("failed")
+        self.handler.flush()
+        self.assertTrue(self.target.messages[0].startswith("failed\n"))
+        self.assertTrue(
+            self.target.messages[0].endswith("ValueError: oops"))
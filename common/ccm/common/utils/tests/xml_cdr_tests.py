@@ -0,0 +1,81 @@
+"""
+Copyright (c) 2016-present, Facebook, Inc.
+All rights reserved.
+
+This source code is licensed under the BSD-style license found in the
+LICENSE file in the root directory of this source tree. An additional grant
+of patent rights can be found in the PATENTS file in the same directory.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from unittest import TestCase
+import xml.parsers.expat
+
+from ..xml_cdr import CloudVoiceCdr, get_tag_text, parse_tags
+
+CDR = """<?xml version="1.0"?>
+<cdr core-uuid="0f7b2a">
+  <variables>
+    <billsec>17</billsec>
+    <destination_number>IMSI510555550000168</destination_number>
+  </variables>
+  <callflow>
+    <caller_profile>
+      <username>IMSI510555550000168</username>
+      <caller_id_name>6285574719464</caller_id_name>
+      <destination_number>6282349406513</destination_number>
+      <network_addr>10.64.0.38</network_addr>
+      <originator>
+        <originator_caller_profile>
+          <destination_number>6285574719465</destination_number>
+        </originator_caller_profile>
+      </originator>
+    </caller_profile>
+  </callflow>
+</cdr>
+"""
+
+
+class ParseTagsTestCase(TestCase):
+
+    def test_parents(self):
+        tags = parse_tags(CDR, ['destination_number', 'billsec', 'missing'])
+        self.assertEqual([
+            ('variables', 'IMSI510555550000168'),
+            ('caller_profile', '6282349406513'),
+            ('originator_caller_profile', '6285574719465'),
+        ], tags['destination_number'])
+        self.assertEqual([('variables', '17')], tags['billsec'])
+        self.assertNotIn('missing', tags)
+
+    def test_get_tag_text(self):
+        tags = parse_tags(CDR, ['destination_number', 'username'])
+        self.assertEqual('IMSI510555550000168',
+                         get_tag_text(tags, 'destination_number'))
+        self.assertEqual('6285574719465',
+                         get_tag_text(tags, 'destination_number',
+                                      'originator_caller_profile'))
+        self.assertEqual('IMSI510555550000168',
+                         get_tag_text(tags, 'username', 'caller_profile'))
+        self.assertIsNone(get_tag_text(tags, 'username', 'variables'))
+        self.assertIsNone(get_tag_text(tags, 'billsec'))
+
+    def test_own_text_only(self):
+        """Like minidom, a tag's text excludes that of its children."""
+        tags = parse_tags("<cdr><a>x<b>y</b>z &amp; w</a></cdr>",
+                          ['a', 'b'])
+        self.assertEqual([('cdr', 'xz & w')], tags['a'])
+        self.assertEqual([('a', 'y')], tags['b'])
+
+    def test_bad_xml(self):
+        with self.assertRaises(xml.parsers.expat.ExpatError):
+            parse_tags("<cdr><billsec>17</cdr>", ['billsec'])
+
+    def test_round_trip(self):
+        xc = CloudVoiceCdr(billsec=17, caller_id_name="6285574719464",
+                           destination_number="6282349406513")
+        self.assertEqual(dict(xc, network_addr=".", username="."),
+                         CloudVoiceCdr.from_xml(xc.xml.toxml()))
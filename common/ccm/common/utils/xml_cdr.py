@@ -1,5 +1,5 @@
 """
-XML CDR generators (for testing purposes).
+XML CDR parsing, and generators (for testing purposes).
 
 Copyright (c) 2016-present, Facebook, Inc.
 All rights reserved.
@@ -15,9 +15,76 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 import abc
+from collections import defaultdict
 from random import randrange
 import six
 import xml.dom
+import xml.parsers.expat
+
+def parse_tags(src, tag_names):
+    """Extract the text of the given tags from an XML CDR in a single pass.
+
+    FreeSWITCH CDRs are tens of KB, of which only a handful of tags are of
+    interest, so rather than build a DOM we scan the document with expat and
+    only keep the text of the wanted tags. As with minidom, the text of a
+    tag is that of its own text nodes, not of any child elements.
+
+    Args:
+        src: the XML document (a string)
+        tag_names: iterable of the names of the tags to extract
+
+    Returns:
+        A dict mapping each tag name found to a list of (parent, text)
+        pairs in document order, where <parent> is the name of the tag's
+        parent element (None for the root element).
+
+    Raises:
+        xml.parsers.expat.ExpatError if the document isn't well-formed.
+    """
+    wanted = frozenset(tag_names)
+    found = defaultdict(list)
+    # (name, text buffer if it's a wanted tag) for each open element
+    stack = []
+
+    def start(name, attrs):
+        stack.append((name, [] if name in wanted else None))
+
+    def end(name):
+        _, text = stack.pop()
+        if text is not None:
+            parent = stack[-1][0] if stack else None
+            found[name].append((parent, ''.join(text)))
+
+    def char_data(data):
+        text = stack[-1][1]
+        if text is not None:
+            text.append(data)
+
+    parser = xml.parsers.expat.ParserCreate()
+    parser.buffer_text = True
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    parser.CharacterDataHandler = char_data
+    parser.Parse(src, True)
+    return dict(found)
+
+
+def get_tag_text(tags, tag_name, parent=None):
+    """Get the text of the first instance of a tag from parse_tags.
+
+    Args:
+        tags: the dict returned by parse_tags
+        tag_name: the tag to look up
+        parent: if given, only consider tags with this parent element
+
+    Returns:
+        The tag's text, or None if there is no such tag.
+    """
+    for tag_parent, text in tags.get(tag_name, ()):
+        if parent is None or tag_parent == parent:
+            return text
+    return None
+
 
 # The Freeswitch XML CDR format contains a lot of data that isn't used by CCM.
 # CCM's CDR parsing is done by searching for specific tags, so CDR structure
@@ -59,30 +126,22 @@ class XmlCdr(dict):
             cdr.appendChild(elem)
         return doc
 
-    @staticmethod
-    def _get_text(nodes):
-        """Get the text value of an XML tag (from the minidom doc)."""
-        rc = []
-        for node in nodes:
-            if node.nodeType == node.TEXT_NODE:
-                rc.append(node.data)
-        return ''.join(rc)
-
     @classmethod
     def from_xml(cls, src):
         """Generate instance of subclass from an XML string."""
-        dom = xml.dom.minidom.parseString(src)
+        xc = cls()
+        required_tags = xc.required_tags()
+        tags = parse_tags(src, [tag_name for tag_name, _ in required_tags])
         # Make sure all of the necessary pieces are there.  Fail if any
         # required tags are missing
-        xc = cls()
-        for tag_name, default_or_type in xc.required_tags():
-            elem = dom.getElementsByTagName(tag_name)
-            if not elem:
+        for tag_name, default_or_type in required_tags:
+            text = get_tag_text(tags, tag_name)
+            if text is None:
                 raise ValueError("Missing XML tag: " + tag_name)
             tag_type = (default_or_type
                         if isinstance(default_or_type, type)
                         else type(default_or_type))
-            xc[tag_name] = tag_type(cls._get_text(elem[0].childNodes))
+            xc[tag_name] = tag_type(text)
         return xc
 
 
@@ -36,6 +36,7 @@ setup(
         'ccm.common.currency',
         'ccm.common.logger',
         'ccm.common.delta',
+        'ccm.common.utils',
     ],
     install_requires=[
         'six',
@@ -0,0 +1,89 @@
+"""openbts.cli
+runs OpenBTS CLI commands over a persistent connection
+
+Copyright (c) 2016-present, Facebook, Inc.
+All rights reserved.
+
+This source code is licensed under the BSD-style license found in the
+LICENSE file in the root directory of this source tree. An additional grant
+of patent rights can be found in the PATENTS file in the same directory.
+"""
+
+import socket
+import struct
+import threading
+
+from openbts.exceptions import TimeoutError
+
+
+class CLISession(object):
+  """Runs CLI commands over one long-lived connection to OpenBTS.
+
+  OpenBTSCLI is a thin client: it connects to the CLI port of OpenBTS, sends
+  the command as a 4-byte big-endian length followed by the text, and prints
+  the reply, which is framed the same way.  Talking to the port directly
+  saves forking OpenBTSCLI for every command.
+
+  Args:
+    address: (host, port) of the OpenBTS CLI port
+    timeout: seconds to wait for a reply
+
+  Attributes:
+    verified: True once a command has been answered, i.e. we know OpenBTS
+        speaks this protocol on the port
+  """
+
+  def __init__(self, address=('127.0.0.1', 49300), timeout=3):
+    self.address = address
+    self.timeout = timeout
+    self.verified = False
+    self._sock = None
+    self._lock = threading.Lock()
+
+  def run(self, command):
+    """Runs a command and returns its output.
+
+    Raises:
+      TimeoutError: if OpenBTS doesn't reply in time
+      socket.error: if OpenBTS can't be reached or closes the connection
+    """
+    if not isinstance(command, bytes):
+      command = command.encode('utf-8')
+    with self._lock:
+      try:
+        if self._sock is None:
+          self._sock = socket.create_connection(self.address, self.timeout)
+        self._sock.settimeout(self.timeout)
+        self._sock.sendall(struct.pack('!I', len(command)) + command)
+        length, = struct.unpack('!I', self._recv(4))
+        output = self._recv(length)
+      except socket.timeout:
+        # a late reply would be taken for the next command's
+        self._close()
+        raise TimeoutError('CLI did not reply to "%s"' % command)
+      except socket.error:
+        self._close()
+        raise
+    self.verified = True
+    if not isinstance(output, str):
+      output = output.decode('utf-8', 'replace')
+    return output
+
+  def close(self):
+    with self._lock:
+      self._close()
+
+  def _close(self):
+    if self._sock is not None:
+      self._sock.close()
+      self._sock = None
+
+  def _recv(self, length):
+    chunks = []
+    while length:
+      chunk = self._sock.recv(length)
+      if not chunk:
+        raise socket.error('CLI connection closed')
+      chunks.append(chunk)
+      length -= len(chunk)
+    return b''.join(chunks)
@@ -10,6 +10,7 @@ of patent rights can be found in the PATENTS file in the same directory.
 """
 
 import re
+import socket
 import time
 
 import envoy
@@ -17,6 +18,68 @@ import envoy
 from openbts.core import BaseComponent
 from openbts.exceptions import InvalidRequestError
 from openbts.exceptions import MalformedResponseError
+from openbts.exceptions import TimeoutError
+
+
+# One match per MS block of "gprs list": the byte counts, IMSI and IP, in the
+# order OpenBTS prints them.  "Bytes:" starts each block, and the fields are
+# searched for only up to the next "#" (of the next "MS#" or "TBF#"), with
+# the skipping unrolled so the engine never backtracks a character at a time.
+GPRS_MS_RE = re.compile(
+  r'Bytes:(\d+)up/(\d+)down'
+  r'[^i#]*(?:i(?!msi=)[^i#]*)*imsi=(\d{15})'
+  r'[^I#]*(?:I(?!Ps=)[^I#]*)*IPs=(\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})')
+
+
+def parse_gprs_list(output):
+  """Parses the output of the "gprs list" CLI command.
+
+  Returns a dict of {'ipaddr', 'uploaded_bytes', 'downloaded_bytes'} dicts
+  keyed by IMSI.  Byte counts of duplicate entries for an IMSI are summed,
+  and MS blocks missing any of these fields are skipped.
+  """
+  result = {}
+  for up, down, imsi, ipaddr in GPRS_MS_RE.findall(output):
+    imsi = 'IMSI' + imsi
+    usage = result.get(imsi)
+    if usage is None:
+      result[imsi] = {
+        'ipaddr': ipaddr,
+        'uploaded_bytes': int(up),
+        'downloaded_bytes': int(down),
+      }
+    else:
+      usage['ipaddr'] = ipaddr
+      usage['uploaded_bytes'] += int(up)
+      usage['downloaded_bytes'] += int(down)
+  return result
+
+
+def run_cli(component, command):
+  """Runs an OpenBTS CLI command and returns its output.
+
+  Uses the component's persistent CLI session if it has one, and forks
+  OpenBTSCLI otherwise.  A session that has never been answered is dropped
+  on its first failure (e.g. this OpenBTS doesn't listen on the CLI port),
+  so that we don't wait for it to time out again on every command.
+
+  Raises:
+    InvalidRequestError if OpenBTSCLI fails
+  """
+  session = component.cli_session
+  if session is not None:
+    try:
+      return session.run(command)
+    except (socket.error, TimeoutError):
+      if not session.verified:
+        session.close()
+        component.cli_session = None
+  response = envoy.run('/OpenBTS/OpenBTSCLI -c "%s"' % command,
+                       timeout=component.cli_timeout)
+  if response.status_code != 0:
+    raise InvalidRequestError(
+      'CLI returned with non-zero status: %d' % response.status_code)
+  return response.std_out
 
 
 class OpenBTS(BaseComponent):
@@ -29,7 +92,7 @@ class OpenBTS(BaseComponent):
   def __init__(self, **kwargs):
     super(OpenBTS, self).__init__(**kwargs)
     self.address = kwargs.pop('address', 'tcp://127.0.0.1:45060')
-    self.socket.connect(self.address)
+    self.connect(self.address)
 
   def __repr__(self):
     return 'OpenBTS component'
@@ -109,11 +172,8 @@ class OpenBTS(BaseComponent):
       PCH: a paging channel for service notifications
       AGCH: a channel for transmitting BTS responses to channel requests
     """
-    response = envoy.run('/OpenBTS/OpenBTSCLI -c "load"', timeout=self.cli_timeout)
-    if response.status_code != 0:
-      raise InvalidRequestError(
-        'CLI returned with non-zero status: %d' % response.status_code)
-    items = response.std_out.split()
+    output = run_cli(self, 'load')
+    items = output.split()
 
     try:
         res = {
@@ -132,7 +192,7 @@ class OpenBTS(BaseComponent):
         }
     except (IndexError, ValueError):
         raise MalformedResponseError(
-            'CLI returned with malformed response: %s' % response.std_out)
+            'CLI returned with malformed response: %s' % output)
 
     return res
 
@@ -144,11 +204,8 @@ class OpenBTS(BaseComponent):
       'noise_ms_rssi_target_db': -50,
     }
     """
-    response = envoy.run('/OpenBTS/OpenBTSCLI -c "noise"', timeout=self.cli_timeout)
-    if response.status_code != 0:
-      raise InvalidRequestError(
-        'CLI returned with non-zero status: %d' % response.status_code)
-    items = response.std_out.split()
+    output = run_cli(self, 'noise')
+    items = output.split()
     try:
         return {
           'noise_rssi_db': int(items[3]),
@@ -156,7 +213,7 @@ class OpenBTS(BaseComponent):
         }
     except (IndexError, ValueError):
         raise MalformedResponseError(
-            'CLI returned with malformed response: %s' % response.std_out)
+            'CLI returned with malformed response: %s' % output)
 
 
 class SIPAuthServe(BaseComponent):
@@ -169,7 +226,7 @@ class SIPAuthServe(BaseComponent):
   def __init__(self, **kwargs):
     super(SIPAuthServe, self).__init__(**kwargs)
     self.address = kwargs.pop('address', 'tcp://127.0.0.1:45064')
-    self.socket.connect(self.address)
+    self.connect(self.address)
 
   def __repr__(self):
     return 'SIPAuthServe component'
@@ -233,6 +290,61 @@ class SIPAuthServe(BaseComponent):
       simplified_subscribers.append(simplified_subscriber)
     return simplified_subscribers
 
+  def get_all_subscribers(self, include_numbers=True):
+    """Gets every subscriber with two requests rather than 3N+1.
+
+    get_subscribers makes three more requests for each subscriber it finds;
+    this reads sip_buddies and dialdata_table once each and joins them here,
+    which matters when listing thousands of subscribers.
+
+    Args:
+      include_numbers: whether to read dialdata_table for the 'numbers' of
+                       each subscriber; if False only one request is made
+
+    Returns:
+      a list of subscriber dicts of the same form as get_subscribers, in
+      sip_buddies order (without 'numbers' if include_numbers is False)
+    """
+    message = {
+      'command': 'sip_buddies',
+      'action': 'read',
+      'match': {},
+      'fields': ['name', 'ipaddr', 'port', 'account_balance', 'callerid'],
+    }
+    try:
+      buddies = self._send_and_receive(message).data
+    except InvalidRequestError:
+      return []
+    subscribers = []
+    for buddy in buddies:
+      subscriber = {
+        'name': buddy['name'],
+        'openbts_ipaddr': buddy['ipaddr'],
+        'openbts_port': buddy['port'],
+        'account_balance': buddy['account_balance'],
+        'caller_id': buddy['callerid'],
+      }
+      if include_numbers:
+        subscriber['numbers'] = []
+      subscribers.append(subscriber)
+    if not include_numbers or not subscribers:
+      return subscribers
+    message = {
+      'command': 'dialdata_table',
+      'action': 'read',
+      'match': {},
+      'fields': ['dial', 'exten'],
+    }
+    try:
+      dialdata = self._send_and_receive(message).data
+    except InvalidRequestError:
+      dialdata = []
+    by_name = dict((s['name'], s) for s in subscribers)
+    for row in dialdata:
+      if row['dial'] in by_name:
+        by_name[row['dial']]['numbers'].append(row['exten'])
+    return subscribers
+
   def get_openbts_ipaddr(self, imsi):
     """Get the OpenBTS IP address of a subscriber."""
     fields = ['ipaddr']
@@ -536,41 +648,7 @@ class SIPAuthServe(BaseComponent):
     Args:
       target_imsi: the subsciber-of-interest
     """
-    response = envoy.run('/OpenBTS/OpenBTSCLI -c "gprs list"', timeout=self.cli_timeout)
-    if response.status_code != 0:
-      raise InvalidRequestError(
-        'CLI returned with non-zero status: %d' % response.status_code)
-    result = {}
-    for ms_block in response.std_out.split('MS#'):
-      try:
-        # Get the IMSI.
-        match = re.search(r'imsi=[\d]{15}', ms_block)
-        imsi = 'IMSI%s' % match.group(0).split('=')[1]
-        # Get the IP.
-        match = re.search(r'IPs=\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}', ms_block)
-        ipaddr = match.group(0).split('=')[1]
-        # Get the uploaded and downloaded bytes.
-        match = re.search(r'Bytes:[0-9]+up\/[0-9]+down', ms_block)
-        count = match.group(0).split(':')[1]
-        uploaded_bytes = int(count.split('/')[0].strip('up'))
-        downloaded_bytes = int(count.split('/')[1].strip('down'))
-      except AttributeError:
-        # No match found.
-        continue
-      except ValueError:
-        # Casting to int failed.
-        continue
-      # See if we already have an entry for the same IMSI -- we sometimes see
-      # duplicates.  If we do have an entry already, sum the byte counts across
-      # entries.
-      if imsi in result:
-        uploaded_bytes += result[imsi]['uploaded_bytes']
-        downloaded_bytes += result[imsi]['downloaded_bytes']
-      result[imsi] = {
-        'ipaddr': ipaddr,
-        'uploaded_bytes': uploaded_bytes,
-        'downloaded_bytes': downloaded_bytes,
-      }
+    result = parse_gprs_list(run_cli(self, 'gprs list'))
     # If, after all that parsing, we still haven't found any matches, return
     # None instead of the empty dict.
     if result == {}:
@@ -595,7 +673,7 @@ class SMQueue(BaseComponent):
   def __init__(self, **kwargs):
     super(SMQueue, self).__init__(**kwargs)
     self.address = kwargs.pop('address', 'tcp://127.0.0.1:45063')
-    self.socket.connect(self.address)
+    self.connect(self.address)
 
   def __repr__(self):
     return 'SMQueue component'
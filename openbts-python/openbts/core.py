@@ -9,17 +9,113 @@ LICENSE file in the root directory of this source tree. An additional grant
 of patent rights can be found in the PATENTS file in the same directory.
 """
 
+import itertools
 import json
+import struct
 
 import zmq
 
 import threading
 
+from openbts.cli import CLISession
 from openbts.exceptions import (InvalidRequestError, InvalidResponseError,
                                 TimeoutError)
 from openbts.codes import (SuccessCode, ErrorCode)
 
 
+class MultiplexedTransport(object):
+  """Multiplexes concurrent requests over a single DEALER socket.
+
+  Each request is sent as [request id, '', payload].  Node Manager's REP
+  socket hands the frames before the empty delimiter back with the reply, so
+  replies can be matched to requests however many are in flight.  A
+  background thread owns the DEALER socket; callers hand it requests through
+  an inproc PUSH socket and wait for their own reply, so a timeout only
+  abandons that request and a late reply for it is dropped.
+
+  Args:
+    address: tcp socket for the zmq connection
+    context: zmq.Context to use, the process-wide one by default
+  """
+
+  _instances = itertools.count()
+
+  def __init__(self, address, context=None):
+    self.address = address
+    self.context = context or zmq.Context.instance()
+    self._ids = itertools.count()
+    # request id -> [threading.Event, reply]
+    self._pending = {}
+    self._pending_lock = threading.Lock()
+    inproc = 'inproc://openbts-transport-%d' % next(self._instances)
+    self._dealer = self.context.socket(zmq.DEALER)
+    self._dealer.setsockopt(zmq.LINGER, 0)
+    self._dealer.connect(address)
+    self._inbox = self.context.socket(zmq.PULL)
+    self._inbox.setsockopt(zmq.LINGER, 0)
+    self._inbox.bind(inproc)
+    # sockets aren't thread safe, so callers take turns on this one
+    self._outbox = self.context.socket(zmq.PUSH)
+    self._outbox.setsockopt(zmq.LINGER, 0)
+    self._outbox.connect(inproc)
+    self._outbox_lock = threading.Lock()
+    self._thread = threading.Thread(target=self._run,
+                                    name='openbts-transport')
+    self._thread.daemon = True
+    self._thread.start()
+
+  def request(self, payload, timeout):
+    """Sends a payload and waits up to timeout seconds for its reply.
+
+    Raises:
+      TimeoutError: if no reply arrives in time
+    """
+    if not isinstance(payload, bytes):
+      payload = payload.encode('utf-8')
+    request_id = struct.pack('!Q', next(self._ids))
+    slot = [threading.Event(), None]
+    with self._pending_lock:
+      self._pending[request_id] = slot
+    with self._outbox_lock:
+      self._outbox.send_multipart([request_id, payload])
+    slot[0].wait(timeout)
+    with self._pending_lock:
+      self._pending.pop(request_id, None)
+    if not slot[0].is_set():
+      raise TimeoutError('did not receive a response')
+    return slot[1]
+
+  def close(self):
+    """Stops the background thread and closes the sockets."""
+    with self._outbox_lock:
+      self._outbox.send_multipart([b''])
+    self._thread.join()
+    self._outbox.close()
+
+  def _run(self):
+    poller = zmq.Poller()
+    poller.register(self._inbox, zmq.POLLIN)
+    poller.register(self._dealer, zmq.POLLIN)
+    while True:
+      events = dict(poller.poll())
+      if self._inbox in events:
+        frames = self._inbox.recv_multipart()
+        if len(frames) == 1:
+          break  # closing
+        request_id, payload = frames
+        self._dealer.send_multipart([request_id, b'', payload])
+      if self._dealer in events:
+        frames = self._dealer.recv_multipart()
+        with self._pending_lock:
+          slot = self._pending.get(frames[0])
+        # no slot means the request timed out, or the reply is malformed
+        if slot is not None and len(frames) == 3:
+          slot[1] = frames[2]
+          slot[0].set()
+    self._inbox.close()
+    self._dealer.close()
+
+
 class BaseComponent(object):
   """Manages a zeromq connection.
 
@@ -28,22 +124,44 @@ class BaseComponent(object):
   kwargs:
     socket_timeout: time to poll the socket for values before raising a
                     TimeoutError
+    multiplexed: if True, send requests through a MultiplexedTransport so
+                 that several threads can have requests in flight at once
+                 and a timeout doesn't reset the connection; otherwise use
+                 a REQ socket, which serializes requests
+    cli_timeout: time to wait for a CLI command
+    persistent_cli: if True, run CLI commands over a persistent CLISession
+                    rather than forking OpenBTSCLI for each one
   """
 
   def __init__(self, **kwargs):
     self.address = None
+    self.transport = None
+    self.multiplexed = kwargs.pop('multiplexed', False)
     self.setup_socket()
     # The socket will poll for this amount of time and recv if there is a
     # response available.
     self.socket_timeout = kwargs.pop('socket_timeout', 10)  # seconds
     self.cli_timeout = kwargs.pop('cli_timeout', 3) # seconds
+    self.cli_session = None
+    if kwargs.pop('persistent_cli', False):
+      self.cli_session = CLISession(timeout=self.cli_timeout)
     self.lock = threading.Lock()
 
+  def connect(self, address):
+    """Connects to a component at the given address."""
+    self.address = address
+    if self.multiplexed:
+      self.transport = MultiplexedTransport(address)
+    else:
+      self.socket.connect(address)
+
   def setup_socket(self):
     """Sets up the ZMQ socket."""
-    context = zmq.Context()
-    # The component inheriting from BaseComponent should self.socket.connect
-    # with the appropriate address.
+    # All sockets share the process-wide context rather than creating (and
+    # leaking) a new one each time the socket is reset.
+    context = zmq.Context.instance()
+    # The component inheriting from BaseComponent should self.connect with
+    # the appropriate address.
     self.socket = context.socket(zmq.REQ)
     # LINGER sets a timeout for socket.send.
     self.socket.setsockopt(zmq.LINGER, 0)
@@ -154,6 +272,9 @@ class BaseComponent(object):
     Raises:
       TimeoutError: if nothing is received for the timeout
     """
+    if self.transport is not None:
+      return Response(self.transport.request(json.dumps(message),
+                                             self.socket_timeout))
     # zmq is thread unsafe: if we send a second request before
     # we get back the first response, we throw an exception
     # fix that -kheimerl
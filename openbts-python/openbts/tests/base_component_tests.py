@@ -11,6 +11,7 @@ of patent rights can be found in the PATENTS file in the same directory.
 
 import json
 from multiprocessing import Process
+import threading
 import time
 import unittest
 
@@ -63,3 +64,61 @@ class BaseComponentTestCase(unittest.TestCase):
     component.socket.connect(self.DEMO_ADDRESS)
     with self.assertRaises(TimeoutError):
       component.read_config('sample-key')
+
+
+class MultiplexedTransportTestCase(unittest.TestCase):
+  """Testing BaseComponent with the multiplexed DEALER transport.
+
+  The demo server is a REP socket like Node Manager's, which echoes the key
+  of each request after a fixed delay.
+  """
+
+  RESPONSE_DELAY = 0.1
+  DEMO_ADDRESS = 'tcp://127.0.0.1:7891'
+
+  def zmq_demo_server(self):
+    """Run a small zmq testing server that answers every request."""
+    context = zmq.Context()
+    server_socket = context.socket(zmq.REP)
+    server_socket.bind(self.DEMO_ADDRESS)
+    while True:
+      request = json.loads(server_socket.recv())
+      time.sleep(self.RESPONSE_DELAY)
+      response = json.dumps({'code': 200, 'data': request['key'], 'dirty': 0})
+      server_socket.send(response.encode('utf-8'))
+
+  def setUp(self):
+    self.demo_server_process = Process(target=self.zmq_demo_server)
+    self.demo_server_process.start()
+    self.component = BaseComponent(socket_timeout=self.RESPONSE_DELAY * 10,
+                                   multiplexed=True)
+    self.component.connect(self.DEMO_ADDRESS)
+
+  def tearDown(self):
+    self.component.transport.close()
+    self.demo_server_process.terminate()
+    self.demo_server_process.join()
+
+  def test_concurrent_requests(self):
+    """Requests from several threads each get their own reply."""
+    results = {}
+
+    def worker(key):
+      results[key] = self.component.read_config(key).data
+    threads = [threading.Thread(target=worker, args=('key-%d' % i, ))
+               for i in range(4)]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    self.assertEqual(dict(('key-%d' % i, 'key-%d' % i) for i in range(4)),
+                     results)
+
+  def test_timeout_keeps_connection(self):
+    """A timed out request doesn't affect the next one."""
+    self.component.socket_timeout = self.RESPONSE_DELAY * 0.5
+    with self.assertRaises(TimeoutError):
+      self.component.read_config('late-key')
+    self.component.socket_timeout = self.RESPONSE_DELAY * 10
+    # the late reply to the first request must not be taken for this one
+    self.assertEqual('next-key', self.component.read_config('next-key').data)
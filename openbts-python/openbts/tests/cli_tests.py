@@ -0,0 +1,102 @@
+"""openbts.tests.cli_tests
+tests for the persistent CLI session
+
+Copyright (c) 2016-present, Facebook, Inc.
+All rights reserved.
+
+This source code is licensed under the BSD-style license found in the
+LICENSE file in the root directory of this source tree. An additional grant
+of patent rights can be found in the PATENTS file in the same directory.
+"""
+
+import socket
+import struct
+import threading
+import unittest
+
+import openbts
+from openbts.cli import CLISession
+from openbts.components import OpenBTS
+from openbts.exceptions import TimeoutError
+from openbts.tests import mocks
+
+
+class CLISessionTestCase(unittest.TestCase):
+  """Testing cli.CLISession against a fake OpenBTS CLI port.
+
+  The fake answers each command with "ok <command>", except "hang", which
+  it never answers.
+  """
+
+  def fake_cli_server(self):
+    while True:
+      conn, _ = self.server_socket.accept()
+      self.connections.append(conn)
+      try:
+        while True:
+          length, = struct.unpack('!I', conn.recv(4))
+          command = conn.recv(length)
+          if command == b'hang':
+            continue
+          reply = b'ok ' + command
+          conn.sendall(struct.pack('!I', len(reply)) + reply)
+      except (socket.error, struct.error):
+        conn.close()
+
+  def setUp(self):
+    self.server_socket = socket.socket()
+    self.server_socket.bind(('127.0.0.1', 0))
+    self.server_socket.listen(1)
+    self.connections = []
+    thread = threading.Thread(target=self.fake_cli_server)
+    thread.daemon = True
+    thread.start()
+    self.session = CLISession(self.server_socket.getsockname(), timeout=0.2)
+
+  def tearDown(self):
+    self.session.close()
+    self.server_socket.close()
+
+  def test_one_connection(self):
+    """Commands share one connection."""
+    self.assertEqual('ok load', self.session.run('load'))
+    self.assertEqual('ok gprs list', self.session.run('gprs list'))
+    self.assertEqual(1, len(self.connections))
+    self.assertTrue(self.session.verified)
+
+  def test_timeout(self):
+    """A timed out command doesn't leave its reply for the next one."""
+    with self.assertRaises(TimeoutError):
+      self.session.run('hang')
+    self.assertEqual('ok noise', self.session.run('noise'))
+
+
+class RunCLITestCase(unittest.TestCase):
+  """Testing the fallback from a CLI session to forking OpenBTSCLI."""
+
+  @classmethod
+  def setUpClass(cls):
+    cls.original_envoy = openbts.components.envoy
+    openbts.components.envoy = mocks.MockEnvoy(return_text='forked')
+
+  @classmethod
+  def tearDownClass(cls):
+    openbts.components.envoy = cls.original_envoy
+
+  def test_unreachable_session(self):
+    """A session that never worked is dropped."""
+    component = OpenBTS(persistent_cli=True)
+    # nothing listens on the port we just closed
+    closed = socket.socket()
+    closed.bind(('127.0.0.1', 0))
+    component.cli_session.address = closed.getsockname()
+    closed.close()
+    self.assertEqual('forked',
+                     openbts.components.run_cli(component, 'load'))
+    self.assertEqual(None, component.cli_session)
+
+  def test_no_session(self):
+    component = OpenBTS()
+    self.assertEqual(None, component.cli_session)
+    self.assertEqual('forked',
+                     openbts.components.run_cli(component, 'load'))
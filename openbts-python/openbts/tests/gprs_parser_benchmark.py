@@ -0,0 +1,95 @@
+"""openbts.tests.gprs_parser_benchmark
+compares the "gprs list" parsers
+
+Builds "gprs list" output with hundreds of MS entries from the captured
+output in fixtures/gprs_list_duplicate_imsis.txt, giving each copy of an
+entry a new IMSI, and times parsing it the way get_gprs_usage used to (split
+on "MS#", three regex searches and string splitting per block) against
+components.parse_gprs_list.
+
+Usage:
+    $ python -m openbts.tests.gprs_parser_benchmark [num_entries]
+
+Copyright (c) 2016-present, Facebook, Inc.
+All rights reserved.
+
+This source code is licensed under the BSD-style license found in the
+LICENSE file in the root directory of this source tree. An additional grant
+of patent rights can be found in the PATENTS file in the same directory.
+"""
+
+from __future__ import print_function
+
+import re
+import sys
+import time
+
+from openbts.components import parse_gprs_list
+from openbts.tests import get_fixture_path
+
+
+def legacy_parse_gprs_list(output):
+  """The parser get_gprs_usage used before parse_gprs_list."""
+  result = {}
+  for ms_block in output.split('MS#'):
+    try:
+      match = re.search(r'imsi=[\d]{15}', ms_block)
+      imsi = 'IMSI%s' % match.group(0).split('=')[1]
+      match = re.search(r'IPs=\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}', ms_block)
+      ipaddr = match.group(0).split('=')[1]
+      match = re.search(r'Bytes:[0-9]+up\/[0-9]+down', ms_block)
+      count = match.group(0).split(':')[1]
+      uploaded_bytes = int(count.split('/')[0].strip('up'))
+      downloaded_bytes = int(count.split('/')[1].strip('down'))
+    except (AttributeError, ValueError):
+      continue
+    if imsi in result:
+      uploaded_bytes += result[imsi]['uploaded_bytes']
+      downloaded_bytes += result[imsi]['downloaded_bytes']
+    result[imsi] = {
+      'ipaddr': ipaddr,
+      'uploaded_bytes': uploaded_bytes,
+      'downloaded_bytes': downloaded_bytes,
+    }
+  return result
+
+
+def build_output(num_entries):
+  """Repeats the captured MS entries, renumbering their IMSIs."""
+  with open(get_fixture_path('gprs_list_duplicate_imsis.txt')) as f:
+    captured = f.read()
+  # the MS entries are followed by a list of TBFs
+  entries = captured[:captured.index(' TBF#')].split(' MS#')[1:]
+  blocks = []
+  for i in range(num_entries):
+    entry = re.sub(r'imsi=\d{15}', 'imsi=90155%010d' % (i // 2),
+                   entries[i % len(entries)])
+    blocks.append(' MS#%d%s' % (i + 1, entry[entry.index(','):]))
+  return ''.join(blocks) + captured[captured.index(' TBF#'):]
+
+
+def report(name, latencies):
+  latencies = sorted(latencies)
+  print("%-24s mean %8.3f ms  p50 %8.3f ms  p95 %8.3f ms" % (
+    name,
+    1000 * sum(latencies) / len(latencies),
+    1000 * latencies[len(latencies) // 2],
+    1000 * latencies[int(len(latencies) * 0.95)]))
+
+
+def main(num_entries, rounds=200):
+  output = build_output(num_entries)
+  assert parse_gprs_list(output) == legacy_parse_gprs_list(output)
+  print('%d MS entries, %d bytes' % (num_entries, len(output)))
+  for name, parse in (('split and search', legacy_parse_gprs_list),
+                      ('parse_gprs_list', parse_gprs_list)):
+    latencies = []
+    for _ in range(rounds):
+      start = time.time()
+      parse(output)
+      latencies.append(time.time() - start)
+    report(name, latencies)
+
+
+if __name__ == '__main__':
+  main(int(sys.argv[1]) if len(sys.argv) > 1 else 500)
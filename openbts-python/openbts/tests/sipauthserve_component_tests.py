@@ -220,6 +220,64 @@ class SIPAuthServeNominalSubscriberTestCase(unittest.TestCase):
     self.assertEqual('subscriber_a', response[0]['name'])
     self.assertEqual('3000', response[0]['account_balance'])
 
+  def test_get_all_subscribers_bulk(self):
+    """Reading every subscriber takes one request per table."""
+    self.sipauthserve_connection.socket.recv.side_effect = [
+      json.dumps({
+        'code': 200,
+        'data': [{
+          'name': 'subscriber_a',
+          'ipaddr': '127.0.0.1',
+          'port': '5555',
+          'account_balance': '3000',
+          'callerid': '5551234',
+        }, {
+          'name': 'subscriber_b',
+          'ipaddr': '127.0.0.1',
+          'port': '5555',
+          'account_balance': '100000',
+          'callerid': '5559876',
+        }]
+      }),
+      json.dumps({
+        'code': 200,
+        'data': [
+          {'dial': 'subscriber_b', 'exten': '5559876'},
+          {'dial': 'subscriber_a', 'exten': '5551234'},
+          {'dial': 'subscriber_b', 'exten': '5550000'},
+          {'dial': 'subscriber_c', 'exten': '5551111'},
+        ]
+      }),
+    ]
+    response = self.sipauthserve_connection.get_all_subscribers()
+    self.assertEqual(2, self.sipauthserve_connection.socket.send.call_count)
+    self.assertEqual(['subscriber_a', 'subscriber_b'],
+                     [s['name'] for s in response])
+    self.assertEqual(['5551234'], response[0]['numbers'])
+    self.assertEqual(['5559876', '5550000'], response[1]['numbers'])
+    self.assertEqual('100000', response[1]['account_balance'])
+    self.assertEqual('5559876', response[1]['caller_id'])
+
+  def test_get_all_subscribers_sans_numbers(self):
+    """Only sip_buddies is read if numbers aren't needed."""
+    self.sipauthserve_connection.socket.recv.side_effect = [
+      json.dumps({
+        'code': 200,
+        'data': [{
+          'name': 'subscriber_a',
+          'ipaddr': '127.0.0.1',
+          'port': '5555',
+          'account_balance': '3000',
+          'callerid': '5551234',
+        }]
+      }),
+    ]
+    response = self.sipauthserve_connection.get_all_subscribers(
+      include_numbers=False)
+    self.assertEqual(1, self.sipauthserve_connection.socket.send.call_count)
+    self.assertEqual('subscriber_a', response[0]['name'])
+    self.assertNotIn('numbers', response[0])
+
   def test_create_subscriber_with_ki(self):
     """Creating a subscriber should send a zmq message and get a response."""
     self.sipauthserve_connection.socket.recv.side_effect = [
@@ -300,6 +358,14 @@ class SIPAuthServeOffNominalSubscriberTestCase(unittest.TestCase):
       imsi='non-existent')
     self.assertEqual([], response)
 
+  def test_get_all_nonexistent_subscribers(self):
+    """Reading every subscriber when there are none returns an empty array."""
+    self.sipauthserve_connection.socket.recv.return_value = json.dumps({
+      'code': 404,
+      'data': 'not found'
+    })
+    self.assertEqual([], self.sipauthserve_connection.get_all_subscribers())
+
   def test_delete_subscriber_when_sqlite_unavailable(self):
     """Invalid request when sqlite is unavailble."""
     self.sipauthserve_connection.socket.recv.return_value = json.dumps({
@@ -393,6 +459,22 @@ class GPRSTest(unittest.TestCase):
     self.assertEqual(expected_usage,
                      self.sipauthserve.get_gprs_usage(target_imsi=target_imsi))
 
+  def test_incomplete_entry(self):
+    """MS entries without an IP are skipped, not merged with the next one."""
+    self.mock_envoy.return_text = (
+      ' MS#1,TLLI=c001f001 Bytes:10up/20down\n'
+      '\t GMM Context: imsi=901550000000022 state=GmmRegisteredNormal\n'
+      ' MS#2,TLLI=c001f002 Bytes:30up/40down\n'
+      '\t GMM Context: imsi=901550000000505 IPs=192.168.99.1\n')
+    expected_usage = {
+      'IMSI901550000000505': {
+        'ipaddr': '192.168.99.1',
+        'uploaded_bytes': 30,
+        'downloaded_bytes': 40,
+      },
+    }
+    self.assertEqual(expected_usage, self.sipauthserve.get_gprs_usage())
+
   def test_duplicate_imsis(self):
     """We correctly handle duplicate IMSIs in the output of gprs list."""
     path = get_fixture_path('gprs_list_duplicate_imsis.txt')
@@ -0,0 +1,109 @@
+"""openbts.tests.transport_benchmark
+compares the REQ and multiplexed DEALER transports of BaseComponent
+
+Runs the Node Manager fake from base_component_tests in another process and
+sends it config reads from one and from several threads.  The fake is a REP
+socket like Node Manager's, so it still answers one request at a time; the
+DEALER transport gains by keeping it busy instead of waiting a round trip
+between requests.  Also measures the first request after a timeout, which
+the REQ transport pays for by rebuilding its socket.
+
+Usage:
+    $ python -m openbts.tests.transport_benchmark [num_requests]
+
+Copyright (c) 2016-present, Facebook, Inc.
+All rights reserved.
+
+This source code is licensed under the BSD-style license found in the
+LICENSE file in the root directory of this source tree. An additional grant
+of patent rights can be found in the PATENTS file in the same directory.
+"""
+
+from __future__ import print_function
+
+from multiprocessing import Process
+import sys
+import threading
+import time
+
+from openbts.core import BaseComponent
+from openbts.exceptions import TimeoutError
+from openbts.tests.base_component_tests import MultiplexedTransportTestCase
+
+
+class FakeNodeManager(MultiplexedTransportTestCase):
+  """The test server, with a Node Manager-like processing time."""
+
+  RESPONSE_DELAY = 0.0005
+  DEMO_ADDRESS = 'tcp://127.0.0.1:7892'
+
+
+def report(name, latencies, elapsed):
+  latencies = sorted(latencies)
+  print("%-28s mean %7.3f ms  p50 %7.3f ms  p95 %7.3f ms  %7.0f req/s" % (
+    name,
+    1000 * sum(latencies) / len(latencies),
+    1000 * latencies[len(latencies) // 2],
+    1000 * latencies[int(len(latencies) * 0.95)],
+    len(latencies) / elapsed))
+
+
+def run(component, n, num_threads):
+  """Sends n requests split over num_threads threads."""
+  latencies = []
+
+  def worker():
+    for _ in range(n // num_threads):
+      start = time.time()
+      component.read_config('key')
+      latencies.append(time.time() - start)
+  threads = [threading.Thread(target=worker) for _ in range(num_threads)]
+  start = time.time()
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  return latencies, time.time() - start
+
+
+def after_timeout(component, n):
+  """Times the request that follows each of n timed out requests."""
+  latencies = []
+  for _ in range(n):
+    component.socket_timeout = FakeNodeManager.RESPONSE_DELAY / 10
+    try:
+      component.read_config('key')
+    except TimeoutError:
+      pass
+    component.socket_timeout = 10
+    start = time.time()
+    component.read_config('key')
+    latencies.append(time.time() - start)
+  return latencies, sum(latencies)
+
+
+def main(n):
+  server = Process(
+    target=FakeNodeManager('zmq_demo_server').zmq_demo_server)
+  server.start()
+  try:
+    for multiplexed in (False, True):
+      name = 'dealer' if multiplexed else 'req'
+      component = BaseComponent(multiplexed=multiplexed)
+      component.connect(FakeNodeManager.DEMO_ADDRESS)
+      run(component, 100, 1)  # warm up the connection
+      for num_threads in (1, 8):
+        latencies, elapsed = run(component, n, num_threads)
+        report('%s, %d thread(s)' % (name, num_threads), latencies,
+               elapsed)
+      latencies, elapsed = after_timeout(component, min(n, 100))
+      report('%s, after a timeout' % name, latencies, elapsed)
+      if component.transport is not None:
+        component.transport.close()
+  finally:
+    server.terminate()
+    server.join()
+
+
+if __name__ == '__main__':
+  main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
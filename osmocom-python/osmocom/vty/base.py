@@ -11,6 +11,7 @@ from contextlib import contextmanager
 import re
 import select
 import socket
+import threading
 import time
 
 from .exceptions import VTYException, VTYChainedException
@@ -21,25 +22,37 @@ class BaseVTY(object):
     BUF_SIZE = 4096 #libosmocore vty buf size
     TIMEOUT = 3.0
     SOCKET_ERRORS = (socket.error, socket.herror, socket.timeout)
+    POOL_SIZE = 2 # idle connections kept per app
 
-    def __init__(self, app_name, host='127.0.0.1', port=4242, timeout=None):
+    # (host, port, app_name) -> list of idle (socket, buffer) pairs
+    _pool = {}
+    _pool_lock = threading.Lock()
+
+    def __init__(self, app_name, host='127.0.0.1', port=4242, timeout=None,
+                 pooled=False):
         """Interface for Osmocom VTY application.
 
         `app_name` is the name that appears on the VTY shell
         and is used to determine when we have reached the end of
         a repsonse.
+
+        If `pooled` is set, closing hands the connection to a pool
+        shared by all pooled instances for the same app, and opening
+        takes one from it rather than connecting again.
         """
         self.app_name = app_name
         self.host = host
         self.port = port
+        self.pooled = pooled
 
         self.is_enable_mode = False
         self.is_configure_mode = False
         self._socket_obj = None
         self._context_depth = 0
-        self._buf = ''
+        self._buf = bytearray()
 
         self.EOM = self.EOL + self.app_name
+        self._eom = bytearray(self.EOM, 'utf-8')
 
         if timeout is not None:
             self.TIMEOUT = timeout
@@ -59,6 +72,9 @@ class BaseVTY(object):
         """Opens the socket with Osmocom VTY"""
         if self._socket_obj:
             raise VTYException('Connection already established')
+        if self.pooled and self._take_pooled():
+            return
+        self._buf = bytearray()
         try:
             self._socket_obj = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self._socket_obj.setblocking(1)
@@ -73,9 +89,74 @@ class BaseVTY(object):
         """Closes the socket with Osmocom VTY"""
         if not self._socket_obj:
             raise VTYException('Connection not open')
-        self._socket_obj.close()
+        if not (self.pooled and self._put_pooled()):
+            self._socket_obj.close()
         self._socket_obj = None
 
+    def _take_pooled(self):
+        """Takes a live idle connection from the pool, if there is one."""
+        key = (self.host, self.port, self.app_name)
+        while True:
+            with self._pool_lock:
+                idle = self._pool.get(key)
+                if not idle:
+                    return False
+                sock, buf = idle.pop()
+            # An idle VTY never sends anything, so a readable socket was
+            # closed by the other end (or is out of step with us).
+            try:
+                readable = select.select([sock], [], [], 0)[0]
+            except self.SOCKET_ERRORS:
+                readable = True
+            if not readable:
+                self._socket_obj, self._buf = sock, buf
+                return True
+            sock.close()
+
+    def _put_pooled(self):
+        """Returns the connection to the pool if it's in a clean state."""
+        if self.is_enable_mode or self.is_configure_mode:
+            return False
+        key = (self.host, self.port, self.app_name)
+        with self._pool_lock:
+            idle = self._pool.setdefault(key, [])
+            if len(idle) >= self.POOL_SIZE:
+                return False
+            idle.append((self._socket_obj, self._buf))
+        self._buf = bytearray()
+        return True
+
+    def _recv_until_eom(self, s):
+        """Reads into the buffer until it holds an EOM and returns the
+        index of the first one. Only the newly read bytes (and the tail
+        an EOM could straddle) are scanned on each read.
+        """
+        scan_from = 0
+        while True:
+            end = self._buf.find(self._eom, scan_from)
+            if end >= 0:
+                return end
+            scan_from = max(0, len(self._buf) - len(self._eom) + 1)
+            if not select.select([s], [], [], self.TIMEOUT)[0]:
+                raise VTYException("Connection stopped responding or timed out: %s", self._buf)
+            recv = s.recv(self.BUF_SIZE)
+            if not len(recv):
+                raise VTYException('Connection died during recv')
+            self._buf += recv
+
+    def _pop_response(self, s, command):
+        """Reads the response to a command that has been sent."""
+        self._recv_until_eom(s)
+        # Find the the response by seeking past the command to the next line and reading until the first EOM.
+        resp_start = (self._buf.find(bytearray(command, 'utf-8')) +
+                      len(bytearray(command + self.EOL, 'utf-8')))
+        resp_end = resp_start + self._buf[resp_start:].find(self._eom)
+        ret = self._buf[resp_start:resp_end].decode('utf-8', 'ignore').strip()
+        del self._buf[:resp_end]
+        while self._buf[:1].isspace():
+            del self._buf[:1]
+        return ret
+
     def sendrecv(self, command):
         """Sends a command to the VTY and return the response"""
         if not self._socket_obj:
@@ -83,27 +164,36 @@ class BaseVTY(object):
 
         with self._socket() as s:
             s.sendall(bytearray(command + '\r', 'utf-8'))
-            has_data = lambda : len(select.select([s], [], [], self.TIMEOUT)[0])
-            while self.EOM not in self._buf and has_data():
-                recv = bytearray(s.recv(self.BUF_SIZE)).decode('utf-8', 'ignore')
-                if not len(recv):
-                    raise VTYException('Connection died during recv')
-                self._buf += recv
-
-            if self.EOM not in self._buf:
-                raise VTYException("Connection stopped responding or timed out: %s", self._buf)
-
-        # Find the the response by seeking past the command to the next line and reading until the first EOM.
-        resp_start = self._buf.find(command) + len(command + self.EOL)
-        resp_end = resp_start + self._buf[resp_start:].find(self.EOM)
-        ret = self._buf[resp_start:resp_end].strip()
-        self._buf = self._buf[resp_end:].lstrip()
+            ret = self._pop_response(s, command)
 
         if 'Unknown command' in ret:
             raise ValueError('Invalid command: %s' % command)
 
         return ret
 
+    def pipeline(self, commands):
+        """Sends a batch of commands in a single write and returns the
+        list of their responses, read as they arrive.
+
+        All the responses are read even if a command is invalid, so the
+        connection stays usable. A batch that enters enable or configure
+        mode should also leave it, as the mode flags aren't tracked here.
+
+        Raises:
+            ValueError for the first invalid command
+        """
+        if not self._socket_obj:
+            raise VTYException('Connection not open')
+
+        with self._socket() as s:
+            s.sendall(bytearray(''.join(c + '\r' for c in commands), 'utf-8'))
+            responses = [self._pop_response(s, c) for c in commands]
+
+        for command, ret in zip(commands, responses):
+            if 'Unknown command' in ret:
+                raise ValueError('Invalid command: %s' % command)
+        return responses
+
     def running_config(self):
         """Reads and parses the running configuration into
         a heirarchical object. If the next line has an indentation
@@ -13,8 +13,9 @@ from .base import BaseVTY
 
 class BTS(BaseVTY):
 
-    def __init__(self, host='127.0.0.1', port=4242, timeout=None):
-        super(BTS, self).__init__('OpenBSC', host, port, timeout)
+    def __init__(self, host='127.0.0.1', port=4242, timeout=None,
+                 pooled=False):
+        super(BTS, self).__init__('OpenBSC', host, port, timeout, pooled)
         self.PARSE_SHOW = [
             re.compile('BTS (?P<id>\d+) is of (?P<type>[^\s]+) type in band (?P<band>[^\s]+), has CI (?P<ci>\d+) LAC (?P<lac>\d+), BSIC (?P<bsic>\d+) \(NCC=(?P<ncc>\d+), BCC=(?P<bcc>\d+)\) and (?P<trx_count>\d+)'),
             re.compile('Description: (?P<description>[^\s]+)'),
@@ -37,7 +38,10 @@ class BTS(BaseVTY):
 
     def get_load(self, bts_id):
         """Returns a dictionary of channel load"""
-        status = self.show(bts_id)
+        return self.load_from_show(self.show(bts_id))
+
+    def load_from_show(self, status):
+        """Returns a dictionary of channel load from the output of show"""
         return {
             'ccch_sdcch4_load': int(status.get('ccch_sdcch4_load', 0)),
             'ccch_sdcch4_max': int(status.get('ccch_sdcch4_max', 0)),
@@ -12,8 +12,9 @@ from .base import BaseVTY
 
 class Network(BaseVTY):
 
-    def __init__(self, host='127.0.0.1', port=4242, timeout=None):
-        super(Network, self).__init__('OpenBSC', host, port, timeout)
+    def __init__(self, host='127.0.0.1', port=4242, timeout=None,
+                 pooled=False):
+        super(Network, self).__init__('OpenBSC', host, port, timeout, pooled)
         self.PARSE_SHOW = [
             re.compile('BSC is on Country Code (?P<mcc>\d+), Network Code (?P<mnc>\d+) and has (?P<bts_count>\d+) BTS'),
             re.compile('Long network name: \'(?P<long_name>[^\s]+)\''),
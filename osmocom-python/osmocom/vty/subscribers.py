@@ -14,8 +14,9 @@ from .util import parse_imsi, format_imsi
 
 class Subscribers(BaseVTY):
 
-    def __init__(self, host='127.0.0.1', port=4242, hlr_loc='/home/vagrant/osmocom/hlr.sqlite3', timeout=None):
-        super(Subscribers, self).__init__('OpenBSC', host, port, timeout)
+    def __init__(self, host='127.0.0.1', port=4242, hlr_loc='/home/vagrant/osmocom/hlr.sqlite3', timeout=None,
+                 pooled=False):
+        super(Subscribers, self).__init__('OpenBSC', host, port, timeout, pooled)
         self.hlr_loc = hlr_loc
         self.PARSE_SHOW= [
             re.compile('ID: (?P<id>\d+), Authorized: (?P<authorized>\d+)'),
@@ -12,8 +12,9 @@ from .base import BaseVTY
 
 class TRX(BaseVTY):
 
-    def __init__(self, host='127.0.0.1', port=4242, timeout=None):
-        super(TRX, self).__init__('OpenBSC', host, port, timeout)
+    def __init__(self, host='127.0.0.1', port=4242, timeout=None,
+                 pooled=False):
+        super(TRX, self).__init__('OpenBSC', host, port, timeout, pooled)
         self.PARSE_SHOW = [
             re.compile('TRX (?P<id>\d+) of BTS (?P<bts_id>\d+) is on ARFCN (?P<arfcn>\d+)'),
             re.compile('Description: (?P<description>[^\s]+)'),
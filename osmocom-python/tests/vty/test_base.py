@@ -261,6 +261,38 @@ class NestedContextTestCase(MockSocketTestCase):
             foo()
         self.assertEqual(self.vty._context_depth, 0)
 
+class PipelineTestCase(MockSocketTestCase):
+    fixture_file = get_fixture_path('network_get.txt')
+
+    def tearDown(self):
+        osmocom.vty.base.BaseVTY._pool.clear()
+
+    def test_pipeline(self):
+        """Commands are sent in one write and responses read in order."""
+        v = osmocom.vty.base.BaseVTY('OpenBSC', pooled=True)
+        v.open()
+        self.sendall_buffer = ''
+        resps = v.pipeline(['enable', 'show network', 'disable'])
+        self.assertEqual(self.sendall_buffer,
+                         'enable\rshow network\rdisable\r\n')
+        self.assertEqual(3, len(resps))
+        self.assertEqual('', resps[0])
+        self.assertTrue(resps[1].startswith('BSC is on Country Code 901'))
+        self.assertTrue(resps[1].endswith('Last RF Lock Command:'))
+        self.assertEqual('', resps[2])
+
+        # the connection goes back to the pool and is reused as is
+        v.close()
+        connects = osmocom.vty.base.socket.socket.call_count
+        v2 = osmocom.vty.base.BaseVTY('OpenBSC', pooled=True)
+        v2.open()
+        self.assertEqual(connects, osmocom.vty.base.socket.socket.call_count)
+        self.assertTrue(v2._socket_obj is self.mock_socket)
+        self.assertEqual(self.sendall_buffer,
+                         'enable\rshow network\rdisable\r\n')
+        v2.close()
+
+
 class FailedConnectionTestCase(unittest.TestCase):
     """We defined a VTY connection to be in the closed state when self._socket_obj
     is set to None. Therefore, in the case of a socket that has failed, we